@@ -0,0 +1,169 @@
+# adaptive_concurrency.py
+# 按 "端点:模型" 自适应调整同时进行的 DashScope 请求数（AIMD：加性增、乘性减）：
+# - 请求成功且并发已用满时，上限每个请求增加 1/上限，大约每一轮请求加 1；
+# - 遇到限流错误，或近期延迟明显高于长期平均延迟时，上限乘以 DECREASE_FACTOR。
+# rate_limiter 控制每分钟的请求数和令牌数，这里控制同时在途的请求数，两者一起决定实际吞吐。
+
+import os
+import json
+import time
+import asyncio
+import threading
+from typing import Any, Dict, Optional, Tuple
+
+from resilience import classify_response, ERROR_THROTTLING
+
+# --- 默认并发配置 ---
+# 键的规则与 rate_limiter 相同："端点:模型"，"端点:*" 为默认值。可通过环境变量 DASHSCOPE_CONCURRENCY_LIMITS（JSON）覆盖。
+# initial: 初始上限；min / max: 上限的调整范围。
+DEFAULT_CONCURRENCY_LIMITS = {
+    "generation:*": {"initial": 4, "min": 1, "max": 32},
+    "generation:qwen-max": {"initial": 2, "min": 1, "max": 8},
+    "image_synthesis:*": {"initial": 2, "min": 1, "max": 16},
+}
+
+DECREASE_FACTOR = 0.7
+LATENCY_TOLERANCE = 2.0 # 短期平均延迟超过长期平均延迟的这个倍数时视为过载
+MIN_LATENCY_SAMPLES = 10 # 积累足够的样本后才根据延迟降低上限
+_SHORT_EWMA_ALPHA = 0.3
+_LONG_EWMA_ALPHA = 0.05
+
+# --- 单个端点/模型的自适应并发上限 ---
+class AdaptiveLimit:
+    def __init__(self, name: str, initial: int, min_limit: int, max_limit: int):
+        self.name = name
+        self.min_limit = max(1, int(min_limit))
+        self.max_limit = max(self.min_limit, int(max_limit))
+        self.in_flight = 0
+        self.decreases = 0
+        self._limit = float(min(self.max_limit, max(self.min_limit, initial)))
+        self._short_latency: Optional[float] = None
+        self._long_latency: Optional[float] = None
+        self._latency_samples = 0
+        self._last_decrease = 0.0
+        self._condition = threading.Condition()
+
+    @property
+    def limit(self) -> int:
+        return int(self._limit)
+
+    def try_acquire(self) -> bool:
+        with self._condition:
+            if self.in_flight < self.limit:
+                self.in_flight += 1
+                return True
+            return False
+
+    def acquire(self) -> float:
+        """阻塞直到有空闲的并发名额，返回等待的秒数。"""
+        start = time.monotonic()
+        with self._condition:
+            while self.in_flight >= self.limit:
+                self._condition.wait()
+            self.in_flight += 1
+        return time.monotonic() - start
+
+    async def acquire_async(self) -> float:
+        """acquire 的 asyncio 版本：名额由多个线程和事件循环共享，这里轮询而不是阻塞事件循环。"""
+        start = time.monotonic()
+        delay = 0.01
+        while not self.try_acquire():
+            await asyncio.sleep(delay)
+            delay = min(0.2, delay * 2)
+        return time.monotonic() - start
+
+    def release(self, latency: Optional[float] = None, throttled: bool = False):
+        """
+        Args:
+            latency (Optional[float]): 请求耗时（秒）；请求以异常结束时传 None，不参与调整。
+            throttled (bool): 是否收到了限流错误。
+        """
+        with self._condition:
+            saturated = self.in_flight >= self.limit
+            self.in_flight -= 1
+            if throttled:
+                self._decrease_locked("收到限流错误")
+            elif latency is not None:
+                self._observe_latency_locked(latency, saturated)
+            self._condition.notify_all()
+
+    def release_for_response(self, response: Any, latency: float):
+        self.release(latency, throttled=classify_response(response) == ERROR_THROTTLING)
+
+    def _observe_latency_locked(self, latency: float, saturated: bool):
+        if self._short_latency is None:
+            self._short_latency = self._long_latency = latency
+        else:
+            self._short_latency += _SHORT_EWMA_ALPHA * (latency - self._short_latency)
+            self._long_latency += _LONG_EWMA_ALPHA * (latency - self._long_latency)
+        self._latency_samples += 1
+        if self._latency_samples >= MIN_LATENCY_SAMPLES and self._short_latency > LATENCY_TOLERANCE * self._long_latency:
+            self._decrease_locked(f"延迟升高到 {self._short_latency:.1f} 秒（平均 {self._long_latency:.1f} 秒）")
+        elif saturated and self._limit < self.max_limit:
+            # 只有名额真的被用满时才增加，避免空闲时上限无限增长
+            previous = self.limit
+            self._limit = min(float(self.max_limit), self._limit + 1 / self._limit)
+            if self.limit != previous:
+                print(f"--- 日志: 接口 {self.name} 并发上限提高到 {self.limit}。---")
+
+    def _decrease_locked(self, reason: str):
+        now = time.monotonic()
+        # 同一波过载会让多个在途请求先后报告，冷却期内只降低一次
+        if now - self._last_decrease < max(1.0, self._short_latency or 0.0):
+            return
+        self._last_decrease = now
+        self.decreases += 1
+        self._limit = max(float(self.min_limit), self._limit * DECREASE_FACTOR)
+        print(f"--- 日志: ⚠️ 接口 {self.name} {reason}，并发上限降低到 {self.limit}。---")
+
+# --- 进程级注册表 ---
+class AdaptiveConcurrencyRegistry:
+    """按 "端点:模型" 懒加载并缓存 AdaptiveLimit。"""
+    def __init__(self, limits: Optional[Dict[str, dict]] = None):
+        self._limits = dict(limits or DEFAULT_CONCURRENCY_LIMITS)
+        self._adaptive_limits: Dict[str, AdaptiveLimit] = {}
+        self._lock = threading.Lock()
+
+    def _resolve_config(self, endpoint: str, model: str) -> Tuple[str, dict]:
+        key = f"{endpoint}:{model}"
+        if key in self._limits:
+            return key, self._limits[key]
+        return key, self._limits.get(f"{endpoint}:*", {"initial": 2, "min": 1, "max": 8})
+
+    def get(self, endpoint: str, model: str) -> AdaptiveLimit:
+        with self._lock:
+            key, config = self._resolve_config(endpoint, model)
+            adaptive_limit = self._adaptive_limits.get(key)
+            if adaptive_limit is None:
+                adaptive_limit = AdaptiveLimit(key, config["initial"], config["min"], config["max"])
+                self._adaptive_limits[key] = adaptive_limit
+            return adaptive_limit
+
+    def snapshot(self) -> Dict[str, Dict[str, int]]:
+        """当前每个端点/模型的并发上限和在途请求数。"""
+        with self._lock:
+            adaptive_limits = list(self._adaptive_limits.values())
+        return {
+            adaptive_limit.name: {"limit": adaptive_limit.limit, "in_flight": adaptive_limit.in_flight, "decreases": adaptive_limit.decreases}
+            for adaptive_limit in adaptive_limits
+        }
+
+    def describe(self) -> str:
+        """用于状态显示的简短说明，例如 "generation:qwen-plus 6/8、image_synthesis:wanx-v1 2/3"（在途/上限）。"""
+        return "、".join(f"{name} {state['in_flight']}/{state['limit']}" for name, state in self.snapshot().items())
+
+def _load_limits_from_env() -> Dict[str, dict]:
+    limits = dict(DEFAULT_CONCURRENCY_LIMITS)
+    raw = os.environ.get("DASHSCOPE_CONCURRENCY_LIMITS")
+    if raw:
+        try:
+            limits.update(json.loads(raw))
+        except ValueError as e:
+            print(f"--- 日志: ⚠️ 环境变量 DASHSCOPE_CONCURRENCY_LIMITS 解析失败，使用默认并发配置。{e} ---")
+    return limits
+
+_registry = AdaptiveConcurrencyRegistry(_load_limits_from_env())
+
+def get_concurrency_limiter() -> AdaptiveConcurrencyRegistry:
+    """获取进程内共享的自适应并发注册表。"""
+    return _registry
@@ -6,7 +6,10 @@ import dashscope
 from http import HTTPStatus
 import datetime
 import re
-from typing import List
+from typing import Iterator, List
+
+from dashscope_client import call_generation, call_generation_async, call_generation_stream
+from pipeline_metrics import instrument_stage, text_size, STAGE_ARTICLE_TEXT
 
 # --- 全局配置 ---
 # 注意：API Key 在 streamlit_app.py 中统一设置，这里无需重复设置
@@ -16,40 +19,11 @@ if not os.path.exists(SAVE_PATH):
 
 AI_IMAGE_INTENT_MARKER = "<IMAGE>" # 定义一个标记，用于在文章中指示需要插入图片的位置
 
-# --- 函数：使用 LLM 生成文章内容 ---
-def generate_article_content(
-    topic: str,
-    audience: str,
-    style: str,
-    length: str,
-    keywords: List[str],
-    extra_requirements: str,
-    model: str, 
-    save_to_file: bool = True,
-    status_callback=None
-) -> str:
+# --- 辅助函数：构造文章生成的对话消息 ---
+def _build_article_messages(topic: str, audience: str, style: str, length: str, keywords: List[str], extra_requirements: str) -> List[dict]:
     """
-    根据给定参数，调用LLM生成一篇详细的文章。
-    LLM会被深度引导扮演一个特定角色，并在适当位置插入AI_IMAGE_INTENT_MARKER。
-    
-    Args:
-        topic (str): 文章主题。
-        audience (str): 目标读者。
-        style (str): 写作风格。
-        length (str): 文章长度。
-        keywords (List[str]): 包含在文章中的关键词列表。
-        extra_requirements (str): 用户的额外写作要求。
-        model (str): 用于生成内容的LLM模型名称。
-        save_to_file (bool): 是否将生成的文章内容保存到文件中。
-        status_callback (streamlit.status): 用于在Streamlit UI中更新状态。
-        
-    Returns:
-        str: 生成的文章内容，如果失败则返回空字符串。
+    构造人格化的系统提示词和用户提示词，同步和异步版本共用。
     """
-    print(f"--- 日志: 调用 generate_article_content 函数，主题: '{topic}'，模型: '{model}' ---")
-    if status_callback:
-        status_callback.update(label=f"✍️ 正在为 '{topic}' 生成文章内容...", state="running")
-
     # 系统提示词：这是最核心的部分，通过深度人格化提示词，让模型模仿人类作家的风格
     system_prompt = f"""
     # 角色设定：你现在不是AI，你是一个名叫“李雷”的专栏作家。
@@ -85,9 +59,82 @@ def generate_article_content(
         {'role': 'system', 'content': system_prompt},
         {'role': 'user', 'content': user_prompt}
     ]
+    return messages
+
+# --- 辅助函数：保存文章内容到文件 ---
+def _save_article_to_file(topic: str, article_content: str, status_callback=None):
+    # 生成安全的文件名并保存文章
+    safe_topic_name = re.sub(r'[\\/:*?"<>|]', '_', topic)
+    timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+    filename = os.path.join(SAVE_PATH, f"{safe_topic_name}_{timestamp}.txt")
+    with open(filename, "w", encoding="utf-8") as f:
+        f.write(article_content)
+    if status_callback:
+        status_callback.update(label=f"📝 文章内容已生成并保存到文件。", state="running")
+
+# --- 辅助函数：处理文章生成的响应 ---
+def _handle_article_response(response, topic: str, save_to_file: bool, status_callback=None) -> str:
+    """
+    解析 Generation 的响应，按需保存文章到文件，返回文章内容；失败时返回空字符串。
+    """
+    if response.status_code == HTTPStatus.OK:
+        article_content = response.output.choices[0].message.content.strip()
+        
+        if save_to_file:
+            _save_article_to_file(topic, article_content, status_callback=status_callback)
+        
+        print(f"--- 日志: 文章内容生成成功。---")
+        return article_content
+    else:
+        # 处理API调用失败的情况
+        error_msg = (
+            f"❌ 文章内容生成失败。状态码: {response.status_code}, "
+            f"错误码: {response.code}, 消息: {response.message}"
+        )
+        if status_callback:
+            status_callback.update(label=error_msg, state="error")
+        print(f"--- 日志: ❌ 文章内容生成失败。{error_msg} ---")
+        return ""
+
+# --- 函数：使用 LLM 生成文章内容 ---
+@instrument_stage(STAGE_ARTICLE_TEXT, size=text_size)
+def generate_article_content(
+    topic: str,
+    audience: str,
+    style: str,
+    length: str,
+    keywords: List[str],
+    extra_requirements: str,
+    model: str, 
+    save_to_file: bool = True,
+    status_callback=None
+) -> str:
+    """
+    根据给定参数，调用LLM生成一篇详细的文章。
+    LLM会被深度引导扮演一个特定角色，并在适当位置插入AI_IMAGE_INTENT_MARKER。
+    
+    Args:
+        topic (str): 文章主题。
+        audience (str): 目标读者。
+        style (str): 写作风格。
+        length (str): 文章长度。
+        keywords (List[str]): 包含在文章中的关键词列表。
+        extra_requirements (str): 用户的额外写作要求。
+        model (str): 用于生成内容的LLM模型名称。
+        save_to_file (bool): 是否将生成的文章内容保存到文件中。
+        status_callback (streamlit.status): 用于在Streamlit UI中更新状态。
+        
+    Returns:
+        str: 生成的文章内容，如果失败则返回空字符串。
+    """
+    print(f"--- 日志: 调用 generate_article_content 函数，主题: '{topic}'，模型: '{model}' ---")
+    if status_callback:
+        status_callback.update(label=f"✍️ 正在为 '{topic}' 生成文章内容...", state="running")
+
+    messages = _build_article_messages(topic, audience, style, length, keywords, extra_requirements)
 
     try:
-        response = dashscope.Generation.call(
+        response = call_generation(
             model=model,
             messages=messages,
             result_format='message',
@@ -95,36 +142,108 @@ def generate_article_content(
             top_p=0.9,
             seed=int(datetime.datetime.now().timestamp()) # 使用时间戳作为种子，确保每次结果略有不同
         )
+        return _handle_article_response(response, topic, save_to_file, status_callback=status_callback)
+    except Exception as e:
+        # 处理调用过程中的异常
+        error_msg = f"❌ 调用 LLM 生成文章内容时出错: {e}"
+        if status_callback:
+            status_callback.update(label=error_msg, state="error")
+        print(f"--- 日志: ❌ 文章内容生成异常。{error_msg} ---")
+        return ""
 
-        if response.status_code == HTTPStatus.OK:
-            article_content = response.output.choices[0].message.content.strip()
-            
-            if save_to_file:
-                # 生成安全的文件名并保存文章
-                safe_topic_name = re.sub(r'[\\/:*?"<>|]', '_', topic)
-                timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-                filename = os.path.join(SAVE_PATH, f"{safe_topic_name}_{timestamp}.txt")
-                with open(filename, "w", encoding="utf-8") as f:
-                    f.write(article_content)
-                if status_callback:
-                    status_callback.update(label=f"📝 文章内容已生成并保存到文件。", state="running")
-            
-            print(f"--- 日志: 文章内容生成成功。---")
-            return article_content
-        else:
-            # 处理API调用失败的情况
+# --- 函数：以流式方式生成文章内容 ---
+@instrument_stage(STAGE_ARTICLE_TEXT)
+def stream_article_content(
+    topic: str,
+    audience: str,
+    style: str,
+    length: str,
+    keywords: List[str],
+    extra_requirements: str,
+    model: str, 
+    save_to_file: bool = True,
+    status_callback=None
+) -> Iterator[str]:
+    """
+    与 generate_article_content 参数相同，但使用增量输出逐段产出文章文本，
+    调用方可以在全文生成完之前就开始处理已经到达的内容（例如为 <IMAGE> 标记前的段落配图）。
+    流结束后按需把完整文章保存到文件。
+    
+    Yields:
+        str: 新到达的文本片段。
+        
+    Raises:
+        RuntimeError: 任一分片返回失败状态码时抛出，调用方应把已产出的内容视为不完整。
+    """
+    print(f"--- 日志: 调用 stream_article_content 函数，主题: '{topic}'，模型: '{model}' ---")
+    if status_callback:
+        status_callback.update(label=f"✍️ 正在为 '{topic}' 流式生成文章内容...", state="running")
+
+    messages = _build_article_messages(topic, audience, style, length, keywords, extra_requirements)
+    received_parts = []
+    for chunk in call_generation_stream(
+        model=model,
+        messages=messages,
+        result_format='message',
+        incremental_output=True, # 每个分片只包含新增的文本
+        temperature=0.9,
+        top_p=0.9,
+        seed=int(datetime.datetime.now().timestamp())
+    ):
+        if chunk.status_code != HTTPStatus.OK:
             error_msg = (
-                f"❌ 文章内容生成失败。状态码: {response.status_code}, "
-                f"错误码: {response.code}, 消息: {response.message}"
+                f"❌ 文章内容生成失败。状态码: {chunk.status_code}, "
+                f"错误码: {chunk.code}, 消息: {chunk.message}"
             )
             if status_callback:
                 status_callback.update(label=error_msg, state="error")
-            print(f"--- 日志: ❌ 文章内容生成失败。{error_msg} ---")
-            return ""
+            print(f"--- 日志: ❌ 文章内容流式生成失败。{error_msg} ---")
+            raise RuntimeError(error_msg)
+        delta = chunk.output.choices[0].message.content
+        if delta:
+            received_parts.append(delta)
+            yield delta
+
+    article_content = "".join(received_parts).strip()
+    if save_to_file and article_content:
+        _save_article_to_file(topic, article_content, status_callback=status_callback)
+    print(f"--- 日志: 文章内容流式生成完成，共 {len(article_content)} 字。---")
+
+# --- 函数：generate_article_content 的 asyncio 版本 ---
+@instrument_stage(STAGE_ARTICLE_TEXT, size=text_size)
+async def generate_article_content_async(
+    topic: str,
+    audience: str,
+    style: str,
+    length: str,
+    keywords: List[str],
+    extra_requirements: str,
+    model: str, 
+    save_to_file: bool = True,
+    status_callback=None
+) -> str:
+    """
+    与 generate_article_content 参数和返回值完全相同，但以协程方式等待 LLM 响应，不占用线程。
+    """
+    print(f"--- 日志: 调用 generate_article_content_async 函数，主题: '{topic}'，模型: '{model}' ---")
+    if status_callback:
+        status_callback.update(label=f"✍️ 正在为 '{topic}' 生成文章内容...", state="running")
+
+    messages = _build_article_messages(topic, audience, style, length, keywords, extra_requirements)
+
+    try:
+        response = await call_generation_async(
+            model=model,
+            messages=messages,
+            result_format='message',
+            temperature=0.9,
+            top_p=0.9,
+            seed=int(datetime.datetime.now().timestamp())
+        )
+        return _handle_article_response(response, topic, save_to_file, status_callback=status_callback)
     except Exception as e:
-        # 处理调用过程中的异常
         error_msg = f"❌ 调用 LLM 生成文章内容时出错: {e}"
         if status_callback:
             status_callback.update(label=error_msg, state="error")
         print(f"--- 日志: ❌ 文章内容生成异常。{error_msg} ---")
-        return ""
\ No newline at end of file
+        return ""
@@ -6,17 +6,41 @@ from http import HTTPStatus
 import re
 import datetime
 import time 
-import json 
-from typing import List, Dict, Any
-import markdown
+import math
+import queue
+import asyncio
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import List, Dict, Any, Iterator, Optional, Tuple
 
 # 从现有模块导入功能
-from article_writer import generate_article_content
-from wanxiangimg import process_article_and_generate_images, generate_image_from_prompt
+from article_writer import generate_article_content, generate_article_content_async, stream_article_content
+from dashscope_client import call_generation, call_generation_async
+from batch_journal import BatchJournal, new_job_id, STAGE_CONTENT, STAGE_IMAGES, STAGE_HTML
+from image_cache import get_image_cache
+from prompt_cache import get_prompt_cache
+from download_pool import get_download_pool
+from resilience import get_resilience
+from adaptive_concurrency import get_concurrency_limiter
+from hedged_requests import hedging_stats
+from usage_accounting import UsageMeter, BatchBudget, estimate_article_cost, usage_scope, submit_in_context, write_usage_report
+from pipeline_metrics import BatchMetrics, metrics_scope, instrument_stage, file_size, STAGE_TITLES, STAGE_RENDER, STAGE_WRITE
+from title_dedup import TitleDeduplicator, TitleIndex, get_title_index
+from results_store import results_filename, write_results, load_results
+from html_generator import markdown_to_html, write_html_parts
+from wanxiangimg import process_article_and_generate_images, process_streamed_article_and_generate_images, generate_image_from_prompt
+from wanxiangimg import process_article_and_generate_images_async, aiohttp, image_element_src
 
 # --- 全局配置 ---
 # 注意：API Key 在 streamlit_app.py 中统一设置，这里无需重复设置
 LLM_MODEL_FOR_TITLE_GENERATION = "qwen-turbo" # 指定用于生成标题的模型
+TITLE_CHUNK_SIZE = 20 # 每个请求生成的标题数量；一次要太多时模型容易少写、写长或互相重复
+TITLE_GENERATION_WORKERS = 4 # 同时进行的标题请求数
+TITLE_MAX_ROUNDS = 5 # 去重后数量不足时的最大请求轮数（含第一轮）
+TITLE_OVERSAMPLE = 1.3 # 第一轮多请求的比例，抵消被去重的部分
+TITLE_MIN_ACCEPT_RATE = 0.2 # 估计可用率的下限，避免补充请求的数量失控
+TITLE_AVOID_SAMPLE = 30 # 补充请求时在提示词中列出的已有标题数量上限
+MAX_TITLE_LENGTH = 40 # 超过这个字数的标题直接丢弃
+_TITLE_PREFIX_PATTERN = re.compile(r'^(?:[-*•]\s*|\d{1,3}\s*[.、)）:：](?!\d)\s*|[（(]\d{1,3}[)）]\s*)')
 
 OUTPUT_SAVE_PATH = "generated_output"
 # 确保输出目录存在
@@ -24,23 +48,8 @@ if not os.path.exists(OUTPUT_SAVE_PATH):
     os.makedirs(OUTPUT_SAVE_PATH)
 
 
-# --- 函数：使用 LLM 生成文章标题列表 ---
-def generate_article_titles(main_topic: str, num_titles: int, status_callback=None) -> List[str]:
-    """
-    根据主课题，调用LLM生成指定数量的文章标题。
-    
-    Args:
-        main_topic (str): 主课题。
-        num_titles (int): 需要生成的标题数量。
-        status_callback (streamlit.status): 用于在Streamlit UI中更新状态。
-        
-    Returns:
-        List[str]: 生成的文章标题列表，如果失败则返回空列表。
-    """
-    print(f"\n--- 日志: 开始为主题 '{main_topic}' 生成文章标题 ({num_titles} 个) ---")
-    if status_callback:
-        status_callback.update(label=f"🔄 正在调用 LLM 生成 {num_titles} 个文章标题...", state="running")
-
+# --- 辅助函数：构造标题生成的对话消息 ---
+def _build_title_messages(main_topic: str, num_titles: int, avoid_titles: Optional[List[str]] = None) -> List[dict]:
     # 系统提示词：定义LLM的角色和写作风格
     system_prompt = ("你是一个顶级的创意标题生成器，擅长为给定主题生成多个新颖、吸引人且**具有强烈人类写作风格**的文章标题。你的目标是让读者一眼就被吸引，感觉是真实的人在思考和表达。")
     # 用户提示词：包含具体任务和要求
@@ -60,38 +69,209 @@ def generate_article_titles(main_topic: str, num_titles: int, status_callback=No
     - “你家的智能门锁，真的比你更懂安全吗？”
     请严格按照示例的风格和要求生成：
     """
-    messages = [{'role': 'system', 'content': system_prompt}, {'role': 'user', 'content': user_prompt}]
+    if avoid_titles:
+        # 补充生成时列出已有的标题，让模型换一些切入点
+        user_prompt += "\n以下标题已经有了，请不要生成与它们相同或相似的标题：\n" + "\n".join(avoid_titles)
+    return [{'role': 'system', 'content': system_prompt}, {'role': 'user', 'content': user_prompt}]
+
+# --- 辅助函数：处理标题生成的响应 ---
+def _handle_title_response(response, status_callback=None) -> List[str]:
+    if response.status_code == HTTPStatus.OK:
+        titles_raw = response.output.choices[0].message.content.strip()
+        titles_list = [t.strip() for t in titles_raw.split('\n') if t.strip()]
+        if status_callback:
+            status_callback.update(label="✅ 文章标题生成成功！", state="running")
+        print(f"--- 日志: 标题请求返回 {len(titles_list)} 行。---")
+        return titles_list
+    else:
+        error_msg = f"❌ 标题生成失败。状态码: {response.status_code}, 错误码: {response.code}, 消息: {response.message}"
+        if status_callback:
+            status_callback.update(label=error_msg, state="error")
+        print(f"--- 日志: 标题生成失败。{error_msg} ---")
+        return []
+
+# --- 辅助函数：清洗模型返回的一行标题 ---
+def _clean_title_line(line: str) -> str:
+    # 去掉模型偶尔加上的序号、项目符号和成对的引号
+    title = _TITLE_PREFIX_PATTERN.sub('', line).strip()
+    if len(title) >= 2 and title[0] in '"“「' and title[-1] in '"”」':
+        title = title[1:-1].strip()
+    return title
+
+class _TitleCollector:
+    """
+    汇总多轮、多个分块请求返回的标题：清洗、丢弃过长的标题并做近似去重，直到凑够 num_titles 个。
+    传入 title_index 时还会丢弃与该主课题历史标题相似的标题；标题在对应文章生成成功后才记入历史（见 _record_title_history）。
+    同步和异步版本的标题生成共用。
+    """
+    def __init__(self, num_titles: int, main_topic: str = "", title_index: Optional[TitleIndex] = None):
+        self.num_titles = num_titles
+        self.main_topic = main_topic
+        self.titles: List[str] = []
+        self.too_long = 0
+        self.seen_before = 0 # 与历史标题相似而被丢弃的数量
+        self.received = 0 # 模型返回的候选标题总数，用于估计可用率
+        self._dedup = TitleDeduplicator()
+        self._title_index = title_index
+        self._history_hits: List[str] = [] # 被撞上的历史标题，补充请求时让模型避开
+
+    @property
+    def remaining(self) -> int:
+        return self.num_titles - len(self.titles)
+
+    @property
+    def duplicates(self) -> int:
+        return self._dedup.rejected
+
+    def plan_round(self) -> List[int]:
+        """
+        返回本轮每个分块请求的标题数量。预计有一部分会被去重，因此按目前观察到的可用率多请求一些
+        （第一轮按 TITLE_OVERSAMPLE 估计），可用率很低时也最多请求缺口的 1/TITLE_MIN_ACCEPT_RATE 倍。
+        """
+        accept_rate = len(self.titles) / self.received if self.received else 1 / TITLE_OVERSAMPLE
+        wanted = math.ceil(self.remaining / max(accept_rate, TITLE_MIN_ACCEPT_RATE))
+        chunk_count = math.ceil(wanted / TITLE_CHUNK_SIZE)
+        return [math.ceil(wanted / chunk_count)] * chunk_count
 
+    def avoid_titles(self) -> List[str]:
+        return (self._history_hits + self.titles)[-TITLE_AVOID_SAMPLE:]
+
+    def accept(self, raw_titles: List[str]):
+        for raw_title in raw_titles:
+            if self.remaining <= 0:
+                return
+            self.received += 1
+            title = _clean_title_line(raw_title)
+            if not title:
+                continue
+            if len(title) > MAX_TITLE_LENGTH:
+                self.too_long += 1
+                continue
+            if self._title_index is not None:
+                history_title = self._title_index.find_similar(self.main_topic, title)
+                if history_title is not None:
+                    self.seen_before += 1
+                    if history_title not in self._history_hits:
+                        self._history_hits.append(history_title)
+                    continue
+            if self._dedup.add(title):
+                self.titles.append(title)
+
+    def finish(self, status_callback=None) -> List[str]:
+        print(f"--- 日志: 标题生成结束：{len(self.titles)}/{self.num_titles} 个，"
+              f"丢弃近似重复 {self.duplicates} 个、与历史标题相似 {self.seen_before} 个、过长 {self.too_long} 个。---")
+        if not self.titles:
+            if status_callback:
+                status_callback.update(label="❌ 标题生成失败，未得到任何可用标题。", state="error")
+            return []
+        if self.remaining > 0:
+            print(f"--- 日志: ⚠️ 补充请求 {TITLE_MAX_ROUNDS} 轮后仍缺少 {self.remaining} 个不重复的标题。---")
+        if status_callback:
+            status_callback.update(label=f"✅ 文章标题生成成功！共 {len(self.titles)} 个。", state="running")
+        print(f"生成的标题列表: {self.titles}")
+        return self.titles
+
+# --- 辅助函数：请求一个分块的标题 ---
+def _request_title_chunk(main_topic: str, chunk_size: int, avoid_titles: List[str]) -> List[str]:
     try:
-        # 调用 DashScope 的文本生成服务
-        response = dashscope.Generation.call(
+        response = call_generation(
             model=LLM_MODEL_FOR_TITLE_GENERATION, 
-            messages=messages, 
+            messages=_build_title_messages(main_topic, chunk_size, avoid_titles), 
             result_format='message', 
             temperature=1.0, 
             top_p=0.9
         )
-        if response.status_code == HTTPStatus.OK:
-            titles_raw = response.output.choices[0].message.content.strip()
-            titles_list = [t.strip() for t in titles_raw.split('\n') if t.strip()]
-            if status_callback:
-                status_callback.update(label="✅ 文章标题生成成功！", state="running")
-            print(f"--- 日志: 标题生成成功。共生成 {len(titles_list)} 个标题。---")
-            print(f"生成的标题列表: {titles_list}")
-            return titles_list
-        else:
-            error_msg = f"❌ 标题生成失败。状态码: {response.status_code}, 错误码: {response.code}, 消息: {response.message}"
-            if status_callback:
-                status_callback.update(label=error_msg, state="error")
-            print(f"--- 日志: 标题生成失败。{error_msg} ---")
-            return []
+        return _handle_title_response(response)
     except Exception as e:
-        error_msg = f"❌ 调用 LLM 生成标题时出错: {e}"
+        print(f"--- 日志: 标题生成异常。❌ 调用 LLM 生成标题时出错: {e} ---")
+        return []
+
+# --- 函数：使用 LLM 生成文章标题列表 ---
+@instrument_stage(STAGE_TITLES)
+def generate_article_titles(main_topic: str, num_titles: int, status_callback=None, use_title_history: bool = True) -> List[str]:
+    """
+    根据主课题，调用LLM生成指定数量的文章标题。
+    标题按每块 TITLE_CHUNK_SIZE 个拆成多个请求并行生成，丢弃过长和近似重复的标题，
+    数量不足时继续补充请求（最多 TITLE_MAX_ROUNDS 轮），直到恰好得到 num_titles 个不重复的标题。
+    
+    Args:
+        main_topic (str): 主课题。
+        num_titles (int): 需要生成的标题数量。
+        status_callback (streamlit.status): 用于在Streamlit UI中更新状态。
+        use_title_history (bool): 是否丢弃该主课题以前生成过的相似标题（见 title_dedup.TitleIndex）。
+        
+    Returns:
+        List[str]: 生成的文章标题列表（补充请求用尽时可能少于 num_titles 个），如果失败则返回空列表。
+    """
+    print(f"\n--- 日志: 开始为主题 '{main_topic}' 生成文章标题 ({num_titles} 个) ---")
+    collector = _TitleCollector(num_titles, main_topic, get_title_index() if use_title_history else None)
+    for round_index in range(TITLE_MAX_ROUNDS):
+        chunk_sizes = collector.plan_round()
         if status_callback:
-            status_callback.update(label=error_msg, state="error")
-        print(f"--- 日志: 标题生成异常。{error_msg} ---")
+            status_callback.update(label=f"🔄 正在调用 LLM 生成文章标题（第 {round_index + 1} 轮，已有 {len(collector.titles)}/{num_titles} 个）...", state="running")
+        avoid_titles = collector.avoid_titles()
+        with ThreadPoolExecutor(max_workers=min(TITLE_GENERATION_WORKERS, len(chunk_sizes)), thread_name_prefix="title") as executor:
+            chunk_futures = [submit_in_context(executor, _request_title_chunk, main_topic, chunk_size, avoid_titles) for chunk_size in chunk_sizes]
+            chunk_results = [future.result() for future in chunk_futures]
+        for chunk_titles in chunk_results:
+            collector.accept(chunk_titles)
+        if collector.remaining <= 0 or not any(chunk_results):
+            # 凑够了，或者本轮所有请求都失败（继续补充也无济于事）
+            break
+    return collector.finish(status_callback)
+
+# --- 辅助函数：_request_title_chunk 的 asyncio 版本 ---
+async def _request_title_chunk_async(main_topic: str, chunk_size: int, avoid_titles: List[str]) -> List[str]:
+    try:
+        response = await call_generation_async(
+            model=LLM_MODEL_FOR_TITLE_GENERATION,
+            messages=_build_title_messages(main_topic, chunk_size, avoid_titles),
+            result_format='message',
+            temperature=1.0,
+            top_p=0.9
+        )
+        return _handle_title_response(response)
+    except Exception as e:
+        print(f"--- 日志: 标题生成异常。❌ 调用 LLM 生成标题时出错: {e} ---")
         return []
 
+# --- 函数：generate_article_titles 的 asyncio 版本 ---
+@instrument_stage(STAGE_TITLES)
+async def generate_article_titles_async(main_topic: str, num_titles: int, status_callback=None, use_title_history: bool = True) -> List[str]:
+    """
+    与 generate_article_titles 相同，但以协程方式并发等待各分块的 LLM 响应。
+    """
+    print(f"\n--- 日志: 开始为主题 '{main_topic}' 生成文章标题 ({num_titles} 个, async) ---")
+    collector = _TitleCollector(num_titles, main_topic, get_title_index() if use_title_history else None)
+    for round_index in range(TITLE_MAX_ROUNDS):
+        chunk_sizes = collector.plan_round()
+        if status_callback:
+            status_callback.update(label=f"🔄 正在调用 LLM 生成文章标题（第 {round_index + 1} 轮，已有 {len(collector.titles)}/{num_titles} 个）...", state="running")
+        avoid_titles = collector.avoid_titles()
+        chunk_results = await asyncio.gather(*[
+            _request_title_chunk_async(main_topic, chunk_size, avoid_titles) for chunk_size in chunk_sizes
+        ])
+        for chunk_titles in chunk_results:
+            collector.accept(chunk_titles)
+        if collector.remaining <= 0 or not any(chunk_results):
+            break
+    return collector.finish(status_callback)
+
+# --- 辅助函数：逐个产出文章页面的 HTML 片段 ---
+def _iter_html_parts(title: str, processed_data: List[Dict[str, Any]]) -> Iterator[str]:
+    yield f"<h1>{title}</h1>\n\n"
+    for item in processed_data:
+        if item['type'] == 'paragraph':
+            # 将Markdown格式的段落内容转换为HTML
+            yield markdown_to_html(item['content'])
+        elif item['type'] == 'image' and image_element_src(item):
+            # 如果是图片，inline 模式嵌入Base64数据，external 模式引用图片文件（延迟加载）
+            alt_text = item.get('content', "AI生成的图片")
+            lazy_attr = ' loading="lazy"' if item.get('image_path') else ""
+            yield '<img src="'
+            yield image_element_src(item)
+            yield f'" alt="{alt_text}"{lazy_attr} style="max-width: 100%; height: auto; display: block; margin: 2em auto; border-radius: 8px; box-shadow: 0 4px 8px rgba(0,0,0,0.1);"/>\n\n'
+
 # --- 函数：将处理后的JSON数据转换为HTML页面 ---
 def convert_json_to_markdown_to_html(
     title: str,
@@ -112,150 +292,731 @@ def convert_json_to_markdown_to_html(
     if status_callback:
         status_callback.update(label="📜 正在将JSON数据转换为Markdown并生成HTML...", state="running")
     
-    html_content = f"<h1>{title}</h1>\n\n"
-    for item in processed_data:
-        if item['type'] == 'paragraph':
-            # 将Markdown格式的段落内容转换为HTML
-            paragraph_html = markdown.markdown(item['content'])
-            html_content += paragraph_html
-        elif item['type'] == 'image' and item.get('base64_image_data'):
-            # 如果是图片，则使用Base64数据嵌入到HTML中
-            alt_text = item.get('content', "AI生成的图片")
-            html_content += f'<img src="{item["base64_image_data"]}" alt="{alt_text}" style="max-width: 100%; height: auto; display: block; margin: 2em auto; border-radius: 8px; box-shadow: 0 4px 8px rgba(0,0,0,0.1);"/>\n\n'
-
-    # 构造输出文件的完整路径
+    # 构造输出文件的完整路径，并把各部分依次写入文件（不拼接成一个大字符串）
     output_filepath = os.path.join(OUTPUT_SAVE_PATH, output_filename)
-    # 将生成的HTML内容写入文件
-    with open(output_filepath, "w", encoding="utf-8") as f:
-        f.write(html_content)
+    write_html_parts(output_filepath, _iter_html_parts(title, processed_data))
 
     if status_callback:
         status_callback.update(label=f"✅ HTML内容已生成到 {output_filepath}", state="running")
     print(f"--- 日志: HTML内容已生成到 {output_filepath} ---")
 
+# --- 辅助函数：组合文章的额外写作要求 ---
+def _build_extra_requirements(article_gen_params: dict) -> str:
+    """
+    将用户自定义的额外要求与默认要求（包括 <IMAGE> 标记规则）组合在一起。
+    """
+    default_extra_requirements = (
+        "文章应内容自然流畅，避免AI写作的痕迹。请使用加粗标记强调核心概念。"
+        "**如果文章包含小标题或强调句，请务必使用双星号（**内容**）进行加粗，并确保其独立成行，不与正文混杂在同一行。**"
+        "**重要提示：在您认为文章的某个自然段落结束后，或者当你认为需要一个视觉元素来增强说明时，请在该自然段落的末尾另起一行并插入标记 <IMAGE>。请确保 <IMAGE> 是该行的唯一内容。**"
+    )
+    user_defined_extra_reqs = article_gen_params.get('extra_requirements', '')
+    extra_requirements = (user_defined_extra_reqs + "\n\n" + default_extra_requirements).strip()
+    return re.sub(r'(\*\*重要提示:.*?<IMAGE>.*?\*\*)\s*\1', r'\1', extra_requirements, flags=re.DOTALL)
+
+# --- 辅助函数：根据标题生成安全的文件名前缀 ---
+def _safe_filename_base(topic: str) -> str:
+    return re.sub(r'[\\/:*?"<>|]', ' ', topic)[:50].strip().replace(' ', '_')
+
+# --- 辅助函数：创建单篇文章的结果记录 ---
+def _new_article_result(topic: str, article_index: int) -> Dict[str, Any]:
+    return {
+        "index": article_index,
+        "topic": topic,
+        "status": "failed",
+        "html_path": None,
+        "json_path": None,
+        "error": None,
+    }
+
+# --- 辅助类：将工作线程中的状态更新转交给主线程 ---
+class _ArticleStatusProxy:
+    """
+    并发模式下，每篇文章在独立的工作线程中运行，而 Streamlit 的 status 容器只能在脚本线程中更新。
+    这个代理对象实现了与 status 容器相同的 update 接口，把更新放入队列，由主线程统一转发。
+    """
+    def __init__(self, article_index: int, total_articles: int, updates: queue.Queue):
+        self.article_index = article_index
+        self.total_articles = total_articles
+        self._updates = updates
+
+    def update(self, label: str = None, state: str = None, **kwargs):
+        if not label:
+            return
+        prefix = f"文章 {self.article_index}/{self.total_articles}"
+        self._updates.put(label if prefix in label else f"{prefix}: {label}")
+
+# --- 函数：保存单篇文章的 JSON 结果 ---
+@instrument_stage(STAGE_WRITE, size=file_size)
+def _write_results_json(
+    topic: str,
+    article_index: int,
+    total_articles: int,
+    processed_data: List[Dict[str, Any]],
+    status_callback=None,
+    article_gen_params: Optional[dict] = None
+) -> str:
+    """
+    第五步：保存处理后的JSON数据，返回文件路径。
+    默认使用紧凑格式（图片数据改为引用 generated_images/ 中的文件），
+    article_gen_params 中的 compact_results / results_compression 可以调整格式和压缩方式。
+    """
+    article_gen_params = article_gen_params or {}
+    compression = article_gen_params.get('results_compression', "none")
+    output_json_filename = results_filename(f"{_safe_filename_base(topic)}_{article_index}_results", compression)
+    output_json_filepath = os.path.join(OUTPUT_SAVE_PATH, output_json_filename)
+    write_results(
+        output_json_filepath,
+        processed_data,
+        compact=article_gen_params.get('compact_results', True),
+        compression=compression
+    )
+    if status_callback:
+        status_callback.update(label=f"✅ 文章 {article_index}/{total_articles}: 结果数据已保存到 {output_json_filepath}", state="running")
+    print(f"--- 日志: 结果数据已保存到 {output_json_filepath} ---")
+    return output_json_filepath
+
+# --- 函数：生成单篇文章的 HTML 页面 ---
+@instrument_stage(STAGE_RENDER, size=file_size)
+def _write_article_html(topic: str, article_index: int, processed_data: List[Dict[str, Any]], status_callback=None) -> str:
+    """
+    第四步：生成HTML页面，返回文件路径。
+    """
+    output_html_filename = f"{_safe_filename_base(topic)}_{article_index}_with_ai_images.html"
+    convert_json_to_markdown_to_html(
+        topic,
+        processed_data,
+        output_html_filename,
+        status_callback=status_callback
+    )
+    print(f"--- 日志: 第 {article_index} 篇文章已处理完毕。---")
+    return os.path.join(OUTPUT_SAVE_PATH, output_html_filename)
+
+# --- 函数：生成单篇文章的 HTML 和 JSON 输出 ---
+def _write_article_outputs(
+    topic: str,
+    article_index: int,
+    total_articles: int,
+    processed_data: List[Dict[str, Any]],
+    article_result: Dict[str, Any],
+    status_callback=None,
+    article_gen_params: Optional[dict] = None
+):
+    """
+    第四、五步：生成HTML页面并保存JSON结果，把输出路径和状态记录到 article_result 中。
+    """
+    article_result["json_path"] = _write_results_json(topic, article_index, total_articles, processed_data,
+                                                      status_callback=status_callback, article_gen_params=article_gen_params)
+    if processed_data:
+        article_result["html_path"] = _write_article_html(topic, article_index, processed_data, status_callback=status_callback)
+        article_result["status"] = "success"
+    else:
+        if status_callback:
+            status_callback.update(label=f"❌ 文章 {article_index}/{total_articles}: 未生成图片数据，无法创建HTML页面。", state="error")
+        print(f"--- 日志: ❌ 未为文章 '{topic}' 生成任何图片数据，无法创建HTML页面。---")
+        article_result["error"] = "未生成图片数据，无法创建HTML页面"
+
+# --- 函数：处理单篇文章的完整流程 ---
+def _generate_single_article(
+    topic: str,
+    article_index: int,
+    total_articles: int,
+    article_gen_params: dict,
+    status_callback=None,
+    journal: Optional[BatchJournal] = None
+) -> Dict[str, Any]:
+    """
+    为单个标题执行完整流程：生成文章内容 -> 配图（保存JSON） -> 生成HTML。
+    文件名只由标题和文章序号决定，因此无论以何种顺序完成，输出文件名都是确定的。
+    传入 journal 时，每个阶段完成后都会记录到任务日志中，已完成的阶段会直接读取产物而不再调用 API。
+    
+    Args:
+        topic (str): 文章标题。
+        article_index (int): 文章序号（从1开始）。
+        total_articles (int): 本批次文章总数。
+        article_gen_params (dict): 包含文章生成细节参数的字典。
+        status_callback (streamlit.status): 用于在Streamlit UI中更新状态。
+        journal (BatchJournal): 可选的批量任务日志。
+        
+    Returns:
+        Dict[str, Any]: 单篇文章的处理结果，包括序号、标题、状态、输出文件路径和错误信息。
+    """
+    article_result = _new_article_result(topic, article_index)
+    print(f"\n--- 日志: 开始处理第 {article_index}/{total_articles} 篇文章: '{topic}' ---")
+    if status_callback:
+        status_callback.update(label=f"文章 {article_index}/{total_articles}: 正在处理 '{topic}'...", state="running")
+
+    # 从参数字典中提取模型信息
+    llm_model = article_gen_params.get('llm_model', "qwen-plus")
+    image_model = article_gen_params.get('image_model', "wanx-v1")
+
+    # 第二步：生成文章内容（任务日志中已有则直接读取）
+    content_artifacts = journal.stage_artifacts(article_index, STAGE_CONTENT) if journal else None
+    images_artifacts = journal.stage_artifacts(article_index, STAGE_IMAGES) if journal else None
+    streamed_processed_data = None
+    if content_artifacts:
+        with open(content_artifacts["path"], "r", encoding="utf-8") as f:
+            generated_article_content = f.read()
+        print(f"--- 日志: 第 {article_index} 篇文章内容已在任务日志中，跳过生成。---")
+    else:
+        article_kwargs = dict(
+            topic=topic,
+            audience=article_gen_params.get('audience', "通用读者"),
+            style=article_gen_params.get('style', "科普性"),
+            length=article_gen_params.get('length', "中篇（600-900字）"),
+            keywords=article_gen_params.get('keywords', []),
+            extra_requirements=_build_extra_requirements(article_gen_params),
+            model=llm_model,
+            save_to_file=True,
+            status_callback=status_callback
+        )
+        if article_gen_params.get('stream_article', False) and not images_artifacts:
+            # 流式模式：第二、三步合并，文章文本一边到达一边为已完整的 <IMAGE> 段落生成图片
+            if status_callback:
+                status_callback.update(label=f"文章 {article_index}/{total_articles}: 正在流式生成文章内容并同步配图...", state="running")
+            generated_article_content, streamed_processed_data = process_streamed_article_and_generate_images(
+                stream_article_content(**article_kwargs),
+                enable_image_generation=True,
+                image_model=image_model,
+                status_callback=status_callback,
+                max_image_workers=article_gen_params.get('max_image_workers', 3),
+                image_synthesis_mode=article_gen_params.get('image_synthesis_mode', "sync"),
+                use_image_cache=article_gen_params.get('use_image_cache', True),
+                use_prompt_cache=article_gen_params.get('use_prompt_cache', True),
+                image_output_mode=article_gen_params.get('image_output_mode', "inline"),
+                image_transcode=article_gen_params.get('image_transcode')
+            )
+        else:
+            if status_callback:
+                status_callback.update(label=f"文章 {article_index}/{total_articles}: 正在生成文章内容...", state="running")
+            generated_article_content = generate_article_content(**article_kwargs)
+        if not generated_article_content:
+            if status_callback:
+                status_callback.update(label=f"❌ 文章 {article_index}/{total_articles}: 未能生成内容，跳过。", state="error")
+            print(f"--- 日志: ❌ 未能为文章 '{topic}' 生成内容，跳过后续步骤。---")
+            article_result["error"] = "未能生成文章内容"
+            return article_result
+        if journal:
+            content_path = os.path.join(journal.artifact_dir, f"{article_index}_article.txt")
+            with open(content_path, "w", encoding="utf-8") as f:
+                f.write(generated_article_content)
+            journal.mark_stage(article_index, STAGE_CONTENT, path=content_path)
+
+    # 第三步：处理文章并生成图片，随后保存JSON结果（任务日志中已有则直接读取）
+    if images_artifacts:
+        processed_data = load_results(images_artifacts["path"])
+        article_result["json_path"] = images_artifacts["path"]
+        print(f"--- 日志: 第 {article_index} 篇文章配图已在任务日志中，跳过生成。---")
+    elif streamed_processed_data is not None:
+        processed_data = streamed_processed_data
+        article_result["json_path"] = _write_results_json(topic, article_index, total_articles, processed_data,
+                                                          status_callback=status_callback, article_gen_params=article_gen_params)
+        if journal:
+            journal.mark_stage(article_index, STAGE_IMAGES, path=article_result["json_path"])
+    else:
+        if status_callback:
+            status_callback.update(label=f"文章 {article_index}/{total_articles}: 正在处理配图...", state="running")
+        processed_data = process_article_and_generate_images(
+            generated_article_content,
+            enable_image_generation=True,
+            image_model=image_model,
+            status_callback=status_callback,
+            max_image_workers=article_gen_params.get('max_image_workers', 3),
+            image_synthesis_mode=article_gen_params.get('image_synthesis_mode', "sync"),
+            use_image_cache=article_gen_params.get('use_image_cache', True),
+            use_prompt_cache=article_gen_params.get('use_prompt_cache', True),
+            batch_image_prompts=article_gen_params.get('batch_image_prompts', True),
+            image_output_mode=article_gen_params.get('image_output_mode', "inline"),
+            image_transcode=article_gen_params.get('image_transcode')
+        )
+        article_result["json_path"] = _write_results_json(topic, article_index, total_articles, processed_data,
+                                                          status_callback=status_callback, article_gen_params=article_gen_params)
+        if journal:
+            journal.mark_stage(article_index, STAGE_IMAGES, path=article_result["json_path"])
+
+    # 第四步：生成HTML页面
+    if not processed_data:
+        if status_callback:
+            status_callback.update(label=f"❌ 文章 {article_index}/{total_articles}: 未生成图片数据，无法创建HTML页面。", state="error")
+        print(f"--- 日志: ❌ 未为文章 '{topic}' 生成任何图片数据，无法创建HTML页面。---")
+        article_result["error"] = "未生成图片数据，无法创建HTML页面"
+        return article_result
+
+    html_artifacts = journal.stage_artifacts(article_index, STAGE_HTML) if journal else None
+    if html_artifacts:
+        article_result["html_path"] = html_artifacts["path"]
+    else:
+        article_result["html_path"] = _write_article_html(topic, article_index, processed_data, status_callback=status_callback)
+        if journal:
+            journal.mark_stage(article_index, STAGE_HTML, path=article_result["html_path"])
+    article_result["status"] = "success"
+    return article_result
+
+# --- 函数：安全地运行单篇文章流程（工作线程入口） ---
+def _run_article_worker(
+    topic: str,
+    article_index: int,
+    total_articles: int,
+    article_gen_params: dict,
+    status_callback=None,
+    journal: Optional[BatchJournal] = None,
+    budget: Optional[BatchBudget] = None
+) -> Optional[Dict[str, Any]]:
+    """
+    捕获单篇文章流程中的所有异常，保证一篇文章失败不会影响其他文章，并把最终状态写入任务日志。
+    文章的令牌和图片使用量记录在 article_result["usage"] 中。
+    传入 budget 且预计费用会超过预算时不处理该文章，返回 None（任务日志中保持未完成状态）。
+    """
+    if budget is not None and not budget.try_start_article():
+        return None
+    article_usage = UsageMeter(parent=budget.usage if budget is not None else None)
+    try:
+        with usage_scope(article_usage):
+            article_result = _generate_single_article(
+                topic, article_index, total_articles, article_gen_params, status_callback=status_callback, journal=journal
+            )
+    except Exception as e:
+        print(f"--- 日志: ❌ 第 {article_index} 篇文章处理异常: {e} ---")
+        article_result = _new_article_result(topic, article_index)
+        article_result["error"] = str(e)
+    article_result["usage"] = article_usage.summary()
+    if budget is not None:
+        budget.finish_article(article_usage)
+    if journal:
+        if article_result["status"] == "success":
+            _record_title_history(journal.main_topic, topic, article_gen_params)
+        article_result["job_id"] = journal.job_id
+        journal.set_article_status(article_index, article_result["status"], article_result["error"])
+    return article_result
+
+# --- 辅助函数：把已成功生成文章的标题记入标题历史 ---
+def _record_title_history(main_topic: str, topic: str, article_gen_params: dict):
+    # 生成失败或未处理的文章不记录，之后的批量任务仍可以重新生成这个题目
+    if article_gen_params.get('use_title_history', True):
+        get_title_index().add(main_topic, [topic])
+
+# --- 辅助函数：批量任务结束时把缓存中尚未写盘的变化写盘 ---
+def _flush_caches():
+    get_image_cache().flush()
+    get_prompt_cache().flush()
+
+# --- 辅助函数：输出缓存和下载统计 ---
+def _log_batch_stats():
+    print(f"--- 日志: 图片缓存统计: {get_image_cache().stats()} ---")
+    print(f"--- 日志: 图片提示词缓存统计: {get_prompt_cache().stats()} ---")
+    print(f"--- 日志: 图片下载统计: {get_download_pool().stats.snapshot()} ---")
+    print(f"--- 日志: 接口重试与熔断统计: {get_resilience().stats()} ---")
+    print(f"--- 日志: 接口自适应并发状态: {get_concurrency_limiter().snapshot()} ---")
+    if any(stats["calls"] for stats in hedging_stats().values()):
+        print(f"--- 日志: 图片提示词对冲请求统计: {hedging_stats()} ---")
+
+# --- 辅助函数：当前的接口并发上限（用于状态显示） ---
+def _concurrency_label() -> str:
+    description = get_concurrency_limiter().describe()
+    return f" | 接口并发（在途/上限）: {description}" if description else ""
+
+# --- 辅助函数：接口熔断时的批量任务状态 ---
+def _circuit_pause_label() -> Optional[str]:
+    """有端点处于熔断状态时返回说明文字（此时该端点的请求都在等待），否则返回 None。"""
+    open_circuits = get_resilience().open_circuits()
+    if not open_circuits:
+        return None
+    details = "、".join(f"{endpoint}（约 {seconds:.0f} 秒后重试）" for endpoint, seconds in open_circuits.items())
+    return f"⏸️ 接口连续失败，批量任务暂停中: {details}"
+
+def _report_batch_halted(remaining: int, status_callback=None):
+    endpoints = "、".join(get_resilience().exhausted_endpoints())
+    message = f"⏸️ 接口 {endpoints} 长时间不可用，批量任务已停止调度，剩余 {remaining} 篇文章未处理，可稍后用任务ID恢复。"
+    if status_callback:
+        status_callback.update(label=message, state="error")
+    print(f"--- 日志: {message} ---")
+
+def _report_budget_exhausted(budget: BatchBudget, remaining: int, status_callback=None):
+    message = (f"💰 已花费约 {budget.usage.cost():.2f} 元，继续处理将超过预算 {budget.limit:.2f} 元，"
+               f"批量任务已停止调度，剩余 {remaining} 篇文章未处理，可调整预算后用任务ID恢复。")
+    if status_callback:
+        status_callback.update(label=message, state="error")
+    print(f"--- 日志: {message} ---")
+
+# --- 辅助函数：创建批量任务的预算 ---
+def _new_batch_budget(article_gen_params: dict) -> BatchBudget:
+    estimated_cost = estimate_article_cost(
+        article_gen_params.get('llm_model', "qwen-plus"),
+        article_gen_params.get('image_model', "wanx-v1")
+    )
+    return BatchBudget(UsageMeter(), article_gen_params.get('budget'), estimated_article_cost=estimated_cost)
+
+# --- 辅助函数：写出批量任务的费用统计 ---
+def _write_batch_usage(job_id: str, budget: BatchBudget, article_results: List[Dict[str, Any]]) -> Optional[str]:
+    usage_path = os.path.join(OUTPUT_SAVE_PATH, f"{job_id}_usage.json")
+    return write_usage_report(usage_path, budget.usage, budget, article_results, job_id=job_id)
+
+# --- 函数：按顺序或并发地处理一组文章 ---
+def _run_article_batch(
+    articles: List[Tuple[int, str]],
+    total_articles: int,
+    article_gen_params: dict,
+    delay_between_articles: int = 0,
+    status_callback=None,
+    max_workers: int = 1,
+    journal: Optional[BatchJournal] = None,
+    budget: Optional[BatchBudget] = None
+) -> List[Dict[str, Any]]:
+    """
+    处理 (文章序号, 标题) 列表中的每一篇文章，返回按序号排序的结果。
+    预计费用超过 budget 后不再开始新的文章，未处理的文章不出现在结果中，可用 resume_batch_job 继续。
+    下载连接池按“同时处理的文章数 × 每篇同时生成的图片数”扩容，保证每个下载线程都能复用连接。
+    接口熔断期间所有请求都会等待（批量任务随之暂停）；熔断长时间未恢复时停止调度剩余的文章，
+    它们在任务日志中保持未完成状态，可用 resume_batch_job 继续。
+    """
+    get_download_pool(pool_size=max(1, max_workers) * article_gen_params.get('max_image_workers', 3))
+    get_resilience().reset_exhausted()
+    article_results = []
+
+    if max_workers <= 1:
+        # 顺序模式：逐篇处理每一篇文章
+        for i, (article_index, topic) in enumerate(articles):
+            if get_resilience().exhausted_endpoints():
+                _report_batch_halted(len(articles) - i, status_callback)
+                break
+            article_result = _run_article_worker(
+                topic, article_index, total_articles, article_gen_params, status_callback=status_callback, journal=journal, budget=budget
+            )
+            if article_result is None:
+                _report_budget_exhausted(budget, len(articles) - i, status_callback)
+                break
+            article_results.append(article_result)
+            print(f"--- 日志: 第 {article_index} 篇文章处理结束{_concurrency_label()} ---")
+
+            # 在处理下一篇文章之前进行延迟
+            if i < len(articles) - 1 and delay_between_articles > 0:
+                print(f"\n--- 日志: 暂停 {delay_between_articles} 秒，准备开始下一篇文章... ---")
+                if status_callback:
+                    status_callback.update(label=f"文章 {article_index}/{total_articles}: 暂停 {delay_between_articles} 秒，准备下一篇...", state="running")
+                time.sleep(delay_between_articles)
+    else:
+        # 并发模式：有界线程池，每个工作线程处理一篇文章的完整流程
+        status_updates = queue.Queue()
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="article") as executor:
+            pending = {
+                submit_in_context(
+                    executor, _run_article_worker, topic, article_index, total_articles, article_gen_params,
+                    _ArticleStatusProxy(article_index, total_articles, status_updates) if status_callback else None,
+                    journal, budget
+                )
+                for article_index, topic in articles
+            }
+            halted = False
+            skipped = 0
+            while pending:
+                done, pending = wait(pending, timeout=0.5, return_when=FIRST_COMPLETED)
+                # 在主线程中转发工作线程产生的状态更新
+                while not status_updates.empty():
+                    label = status_updates.get_nowait()
+                    if status_callback:
+                        status_callback.update(label=label, state="running")
+                pause_label = _circuit_pause_label()
+                if pause_label and status_callback:
+                    status_callback.update(label=pause_label, state="running")
+                if not halted and get_resilience().exhausted_endpoints():
+                    # 取消尚未开始的文章；已经开始的文章会很快因 CircuitOpenError 结束
+                    halted = True
+                    cancelled = {future for future in pending if future.cancel()}
+                    pending -= cancelled
+                    _report_batch_halted(len(cancelled), status_callback)
+                for future in done:
+                    article_result = future.result()
+                    if article_result is None:
+                        # 超出预算，该文章未处理
+                        skipped += 1
+                        continue
+                    article_results.append(article_result)
+                    icon = "✅" if article_result["status"] == "success" else "❌"
+                    progress = f"({len(article_results)}/{len(articles)} 已完成){_concurrency_label()}"
+                    if status_callback:
+                        status_callback.update(label=f"{icon} 文章 {article_result['index']}/{total_articles} '{article_result['topic']}' 处理结束 {progress}", state="running")
+                    print(f"--- 日志: {icon} 第 {article_result['index']} 篇文章处理结束，状态: {article_result['status']} {progress} ---")
+            if skipped:
+                _report_budget_exhausted(budget, skipped, status_callback)
+
+    article_results.sort(key=lambda r: r["index"])
+    return article_results
+
 # --- 主函数：批量生成文章 ---
 def batch_generate_articles(
     main_topic: str,
     num_articles: int,
     article_gen_params: dict, 
-    delay_between_articles: int = 10,
-    status_callback=None
-):
+    delay_between_articles: int = 0,
+    status_callback=None,
+    max_workers: int = 1,
+    job_id: Optional[str] = None
+) -> List[Dict[str, Any]]:
     """
     批量生成多篇文章，并为每篇文章配图、生成HTML。
     
+    max_workers 为 1 时按顺序逐篇处理，并在文章之间延迟 delay_between_articles 秒；
+    大于 1 时使用有界线程池并发处理，每个工作线程负责一篇文章的完整流程，此时不再插入固定延迟。
+    每个批量任务都有一个任务ID和对应的磁盘日志，进程中断后可用 resume_batch_job 继续。
+    
     Args:
         main_topic (str): 主课题。
         num_articles (int): 需要生成的文章数量。
         article_gen_params (dict): 包含文章生成细节参数的字典。
-        delay_between_articles (int): 每篇文章生成之间的延迟时间（秒）。
+        delay_between_articles (int): 顺序模式下每篇文章生成之间的额外延迟时间（秒）。API 调用已由 rate_limiter 统一限流，通常无需设置。
         status_callback (streamlit.status): 用于在Streamlit UI中更新状态。
+        max_workers (int): 同时处理的文章数量上限。
+        job_id (str): 可选的任务ID，不传则自动生成。
+        
+    Returns:
+        List[Dict[str, Any]]: 按文章序号排序的每篇文章处理结果（每条结果带有 job_id）。
     """
-    print(f"\n--- 日志: 批量生成任务开始 (主课题: {main_topic}, 数量: {num_articles}) ---")
+    print(f"\n--- 日志: 批量生成任务开始 (主课题: {main_topic}, 数量: {num_articles}, 并发数: {max_workers}) ---")
+    journal = BatchJournal.create(main_topic, num_articles, article_gen_params, job_id=job_id)
+    batch_metrics = BatchMetrics(journal.job_id)
+    budget = _new_batch_budget(article_gen_params)
     if status_callback:
-        status_callback.update(label=f"🎯 正在为主题 '{main_topic}' 准备生成 {num_articles} 篇文章。", state="running")
+        status_callback.update(label=f"🎯 正在为主题 '{main_topic}' 准备生成 {num_articles} 篇文章（任务ID: {journal.job_id}）。", state="running")
 
     # 第一步：为批量生成任务生成所有文章标题
-    article_topics = generate_article_titles(main_topic, num_articles, status_callback=status_callback)
+    with usage_scope(budget.usage), metrics_scope(batch_metrics):
+        article_topics = generate_article_titles(
+            main_topic, num_articles, status_callback=status_callback,
+            use_title_history=article_gen_params.get('use_title_history', True)
+        )
     if not article_topics:
         if status_callback:
             status_callback.update(label="❌ 未能生成任何文章标题，批量生成终止。", state="error")
         print("--- 日志: 批量生成终止，未生成任何标题。---")
-        return
+        batch_metrics.finish([])
+        _write_batch_usage(journal.job_id, budget, [])
+        return []
+    journal.set_titles(article_topics)
+
+    total_articles = len(article_topics)
+    with metrics_scope(batch_metrics):
+        article_results = _run_article_batch(
+            [(i + 1, topic) for i, topic in enumerate(article_topics)],
+            total_articles,
+            article_gen_params,
+            delay_between_articles=delay_between_articles,
+            status_callback=status_callback,
+            max_workers=max_workers,
+            journal=journal,
+            budget=budget
+        )
+
+    success_count = sum(1 for r in article_results if r["status"] == "success")
+    print(f"\n--- 日志: 批量生成任务全部完成。成功 {success_count}/{total_articles} 篇。任务ID: {journal.job_id} ---")
+    _flush_caches()
+    _log_batch_stats()
+    batch_metrics.finish(article_results)
+    _write_batch_usage(journal.job_id, budget, article_results)
+    return article_results
+
+# --- 主函数：恢复中断的批量任务 ---
+def resume_batch_job(
+    job_id: str,
+    status_callback=None,
+    max_workers: int = 1,
+    delay_between_articles: int = 0
+) -> List[Dict[str, Any]]:
+    """
+    根据任务日志继续一个中断的批量任务：沿用原来的标题和参数，跳过已成功的文章，
+    对未完成的文章只重试尚未完成的阶段。
     
-    # 从参数字典中提取模型信息
-    llm_model = article_gen_params.get('llm_model', "qwen-plus") 
-    image_model = article_gen_params.get('image_model', "wanx-v1") 
-
-    # 循环处理每一篇文章
-    for i, topic in enumerate(article_topics):
-        current_article_index = i + 1
-        total_articles = len(article_topics)
-        print(f"\n--- 日志: 开始处理第 {current_article_index}/{total_articles} 篇文章: '{topic}' ---")
-        if status_callback:
-            status_callback.update(label=f"文章 {current_article_index}/{total_articles}: 正在处理 '{topic}'...", state="running")
-            
-        # 提取文章生成参数
-        current_article_audience = article_gen_params.get('audience', "通用读者")
-        current_article_style = article_gen_params.get('style', "科普性")
-        current_article_length = article_gen_params.get('length', "中篇（600-900字）")
-        current_article_keywords = article_gen_params.get('keywords', [])
-
-        # 组合额外要求和默认要求
-        default_extra_requirements = (
-            "文章应内容自然流畅，避免AI写作的痕迹。请使用加粗标记强调核心概念。"
-            "**如果文章包含小标题或强调句，请务必使用双星号（**内容**）进行加粗，并确保其独立成行，不与正文混杂在同一行。**"
-            "**重要提示：在您认为文章的某个自然段落结束后，或者当你认为需要一个视觉元素来增强说明时，请在该自然段落的末尾另起一行并插入标记 <IMAGE>。请确保 <IMAGE> 是该行的唯一内容。**"
+    Args:
+        job_id (str): 要恢复的任务ID。
+        status_callback (streamlit.status): 用于在Streamlit UI中更新状态。
+        max_workers (int): 同时处理的文章数量上限。
+        delay_between_articles (int): 顺序模式下每篇文章生成之间的额外延迟时间（秒）。
+        
+    Returns:
+        List[Dict[str, Any]]: 本次重新处理的文章结果，按文章序号排序。
+    """
+    journal = BatchJournal.load(job_id)
+    print(f"\n--- 日志: 恢复批量任务 {job_id} (主课题: {journal.main_topic}) ---")
+    # 同一任务可能恢复多次，每次恢复单独输出一份指标
+    resume_id = f"{job_id}_resume_{time.strftime('%Y%m%d%H%M%S')}"
+    batch_metrics = BatchMetrics(resume_id)
+    # 预算只约束本次恢复的花费，之前的花费见原任务的费用统计文件
+    budget = _new_batch_budget(journal.article_gen_params)
+
+    article_topics = journal.titles
+    if not article_topics:
+        # 任务在标题生成阶段就中断了，重新生成标题
+        with usage_scope(budget.usage), metrics_scope(batch_metrics):
+            article_topics = generate_article_titles(
+                journal.main_topic, journal.num_articles, status_callback=status_callback,
+                use_title_history=journal.article_gen_params.get('use_title_history', True)
+            )
+        if not article_topics:
+            if status_callback:
+                status_callback.update(label="❌ 未能生成任何文章标题，无法恢复任务。", state="error")
+            batch_metrics.finish([])
+            _write_batch_usage(resume_id, budget, [])
+            return []
+        journal.set_titles(article_topics)
+
+    unfinished = journal.unfinished_indices()
+    if status_callback:
+        status_callback.update(label=f"♻️ 任务 {job_id}: 共 {len(article_topics)} 篇，还有 {len(unfinished)} 篇未完成，继续处理...", state="running")
+    with metrics_scope(batch_metrics):
+        article_results = _run_article_batch(
+            [(index, article_topics[index - 1]) for index in unfinished],
+            len(article_topics),
+            journal.article_gen_params,
+            delay_between_articles=delay_between_articles,
+            status_callback=status_callback,
+            max_workers=max_workers,
+            journal=journal,
+            budget=budget
         )
-        user_defined_extra_reqs = article_gen_params.get('extra_requirements', '')
-        current_extra_requirements = (user_defined_extra_reqs + "\n\n" + default_extra_requirements).strip()
-        current_extra_requirements = re.sub(r'(\*\*重要提示:.*?<IMAGE>.*?\*\*)\s*\1', r'\1', current_extra_requirements, flags=re.DOTALL)
+    print(f"\n--- 日志: 任务 {job_id} 恢复完成。本次成功 {sum(1 for r in article_results if r['status'] == 'success')}/{len(unfinished)} 篇。---")
+    _flush_caches()
+    _log_batch_stats()
+    batch_metrics.finish(article_results)
+    _write_batch_usage(resume_id, budget, article_results)
+    return article_results
 
-        # 第二步：生成文章内容
-        if status_callback:
-            status_callback.update(label=f"文章 {current_article_index}/{total_articles}: 正在生成文章内容...", state="running")
-        generated_article_content = generate_article_content(
-            topic=topic, 
-            audience=current_article_audience, 
-            style=current_article_style, 
-            length=current_article_length,
-            keywords=current_article_keywords, 
-            extra_requirements=current_extra_requirements,
-            model=llm_model, 
-            save_to_file=True, 
+# --- 函数：_generate_single_article 的 asyncio 版本 ---
+async def _generate_single_article_async(
+    topic: str,
+    article_index: int,
+    total_articles: int,
+    article_gen_params: dict,
+    status_callback=None,
+    http_session=None
+) -> Dict[str, Any]:
+    article_result = _new_article_result(topic, article_index)
+    try:
+        print(f"\n--- 日志: 开始处理第 {article_index}/{total_articles} 篇文章 (async): '{topic}' ---")
+        generated_article_content = await generate_article_content_async(
+            topic=topic,
+            audience=article_gen_params.get('audience', "通用读者"),
+            style=article_gen_params.get('style', "科普性"),
+            length=article_gen_params.get('length', "中篇（600-900字）"),
+            keywords=article_gen_params.get('keywords', []),
+            extra_requirements=_build_extra_requirements(article_gen_params),
+            model=article_gen_params.get('llm_model', "qwen-plus"),
+            save_to_file=True,
             status_callback=status_callback
         )
         if not generated_article_content:
-            if status_callback:
-                status_callback.update(label=f"❌ 文章 {current_article_index}/{total_articles}: 未能生成内容，跳过。", state="error")
             print(f"--- 日志: ❌ 未能为文章 '{topic}' 生成内容，跳过后续步骤。---")
-            continue
+            article_result["error"] = "未能生成文章内容"
+            return article_result
 
-        # 第三步：处理文章并生成图片
-        if status_callback:
-            status_callback.update(label=f"文章 {current_article_index}/{total_articles}: 正在处理配图...", state="running")
-        processed_data = process_article_and_generate_images(
-            generated_article_content, 
-            enable_image_generation=True, 
-            image_model=image_model, 
-            status_callback=status_callback
+        processed_data = await process_article_and_generate_images_async(
+            generated_article_content,
+            enable_image_generation=True,
+            image_model=article_gen_params.get('image_model', "wanx-v1"),
+            status_callback=status_callback,
+            http_session=http_session,
+            use_image_cache=article_gen_params.get('use_image_cache', True),
+            use_prompt_cache=article_gen_params.get('use_prompt_cache', True),
+            batch_image_prompts=article_gen_params.get('batch_image_prompts', True),
+            image_output_mode=article_gen_params.get('image_output_mode', "inline"),
+            image_transcode=article_gen_params.get('image_transcode')
         )
+        # HTML 渲染和文件写入是同步的本地操作，放到线程池中执行以免阻塞事件循环
+        await asyncio.to_thread(_write_article_outputs, topic, article_index, total_articles, processed_data, article_result,
+                                None, article_gen_params)
+    except Exception as e:
+        print(f"--- 日志: ❌ 第 {article_index} 篇文章处理异常: {e} ---")
+        article_result["error"] = str(e)
+    return article_result
+
+# --- 主函数：batch_generate_articles 的 asyncio 版本 ---
+async def batch_generate_articles_async(
+    main_topic: str,
+    num_articles: int,
+    article_gen_params: dict,
+    max_concurrency: int = 50,
+    status_callback=None
+):
+    """
+    批量生成文章的异步生成器：所有文章以协程方式并发处理，每完成一篇就产出该篇的结果。
+    并发文章数由 max_concurrency 限制，实际请求速率由 rate_limiter 的配额约束。
+    
+    Args:
+        main_topic (str): 主课题。
+        num_articles (int): 需要生成的文章数量。
+        article_gen_params (dict): 包含文章生成细节参数的字典。
+        max_concurrency (int): 同时处理的文章数量上限。
+        status_callback: 可选的状态回调，需提供 update(label=..., state=...) 方法。
         
-        # 第四步：生成HTML页面
-        if processed_data:
-            # 创建安全的文件名
-            safe_html_filename_base = re.sub(r'[\\/:*?"<>|]', ' ', topic)[:50].strip().replace(' ', '_')
-            output_html_filename = f"{safe_html_filename_base}_{current_article_index}_with_ai_images.html"
-            convert_json_to_markdown_to_html(
-                topic, 
-                processed_data, 
-                output_html_filename, 
-                status_callback=status_callback
-            )
-            print(f"--- 日志: 第 {current_article_index} 篇文章已处理完毕。---")
-        else:
-            if status_callback:
-                status_callback.update(label=f"❌ 文章 {current_article_index}/{total_articles}: 未生成图片数据，无法创建HTML页面。", state="error")
-            print(f"--- 日志: ❌ 未为文章 '{topic}' 生成任何图片数据，无法创建HTML页面。---")
-
-        # 第五步：保存处理后的JSON数据（可选）
-        safe_json_filename_base = re.sub(r'[\\/:*?"<>|]', ' ', topic)[:50].strip().replace(' ', '_')
-        output_json_filename = f"{safe_json_filename_base}_{current_article_index}_results.json"
-        output_json_filepath = os.path.join(OUTPUT_SAVE_PATH, output_json_filename)
-        with open(output_json_filepath, "w", encoding="utf-8") as f:
-            json.dump(processed_data, f, ensure_ascii=False, indent=4)
-        if status_callback:
-            status_callback.update(label=f"✅ 文章 {current_article_index}/{total_articles}: 结果数据已保存到 {output_json_filepath}", state="running")
-        print(f"--- 日志: 结果数据已保存到 {output_json_filepath} ---")
+    Yields:
+        Dict[str, Any]: 单篇文章的处理结果（按完成顺序产出，可用 "index" 字段恢复原始顺序）。
+    
+    用法：
+        async for article_result in batch_generate_articles_async("主题", 10, params):
+            ...
+    """
+    print(f"\n--- 日志: 异步批量生成任务开始 (主课题: {main_topic}, 数量: {num_articles}, 并发数: {max_concurrency}) ---")
+    batch_id = f"async_{new_job_id()}"
+    batch_metrics = BatchMetrics(batch_id)
+    budget = _new_batch_budget(article_gen_params)
+    with usage_scope(budget.usage), metrics_scope(batch_metrics):
+        article_topics = await generate_article_titles_async(
+            main_topic, num_articles, status_callback=status_callback,
+            use_title_history=article_gen_params.get('use_title_history', True)
+        )
+    if not article_topics:
+        print("--- 日志: 批量生成终止，未生成任何标题。---")
+        batch_metrics.finish([])
+        _write_batch_usage(batch_id, budget, [])
+        return
 
-        # 在处理下一篇文章之前进行延迟
-        if i < len(article_topics) - 1:
-            print(f"\n--- 日志: 暂停 {delay_between_articles} 秒，准备开始下一篇文章... ---")
-            if status_callback:
-                status_callback.update(label=f"文章 {current_article_index}/{total_articles}: 暂停 {delay_between_articles} 秒，准备下一篇...", state="running")
-            time.sleep(delay_between_articles)
+    total_articles = len(article_topics)
+    get_resilience().reset_exhausted()
+    semaphore = asyncio.Semaphore(max(1, max_concurrency))
+    http_session = aiohttp.ClientSession() if aiohttp is not None else None
+
+    async def _bounded(topic: str, article_index: int):
+        async with semaphore:
+            if get_resilience().exhausted_endpoints():
+                # 接口熔断后长时间未恢复，不再开始新的文章
+                article_result = _new_article_result(topic, article_index)
+                article_result["error"] = "接口持续不可用，批量任务已停止调度"
+                return article_result
+            if not budget.try_start_article():
+                article_result = _new_article_result(topic, article_index)
+                article_result["error"] = "预计费用超过预算，批量任务已停止调度"
+                return article_result
+            # 每个协程任务有自己的上下文副本，这里设置的 UsageMeter 只作用于本篇文章
+            article_usage = UsageMeter(parent=budget.usage)
+            try:
+                with usage_scope(article_usage), metrics_scope(batch_metrics):
+                    article_result = await _generate_single_article_async(
+                        topic, article_index, total_articles, article_gen_params,
+                        status_callback=status_callback, http_session=http_session
+                    )
+                article_result["usage"] = article_usage.summary()
+                if article_result["status"] == "success":
+                    await asyncio.to_thread(_record_title_history, main_topic, topic, article_gen_params)
+                return article_result
+            finally:
+                budget.finish_article(article_usage)
 
-    print("\n--- 日志: 批量生成任务全部完成。---")
+    tasks = [asyncio.ensure_future(_bounded(topic, i + 1)) for i, topic in enumerate(article_topics)]
+    article_results = []
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            article_result = await next_done
+            article_results.append(article_result)
+            print(f"--- 日志: 第 {article_result['index']} 篇文章处理结束，状态: {article_result['status']}{_concurrency_label()} ---")
+            yield article_result
+    finally:
+        # 调用方提前退出迭代时，取消尚未完成的文章
+        for task in tasks:
+            task.cancel()
+        if http_session is not None:
+            await http_session.close()
+        await asyncio.to_thread(_flush_caches)
+        batch_metrics.finish(article_results)
+        _write_batch_usage(batch_id, budget, article_results)
+    print("\n--- 日志: 异步批量生成任务全部完成。---")
 
 # --- 主执行区 (在没有Streamlit运行时，用于本地测试) ---
 if __name__ == "__main__":
@@ -272,4 +1033,4 @@ if __name__ == "__main__":
             'image_model': 'wanx-v1'
         }
         batch_generate_articles(
-            main_batch_topic, num_of_articles, article_generation_parameters, delay_between_articles=15)
\ No newline at end of file
+            main_batch_topic, num_of_articles, article_generation_parameters)
\ No newline at end of file
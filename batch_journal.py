@@ -0,0 +1,185 @@
+# batch_journal.py
+# 批量任务的磁盘日志：记录任务ID、标题列表、每篇文章各阶段的完成情况及产物路径，
+# 进程中断后可以据此跳过已完成的工作，只重试未完成的阶段。
+
+import os
+import json
+import uuid
+import datetime
+import threading
+from typing import Any, Dict, List, Optional
+
+JOBS_SAVE_PATH = os.path.join("generated_output", "jobs")
+if not os.path.exists(JOBS_SAVE_PATH):
+    os.makedirs(JOBS_SAVE_PATH)
+
+# 单篇文章的处理阶段，按执行顺序排列
+STAGE_CONTENT = "content"   # 文章内容已生成，产物：文章文本文件
+STAGE_IMAGES = "images"     # 配图已完成，产物：结果 JSON 文件
+STAGE_HTML = "html"         # HTML 页面已生成，产物：HTML 文件
+ARTICLE_STAGES = (STAGE_CONTENT, STAGE_IMAGES, STAGE_HTML)
+
+def new_job_id() -> str:
+    """生成形如 20250101_120000_1a2b3c 的任务ID，按时间排序且不会重复。"""
+    return f"{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:6]}"
+
+class BatchJournal:
+    """
+    一个批量任务的日志文件（generated_output/jobs/<job_id>.json）。
+    所有修改都在锁内完成并立即原子写盘，可以在多个工作线程之间共享。
+    """
+    def __init__(self, data: Dict[str, Any]):
+        self._data = data
+        self._lock = threading.Lock()
+
+    # --- 创建与加载 ---
+    @classmethod
+    def create(cls, main_topic: str, num_articles: int, article_gen_params: dict, job_id: Optional[str] = None) -> "BatchJournal":
+        now = datetime.datetime.now().isoformat(timespec='seconds')
+        journal = cls({
+            "job_id": job_id or new_job_id(),
+            "main_topic": main_topic,
+            "num_articles": num_articles,
+            "article_gen_params": article_gen_params,
+            "created_at": now,
+            "updated_at": now,
+            "titles": [],
+            "articles": {},
+        })
+        os.makedirs(journal.artifact_dir, exist_ok=True)
+        journal.save()
+        print(f"--- 日志: 已创建批量任务日志，任务ID: {journal.job_id} ---")
+        return journal
+
+    @classmethod
+    def load(cls, job_id: str) -> "BatchJournal":
+        with open(cls.journal_path_for(job_id), "r", encoding="utf-8") as f:
+            return cls(json.load(f))
+
+    @staticmethod
+    def journal_path_for(job_id: str) -> str:
+        return os.path.join(JOBS_SAVE_PATH, f"{job_id}.json")
+
+    # --- 基本属性 ---
+    @property
+    def job_id(self) -> str:
+        return self._data["job_id"]
+
+    @property
+    def main_topic(self) -> str:
+        return self._data["main_topic"]
+
+    @property
+    def num_articles(self) -> int:
+        return self._data["num_articles"]
+
+    @property
+    def article_gen_params(self) -> dict:
+        return self._data["article_gen_params"]
+
+    @property
+    def titles(self) -> List[str]:
+        return list(self._data["titles"])
+
+    @property
+    def artifact_dir(self) -> str:
+        """存放本任务中间产物（如文章文本）的目录。"""
+        return os.path.join(JOBS_SAVE_PATH, self.job_id)
+
+    # --- 修改 ---
+    def save(self):
+        """原子写盘：先写临时文件再替换，进程在写入过程中被杀也不会留下损坏的日志。"""
+        with self._lock:
+            self._save_locked()
+
+    def _save_locked(self):
+        self._data["updated_at"] = datetime.datetime.now().isoformat(timespec='seconds')
+        journal_path = self.journal_path_for(self.job_id)
+        tmp_path = f"{journal_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self._data, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, journal_path)
+
+    def set_titles(self, titles: List[str]):
+        with self._lock:
+            self._data["titles"] = list(titles)
+            for i, topic in enumerate(titles):
+                self._data["articles"].setdefault(str(i + 1), {"topic": topic, "stages": {}, "status": "pending", "error": None})
+            self._save_locked()
+
+    def mark_stage(self, article_index: int, stage: str, **artifacts):
+        """记录某篇文章的某个阶段已完成，artifacts 为该阶段的产物路径等信息。"""
+        with self._lock:
+            article = self._data["articles"][str(article_index)]
+            article["stages"][stage] = dict(artifacts, completed_at=datetime.datetime.now().isoformat(timespec='seconds'))
+            self._save_locked()
+
+    def set_article_status(self, article_index: int, status: str, error: Optional[str] = None):
+        with self._lock:
+            article = self._data["articles"][str(article_index)]
+            article["status"] = status
+            article["error"] = error
+            self._save_locked()
+
+    # --- 查询 ---
+    def stage_artifacts(self, article_index: int, stage: str) -> Optional[dict]:
+        """
+        返回某阶段的产物信息；阶段未完成，或记录的产物文件已不存在时返回 None（视为需要重做）。
+        """
+        with self._lock:
+            article = self._data["articles"].get(str(article_index))
+            artifacts = article["stages"].get(stage) if article else None
+        if not artifacts:
+            return None
+        path = artifacts.get("path")
+        if path and not os.path.exists(path):
+            return None
+        return artifacts
+
+    def unfinished_indices(self) -> List[int]:
+        with self._lock:
+            return sorted(
+                int(index) for index, article in self._data["articles"].items()
+                if article["status"] != "success"
+            )
+
+    def is_finished(self) -> bool:
+        return bool(self._data["titles"]) and not self.unfinished_indices()
+
+    def summary(self) -> Dict[str, Any]:
+        with self._lock:
+            statuses = [article["status"] for article in self._data["articles"].values()]
+            return {
+                "job_id": self.job_id,
+                "main_topic": self.main_topic,
+                "num_articles": self.num_articles,
+                "created_at": self._data["created_at"],
+                "updated_at": self._data["updated_at"],
+                "completed": statuses.count("success"),
+                "total": len(self._data["titles"]) or self.num_articles,
+            }
+
+# --- 函数：列出磁盘上的批量任务 ---
+def list_batch_jobs(unfinished_only: bool = False) -> List[Dict[str, Any]]:
+    """
+    按创建时间倒序列出所有批量任务的摘要。
+
+    Args:
+        unfinished_only (bool): 是否只列出尚未全部完成的任务。
+
+    Returns:
+        List[Dict[str, Any]]: 任务摘要列表。
+    """
+    jobs = []
+    for filename in os.listdir(JOBS_SAVE_PATH):
+        if not filename.endswith(".json"):
+            continue
+        try:
+            journal = BatchJournal.load(filename[:-len(".json")])
+        except (OSError, ValueError, KeyError) as e:
+            print(f"--- 日志: ⚠️ 无法读取任务日志 {filename}: {e} ---")
+            continue
+        if unfinished_only and journal.is_finished():
+            continue
+        jobs.append(journal.summary())
+    return sorted(jobs, key=lambda job: job["created_at"], reverse=True)
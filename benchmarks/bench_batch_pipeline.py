@@ -0,0 +1,351 @@
+# bench_batch_pipeline.py
+# 批量生成流程的离线基准测试：在进程内用假的 Generation.call / ImageSynthesis.call 和图片下载替换 DashScope 与图片服务器，
+# 端到端运行 batch_generate_articles，报告每分钟文章数、峰值内存（RSS）和各阶段耗时（见 pipeline_metrics）。
+# 不需要 API Key，也不会产生费用，每次性能相关的修改都可以用它在本地对比前后的差异。
+#
+# 用法（在项目根目录执行）：
+#     python benchmarks/bench_batch_pipeline.py                                   # N = 1, 10, 50, 200
+#     python benchmarks/bench_batch_pipeline.py --sizes 10 --max-workers 8
+#     python benchmarks/bench_batch_pipeline.py --article-latency 20:0.3 --image-latency 8:0.2:0.02:60 --time-scale 0.1
+#     python benchmarks/bench_batch_pipeline.py --output bench_results.json
+#
+# 延迟分布写作 "中位数[:sigma[:长尾概率:长尾秒数]]"：按对数正态分布取样（sigma 为对数标准差），
+# 再以给定概率替换为长尾延迟，例如 "1:0.5:0.01:20" 表示中位数 1 秒、1% 的请求耗时 20 秒。
+# 所有延迟都乘以 --time-scale，默认按真实延迟的 1/20 运行，N=200 也能在几分钟内跑完；
+# 缩放后的每分钟文章数会高于真实值，只适合在相同参数下做前后对比。
+#
+# 每个 N 在独立的子进程和临时工作目录中运行：峰值 RSS 互不影响，缓存和标题历史也不会跨轮复用。
+
+import os
+import re
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+import subprocess
+import contextlib
+from types import SimpleNamespace
+from unittest import mock
+from typing import Any, Dict, Iterator, List, Optional
+
+# resource 只在类 Unix 系统上可用，Windows 上不报告峰值内存
+try:
+    import resource
+except ImportError:
+    resource = None
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_SIZES = (1, 10, 50, 200)
+STAGE_COLUMNS = ("titles", "article_text", "image_prompt", "image_synthesis", "download", "encode", "render", "write")
+
+# --- 延迟分布 ---
+class LatencyModel:
+    """对数正态分布的延迟，带可选的长尾。"""
+    def __init__(self, median: float, sigma: float = 0.0, tail_rate: float = 0.0, tail_seconds: float = 0.0):
+        self.median = median
+        self.sigma = sigma
+        self.tail_rate = tail_rate
+        self.tail_seconds = tail_seconds
+
+    @classmethod
+    def parse(cls, spec: str) -> "LatencyModel":
+        parts = [float(part) for part in spec.split(":")]
+        if len(parts) not in (1, 2, 4):
+            raise argparse.ArgumentTypeError(f"延迟分布格式应为 中位数[:sigma[:长尾概率:长尾秒数]]，收到: {spec}")
+        return cls(*parts)
+
+    def sample(self, rng: random.Random) -> float:
+        if self.tail_rate and rng.random() < self.tail_rate:
+            return self.tail_seconds
+        return self.median * rng.lognormvariate(0.0, self.sigma) if self.sigma else self.median
+
+    def __str__(self) -> str:
+        tail = f":{self.tail_rate}:{self.tail_seconds}" if self.tail_rate else ""
+        return f"{self.median}:{self.sigma}{tail}"
+
+# --- 假的 DashScope 后端 ---
+class FakeBackend:
+    """
+    根据请求的系统提示词判断是哪一类调用（标题、文章、单个/批量图片提示词），返回格式与真实接口一致的响应。
+    """
+    def __init__(self, args: argparse.Namespace):
+        self.args = args
+        self.rng = random.Random(args.seed)
+        self._image_ids = iter(range(1, 10**9))
+        self._tasks: Dict[str, float] = {}
+        # 每张图片的内容 = PNG 文件头 + 图片编号 + 共用的随机数据，保证内容各不相同（外部图片按内容哈希去重）
+        self._image_payload = os.urandom(max(0, args.image_kb * 1024 - 16))
+
+        import batch_article_generator
+        import wanxiangimg
+        self._title_system_prompt = batch_article_generator._build_title_messages("", 1)[0]['content']
+        self._prompt_system_prompt = wanxiangimg._build_image_prompt_messages("")[0]['content']
+        self._batched_prompt_system_prompt = wanxiangimg._build_batched_image_prompt_messages([""])[0]['content']
+
+    def _sleep(self, latency: LatencyModel):
+        time.sleep(latency.sample(self.rng) * self.args.time_scale)
+
+    def _random_title(self) -> str:
+        # 随机汉字组成的标题，避免被标题去重当作近似重复
+        return "".join(chr(self.rng.randint(0x4E00, 0x9FA5)) for _ in range(14))
+
+    def _article_text(self) -> str:
+        paragraph = "这是基准测试生成的段落，内容不重要，只用来模拟真实文章的长度和结构。" * max(1, self.args.paragraph_chars // 34)
+        lines = []
+        for index in range(self.args.paragraphs):
+            lines.append(f"{index + 1}. {paragraph}")
+            if (index + 1) % self.args.paragraphs_per_image == 0:
+                lines.append("<IMAGE>")
+        return "\n".join(lines)
+
+    def _generation_text(self, messages: List[dict]) -> tuple:
+        system_prompt, user_prompt = messages[0]['content'], messages[-1]['content']
+        if system_prompt == self._title_system_prompt:
+            match = re.search(r"生成 (\d+) 个", user_prompt)
+            return "\n".join(self._random_title() for _ in range(int(match.group(1)) if match else 10)), self.args.title_latency
+        if system_prompt == self._batched_prompt_system_prompt:
+            count = len(re.findall(r"段落\d+:", user_prompt))
+            return json.dumps([f"benchmark scene {i}, digital art" for i in range(count)]), self.args.prompt_latency
+        if system_prompt == self._prompt_system_prompt:
+            return "benchmark scene, digital art", self.args.prompt_latency
+        return self._article_text(), self.args.article_latency
+
+    @staticmethod
+    def _usage(messages: List[dict], text: str) -> SimpleNamespace:
+        input_tokens = sum(len(m.get('content', '')) for m in messages)
+        return SimpleNamespace(input_tokens=input_tokens, output_tokens=len(text), total_tokens=input_tokens + len(text))
+
+    def generation_call(self, model: str = None, messages: List[dict] = None, stream: bool = False, incremental_output: bool = False, **kwargs):
+        text, latency = self._generation_text(messages)
+        if stream:
+            return self._stream(messages, text, latency, incremental_output)
+        self._sleep(latency)
+        return SimpleNamespace(
+            status_code=200, code="", message="", request_id="bench",
+            output=SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=text), finish_reason="stop")]),
+            usage=self._usage(messages, text)
+        )
+
+    def _stream(self, messages: List[dict], text: str, latency: LatencyModel, incremental_output: bool) -> Iterator[SimpleNamespace]:
+        chunk_count = max(1, len(text) // 40)
+        total = latency.sample(self.rng) * self.args.time_scale
+        for index in range(chunk_count):
+            time.sleep(total / chunk_count)
+            start, end = len(text) * index // chunk_count, len(text) * (index + 1) // chunk_count
+            yield SimpleNamespace(
+                status_code=200, code="", message="", request_id="bench",
+                output=SimpleNamespace(choices=[SimpleNamespace(
+                    message=SimpleNamespace(content=text[start:end] if incremental_output else text[:end]),
+                    finish_reason="stop" if index == chunk_count - 1 else None
+                )]),
+                usage=self._usage(messages, text[:end])
+            )
+
+    def _image_response(self, task_id: str, status: str, with_result: bool) -> SimpleNamespace:
+        results = [SimpleNamespace(url=f"http://benchmark.invalid/{task_id}.png")] if with_result else []
+        return SimpleNamespace(
+            status_code=200, code="", message="",
+            output=SimpleNamespace(task_id=task_id, task_status=status, results=results),
+            usage=SimpleNamespace(image_count=len(results))
+        )
+
+    def image_call(self, model: str = None, prompt: str = None, **kwargs):
+        self._sleep(self.args.image_latency)
+        return self._image_response(f"image-{next(self._image_ids)}", "SUCCEEDED", True)
+
+    def image_async_call(self, model: str = None, prompt: str = None, **kwargs):
+        task_id = f"task-{next(self._image_ids)}"
+        self._tasks[task_id] = time.monotonic() + self.args.image_latency.sample(self.rng) * self.args.time_scale
+        return self._image_response(task_id, "PENDING", False)
+
+    def image_fetch(self, task: Any, **kwargs):
+        task_id = task if isinstance(task, str) else task.output.task_id
+        done = time.monotonic() >= self._tasks[task_id]
+        return self._image_response(task_id, "SUCCEEDED" if done else "RUNNING", done)
+
+    def image_wait(self, task: Any, **kwargs):
+        while True:
+            response = self.image_fetch(task)
+            if response.output.task_status == "SUCCEEDED":
+                return response
+            time.sleep(0.01)
+
+    def session_get(self, session, url: str, stream: bool = False, timeout=None, **kwargs):
+        self._sleep(self.args.download_latency)
+        image_id = re.sub(r"\D", "", url.rsplit("/", 1)[-1]).rjust(8, "0")[-8:].encode("ascii")
+        return _FakeDownloadResponse(b"\x89PNG\r\n\x1a\n" + image_id + self._image_payload)
+
+    def patches(self) -> List[Any]:
+        import dashscope
+        import requests
+        generation = SimpleNamespace(call=self.generation_call)
+        image_synthesis = SimpleNamespace(
+            call=self.image_call, async_call=self.image_async_call, fetch=self.image_fetch, wait=self.image_wait
+        )
+        backend = self
+        return [
+            mock.patch.object(dashscope, "Generation", generation),
+            mock.patch.object(dashscope, "ImageSynthesis", image_synthesis),
+            mock.patch.object(requests.Session, "get", lambda session, url, **kwargs: backend.session_get(session, url, **kwargs)),
+        ]
+
+class _FakeDownloadResponse:
+    def __init__(self, content: bytes):
+        self.content = content
+        self.status_code = 200
+        self.headers = {"Content-Type": "image/png"}
+
+    def raise_for_status(self):
+        pass
+
+    def iter_content(self, chunk_size: int = 1) -> Iterator[bytes]:
+        for start in range(0, len(self.content), chunk_size):
+            yield self.content[start:start + chunk_size]
+
+    def close(self):
+        pass
+
+    def __enter__(self) -> "_FakeDownloadResponse":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+# --- 单轮测试（在子进程中执行） ---
+def _peak_rss_mb() -> Optional[float]:
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 上单位为 KB，macOS 上为字节
+    return round(peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024, 1)
+
+def run_single(num_articles: int, args: argparse.Namespace) -> Dict[str, Any]:
+    """在当前进程中跑一轮 N 篇文章的批量任务，返回结果。调用前应已切换到临时工作目录。"""
+    sys.path.insert(0, REPO_ROOT)
+    import dashscope
+    from rate_limiter import configure_rate_limits
+    from pipeline_metrics import get_metrics
+    from batch_article_generator import batch_generate_articles
+
+    dashscope.api_key = "benchmark"
+    if not args.keep_rate_limits:
+        # 默认不限流：基准测试衡量的是流程本身的开销，账号配额另行估算
+        configure_rate_limits({"generation:*": {"rpm": 10**6, "tpm": 10**9}, "image_synthesis:*": {"rpm": 10**6}})
+    article_gen_params = {
+        'llm_model': "qwen-plus",
+        'image_model': "wanx-v1",
+        'image_synthesis_mode': args.image_mode,
+        'stream_article': args.stream_article,
+        'image_output_mode': args.image_output_mode,
+        'max_image_workers': args.max_image_workers,
+        'use_image_cache': False,
+        'use_prompt_cache': False,
+        'use_title_history': False,
+    }
+
+    backend = FakeBackend(args)
+    baseline = get_metrics().snapshot()
+    with contextlib.ExitStack() as stack:
+        for patch in backend.patches():
+            stack.enter_context(patch)
+        if not args.verbose:
+            stack.enter_context(contextlib.redirect_stdout(stack.enter_context(open(os.devnull, "w", encoding="utf-8"))))
+        start = time.monotonic()
+        article_results = batch_generate_articles(
+            "基准测试", num_articles, article_gen_params, max_workers=args.max_workers
+        )
+        elapsed = time.monotonic() - start
+
+    current = get_metrics().snapshot()
+    success_count = sum(1 for r in article_results if r["status"] == "success")
+    return {
+        "articles": num_articles,
+        "success": success_count,
+        "seconds": round(elapsed, 3),
+        "articles_per_minute": round(success_count / elapsed * 60, 2) if elapsed > 0 else None,
+        "peak_rss_mb": _peak_rss_mb(),
+        "stages": {stage: metrics.minus(baseline[stage]).summary() for stage, metrics in current.items()},
+    }
+
+def _run_child(num_articles: int, args: argparse.Namespace, argv: List[str]) -> Dict[str, Any]:
+    completed = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), *argv, "--child", str(num_articles)],
+        stdout=subprocess.PIPE, text=True, encoding="utf-8"
+    )
+    if completed.returncode != 0:
+        raise RuntimeError(f"N={num_articles} 的基准测试失败（退出码 {completed.returncode}）")
+    # 子进程的最后一行是结果 JSON，之前的内容（--verbose 时的流程日志）原样输出
+    *log_lines, result_line = completed.stdout.rstrip("\n").split("\n")
+    if args.verbose and log_lines:
+        print("\n".join(log_lines))
+    return json.loads(result_line)
+
+# --- 结果输出 ---
+def _format_report(results: List[Dict[str, Any]]) -> str:
+    header = f"{'N':>5} {'成功':>5} {'耗时(s)':>9} {'篇/分钟':>9} {'峰值RSS(MB)':>12}  " + " ".join(f"{stage:>15}" for stage in STAGE_COLUMNS)
+    lines = ["各阶段耗时为 平均/p95（秒）", header]
+    for result in results:
+        stage_cells = []
+        for stage in STAGE_COLUMNS:
+            summary = result["stages"].get(stage, {})
+            stage_cells.append(f"{summary['seconds_mean']:.2f}/{summary['p95']:.2f}" if summary.get("count") else "-")
+        lines.append(
+            f"{result['articles']:>5} {result['success']:>5} {result['seconds']:>9.1f} {result['articles_per_minute'] or 0:>9.1f} "
+            f"{result['peak_rss_mb'] if result['peak_rss_mb'] is not None else '-':>12}  " + " ".join(f"{cell:>15}" for cell in stage_cells)
+        )
+    return "\n".join(lines)
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="批量生成流程的离线基准测试（假的 DashScope 后端）。")
+    parser.add_argument("--sizes", default=",".join(str(n) for n in DEFAULT_SIZES), help="逗号分隔的文章数列表，默认 1,10,50,200")
+    parser.add_argument("--max-workers", type=int, default=4, help="同时处理的文章数（batch_generate_articles 的 max_workers）")
+    parser.add_argument("--max-image-workers", type=int, default=3, help="每篇文章同时生成的图片数")
+    parser.add_argument("--image-mode", choices=("sync", "async"), default="sync", help="文生图调用方式（image_synthesis_mode）")
+    parser.add_argument("--image-output-mode", choices=("inline", "external"), default="inline")
+    parser.add_argument("--stream-article", action="store_true", help="以流式方式生成文章并边生成边配图")
+    parser.add_argument("--title-latency", type=LatencyModel.parse, default=LatencyModel(3.0, 0.3), help="标题生成的延迟分布")
+    parser.add_argument("--article-latency", type=LatencyModel.parse, default=LatencyModel(20.0, 0.3), help="文章生成的延迟分布")
+    parser.add_argument("--prompt-latency", type=LatencyModel.parse, default=LatencyModel(1.0, 0.5, 0.01, 20.0), help="图片提示词生成的延迟分布")
+    parser.add_argument("--image-latency", type=LatencyModel.parse, default=LatencyModel(8.0, 0.2), help="文生图的延迟分布")
+    parser.add_argument("--download-latency", type=LatencyModel.parse, default=LatencyModel(0.3, 0.5), help="图片下载的延迟分布")
+    parser.add_argument("--time-scale", type=float, default=0.05, help="所有延迟乘以该系数，1 表示按真实延迟运行")
+    parser.add_argument("--image-kb", type=int, default=300, help="每张图片的大小（KB）")
+    parser.add_argument("--paragraphs", type=int, default=9, help="每篇文章的段落数")
+    parser.add_argument("--paragraph-chars", type=int, default=120, help="每个段落的大致字数")
+    parser.add_argument("--paragraphs-per-image", type=int, default=3, help="每隔几个段落插入一个 <IMAGE> 标记")
+    parser.add_argument("--keep-rate-limits", action="store_true", help="保留 rate_limiter 的默认配额（默认不限流）")
+    parser.add_argument("--seed", type=int, default=0, help="延迟取样的随机种子")
+    parser.add_argument("--output", help="把完整结果（含各阶段的分位数）写入该 JSON 文件")
+    parser.add_argument("--verbose", action="store_true", help="输出流程日志")
+    parser.add_argument("--child", type=int, help=argparse.SUPPRESS)
+    return parser
+
+def main(argv: Optional[List[str]] = None):
+    argv = list(sys.argv[1:] if argv is None else argv)
+    args = build_parser().parse_args(argv)
+
+    if args.child is not None:
+        with tempfile.TemporaryDirectory(prefix="bench_pipeline_") as work_dir:
+            os.chdir(work_dir)
+            result = run_single(args.child, args)
+            os.chdir(REPO_ROOT)
+        print(json.dumps(result, ensure_ascii=False))
+        return
+
+    sizes = [int(size) for size in args.sizes.split(",") if size.strip()]
+    print(f"基准测试参数: max_workers={args.max_workers}, 文生图={args.image_mode}, 流式={args.stream_article}, "
+          f"延迟缩放={args.time_scale}, 图片={args.image_kb}KB, 文章延迟={args.article_latency}, 文生图延迟={args.image_latency}")
+    results = []
+    for num_articles in sizes:
+        print(f"--- 正在运行 N={num_articles} ... ---", flush=True)
+        results.append(_run_child(num_articles, args, argv))
+    print(_format_report(results))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"arguments": {k: str(v) for k, v in vars(args).items() if k != "child"}, "results": results}, f, ensure_ascii=False, indent=2)
+        print(f"完整结果已写入 {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,243 @@
+# dashscope_client.py
+# 对 DashScope SDK 调用的统一封装：所有文本生成和文生图请求都经过这里，以便统一限流、控制并发、重试和熔断。
+
+import time
+import asyncio
+import dashscope
+from http import HTTPStatus
+from typing import Any, Awaitable, Callable, Iterator, List, Tuple, Union
+
+from rate_limiter import get_rate_limiter
+from adaptive_concurrency import get_concurrency_limiter
+from resilience import get_resilience, classify_response
+from usage_accounting import record_usage
+from hedged_requests import is_hedge_request
+
+ENDPOINT_GENERATION = "generation"
+ENDPOINT_IMAGE_SYNTHESIS = "image_synthesis"
+
+# 较新版本的 SDK 提供基于 aiohttp 的 AioGeneration，可以在不占用线程的情况下等待响应；
+# 旧版本没有该类时，退回到在线程池中执行同步调用。
+AioGeneration = getattr(dashscope, 'AioGeneration', None)
+
+# --- 辅助函数：粗略估算请求的输入令牌数 ---
+def estimate_tokens(messages: Union[List[dict], str, None]) -> int:
+    """
+    在拿到响应之前无法知道真实的令牌数，这里按字符数粗略估算（中文大约一个字一个令牌），
+    响应返回后再用 usage 中的实际值修正限流器。
+    """
+    if not messages:
+        return 0
+    if isinstance(messages, str):
+        return len(messages)
+    return sum(len(m.get('content', '')) for m in messages)
+
+def _usage_total_tokens(response: Any) -> int:
+    usage = getattr(response, 'usage', None)
+    if not usage:
+        return 0
+    try:
+        total = usage.get('total_tokens') if isinstance(usage, dict) else getattr(usage, 'total_tokens', None)
+        if total is None:
+            total = (usage.get('input_tokens', 0) + usage.get('output_tokens', 0)) if isinstance(usage, dict) else \
+                (getattr(usage, 'input_tokens', 0) or 0) + (getattr(usage, 'output_tokens', 0) or 0)
+        return int(total or 0)
+    except (TypeError, ValueError, KeyError, AttributeError):
+        return 0
+
+def _usage_tokens(response: Any) -> Tuple[int, int]:
+    """响应中的 (输入令牌数, 输出令牌数)，没有 usage 时为 (0, 0)。"""
+    usage = getattr(response, 'usage', None)
+    if not usage:
+        return 0, 0
+    try:
+        if isinstance(usage, dict):
+            return int(usage.get('input_tokens', 0) or 0), int(usage.get('output_tokens', 0) or 0)
+        return int(getattr(usage, 'input_tokens', 0) or 0), int(getattr(usage, 'output_tokens', 0) or 0)
+    except (TypeError, ValueError, KeyError, AttributeError):
+        return 0, 0
+
+def _record_generation_usage(model: str, response: Any):
+    if response is not None:
+        record_usage(model, *_usage_tokens(response))
+
+def _record_image_usage(model: str, response: Any, submitted: int = 0):
+    """
+    同步调用按返回的图片数计；异步任务在提交成功时按提交的图片数 submitted 计
+    （任务最终失败时可能不收费，因此统计结果偏保守）。
+    """
+    if getattr(response, 'status_code', None) != HTTPStatus.OK or not response.output:
+        return
+    images = submitted or len(getattr(response.output, 'results', None) or [])
+    if images:
+        record_usage(model, images=images)
+
+# --- 辅助函数：在自适应并发名额内执行一次 SDK 调用 ---
+def _call_with_slot(endpoint: str, model: str, func: Callable[[], Any]) -> Any:
+    """
+    占用 endpoint:model 的一个并发名额执行 func，并把耗时和是否被限流反馈给自适应并发控制。
+    对冲请求不占用名额，也不反馈（其数量由 hedged_requests 单独限制）。
+    """
+    if is_hedge_request():
+        return func()
+    adaptive_limit = get_concurrency_limiter().get(endpoint, model)
+    adaptive_limit.acquire()
+    start = time.monotonic()
+    response = None
+    try:
+        response = func()
+        return response
+    finally:
+        if response is None:
+            adaptive_limit.release()
+        else:
+            adaptive_limit.release_for_response(response, time.monotonic() - start)
+
+async def _call_with_slot_async(endpoint: str, model: str, func: Callable[[], Awaitable[Any]]) -> Any:
+    if is_hedge_request():
+        return await func()
+    adaptive_limit = get_concurrency_limiter().get(endpoint, model)
+    await adaptive_limit.acquire_async()
+    start = time.monotonic()
+    response = None
+    try:
+        response = await func()
+        return response
+    finally:
+        if response is None:
+            adaptive_limit.release()
+        else:
+            adaptive_limit.release_for_response(response, time.monotonic() - start)
+
+# --- 函数：文本生成 ---
+def call_generation(model: str, **kwargs) -> Any:
+    """
+    经过限流器调用 dashscope.Generation.call，参数与 SDK 保持一致。
+    限流、服务端错误和网络异常按 resilience 中的策略重试（每次重试都重新经过限流器）。
+    """
+    limiter = get_rate_limiter()
+    estimated_tokens = estimate_tokens(kwargs.get('messages') or kwargs.get('prompt'))
+
+    def _attempt():
+        limiter.acquire(ENDPOINT_GENERATION, model, tokens=estimated_tokens)
+        response = _call_with_slot(ENDPOINT_GENERATION, model, lambda: dashscope.Generation.call(model=model, **kwargs))
+        limiter.record_tokens(ENDPOINT_GENERATION, model, estimated_tokens, _usage_total_tokens(response))
+        _record_generation_usage(model, response)
+        return response
+    return get_resilience().call(ENDPOINT_GENERATION, _attempt)
+
+# --- 函数：流式文本生成 ---
+def call_generation_stream(model: str, **kwargs) -> Iterator[Any]:
+    """
+    经过限流器以流式方式调用 dashscope.Generation.call，逐个产出响应分片。
+    参数与 SDK 保持一致（stream=True 由本函数设置）；流结束后用最后一个分片中的 usage 修正限流器。
+    只有第一个分片就失败时才会重试；已经产出内容后中途出错不再重试，由调用方处理。
+    整个流式响应期间占用一个并发名额。
+    """
+    limiter = get_rate_limiter()
+    estimated_tokens = estimate_tokens(kwargs.get('messages') or kwargs.get('prompt'))
+    adaptive_limit = get_concurrency_limiter().get(ENDPOINT_GENERATION, model)
+
+    def _open_stream():
+        limiter.acquire(ENDPOINT_GENERATION, model, tokens=estimated_tokens)
+        adaptive_limit.acquire()
+        start = time.monotonic()
+        try:
+            stream = iter(dashscope.Generation.call(model=model, stream=True, **kwargs))
+            first_chunk = next(stream, None)
+        except Exception:
+            adaptive_limit.release()
+            raise
+        if first_chunk is None or classify_response(first_chunk):
+            adaptive_limit.release_for_response(first_chunk, time.monotonic() - start)
+            _record_generation_usage(model, first_chunk)
+            return first_chunk, None, start
+        return first_chunk, stream, start
+    first_chunk, stream, start = get_resilience().call(
+        ENDPOINT_GENERATION, _open_stream, check=lambda opened: classify_response(opened[0])
+    )
+    if first_chunk is None:
+        return
+    if stream is None:
+        yield first_chunk
+        return
+    last_chunk = first_chunk
+    completed = False
+    try:
+        yield first_chunk
+        for chunk in stream:
+            last_chunk = chunk
+            yield chunk
+        completed = True
+    finally:
+        adaptive_limit.release(time.monotonic() - start if completed else None)
+    limiter.record_tokens(ENDPOINT_GENERATION, model, estimated_tokens, _usage_total_tokens(last_chunk))
+    _record_generation_usage(model, last_chunk)
+
+# --- 函数：文生图 ---
+def call_image_synthesis(model: str, **kwargs) -> Any:
+    """
+    经过限流器调用 dashscope.ImageSynthesis.call，参数与 SDK 保持一致，失败时按 resilience 中的策略重试。
+    """
+    def _attempt():
+        get_rate_limiter().acquire(ENDPOINT_IMAGE_SYNTHESIS, model)
+        response = _call_with_slot(ENDPOINT_IMAGE_SYNTHESIS, model, lambda: dashscope.ImageSynthesis.call(model=model, **kwargs))
+        _record_image_usage(model, response)
+        return response
+    return get_resilience().call(ENDPOINT_IMAGE_SYNTHESIS, _attempt)
+
+# --- 函数：异步提交文生图任务 ---
+def submit_image_synthesis(model: str, **kwargs) -> Any:
+    """
+    经过限流器调用 dashscope.ImageSynthesis.async_call，只提交任务并立即返回（响应中带 task_id）。
+    """
+    def _attempt():
+        get_rate_limiter().acquire(ENDPOINT_IMAGE_SYNTHESIS, model)
+        response = _call_with_slot(ENDPOINT_IMAGE_SYNTHESIS, model, lambda: dashscope.ImageSynthesis.async_call(model=model, **kwargs))
+        _record_image_usage(model, response, submitted=kwargs.get('n', 1))
+        return response
+    return get_resilience().call(ENDPOINT_IMAGE_SYNTHESIS, _attempt)
+
+# --- 函数：查询文生图任务状态 ---
+def fetch_image_synthesis_task(task_id: str) -> Any:
+    """
+    查询异步文生图任务的当前状态。查询接口不占用文生图的提交配额，因此不经过限流器；
+    查询失败时轮询方会在下一轮再次查询，这里也不重试。
+    """
+    return dashscope.ImageSynthesis.fetch(task_id)
+
+# --- asyncio 版本的调用封装 ---
+async def call_generation_async(model: str, **kwargs) -> Any:
+    """
+    call_generation 的 asyncio 版本：限流等待不阻塞事件循环，优先使用 SDK 的 AioGeneration。
+    """
+    limiter = get_rate_limiter()
+    estimated_tokens = estimate_tokens(kwargs.get('messages') or kwargs.get('prompt'))
+
+    async def _attempt():
+        await limiter.acquire_async(ENDPOINT_GENERATION, model, tokens=estimated_tokens)
+        if AioGeneration is not None:
+            response = await _call_with_slot_async(ENDPOINT_GENERATION, model, lambda: AioGeneration.call(model=model, **kwargs))
+        else:
+            response = await _call_with_slot_async(
+                ENDPOINT_GENERATION, model, lambda: asyncio.to_thread(dashscope.Generation.call, model=model, **kwargs)
+            )
+        limiter.record_tokens(ENDPOINT_GENERATION, model, estimated_tokens, _usage_total_tokens(response))
+        _record_generation_usage(model, response)
+        return response
+    return await get_resilience().call_async(ENDPOINT_GENERATION, _attempt)
+
+async def submit_image_synthesis_async(model: str, **kwargs) -> Any:
+    """submit_image_synthesis 的 asyncio 版本。提交请求本身很快，在线程池中执行。"""
+    async def _attempt():
+        await get_rate_limiter().acquire_async(ENDPOINT_IMAGE_SYNTHESIS, model)
+        response = await _call_with_slot_async(
+            ENDPOINT_IMAGE_SYNTHESIS, model, lambda: asyncio.to_thread(dashscope.ImageSynthesis.async_call, model=model, **kwargs)
+        )
+        _record_image_usage(model, response, submitted=kwargs.get('n', 1))
+        return response
+    return await get_resilience().call_async(ENDPOINT_IMAGE_SYNTHESIS, _attempt)
+
+async def fetch_image_synthesis_task_async(task_id: str) -> Any:
+    """fetch_image_synthesis_task 的 asyncio 版本。"""
+    return await asyncio.to_thread(dashscope.ImageSynthesis.fetch, task_id)
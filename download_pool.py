@@ -0,0 +1,123 @@
+# download_pool.py
+# 图片下载共用的 HTTP 连接池：同一进程内所有下载复用 keep-alive 连接，避免每张图片都重新进行 TCP+TLS 握手；
+# 所有请求都带有连接/读取超时，单个卡住的下载不会拖住整个批量任务。
+
+import os
+import time
+import threading
+import requests
+from contextlib import contextmanager
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+# 超时（秒）和默认连接池大小，可通过环境变量调整
+DOWNLOAD_CONNECT_TIMEOUT = float(os.environ.get("IMAGE_DOWNLOAD_CONNECT_TIMEOUT", "5"))
+DOWNLOAD_READ_TIMEOUT = float(os.environ.get("IMAGE_DOWNLOAD_READ_TIMEOUT", "60"))
+DEFAULT_POOL_SIZE = int(os.environ.get("IMAGE_DOWNLOAD_POOL_SIZE", "10"))
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+
+class DownloadStats:
+    """累计下载次数、失败次数、字节数和耗时，线程安全。"""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.downloads = 0
+        self.failures = 0
+        self.total_bytes = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+
+    def record(self, num_bytes: int, seconds: float):
+        with self._lock:
+            self.downloads += 1
+            self.total_bytes += num_bytes
+            self.total_seconds += seconds
+            self.max_seconds = max(self.max_seconds, seconds)
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "downloads": self.downloads,
+                "failures": self.failures,
+                "bytes": self.total_bytes,
+                "avg_seconds": round(self.total_seconds / self.downloads, 3) if self.downloads else 0.0,
+                "max_seconds": round(self.max_seconds, 3),
+                "avg_kb_per_second": round(self.total_bytes / 1024 / self.total_seconds, 1) if self.total_seconds else 0.0,
+            }
+
+class DownloadPool:
+    """
+    包装一个共享的 requests.Session。连接池大小应不小于同时下载的线程数，
+    否则多出的线程拿不到空闲连接，只能新建连接并在用完后丢弃。
+    """
+    def __init__(self, pool_size: int = DEFAULT_POOL_SIZE,
+                 connect_timeout: float = DOWNLOAD_CONNECT_TIMEOUT, read_timeout: float = DOWNLOAD_READ_TIMEOUT):
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.stats = DownloadStats()
+        self.pool_size = 0
+        self._lock = threading.Lock()
+        self._session = requests.Session()
+        self.ensure_pool_size(pool_size)
+
+    def ensure_pool_size(self, pool_size: int):
+        """需要时扩大连接池（只增不减）。替换适配器后，旧适配器中的空闲连接会被丢弃。"""
+        with self._lock:
+            if pool_size <= self.pool_size:
+                return
+            # 只重试建立连接失败（请求尚未发出），读取超时和错误状态码不重试，不会重复已经开始传输的请求
+            retries = Retry(total=2, connect=2, read=0, status=0)
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, max_retries=retries)
+            self._session.mount("https://", adapter)
+            self._session.mount("http://", adapter)
+            self.pool_size = pool_size
+            print(f"--- 日志: 图片下载连接池大小已调整为 {pool_size}。---")
+
+    @contextmanager
+    def stream(self, url: str, chunk_size: int = DOWNLOAD_CHUNK_SIZE) -> Iterator[Tuple[Iterator[bytes], str]]:
+        """
+        以流式方式下载，在 with 块中产出 (数据块迭代器, Content-Type)，不在内存中保留完整内容。
+        数据块必须在 with 块内读完；退出 with 块时记录本次下载的字节数和耗时。
+
+        Raises:
+            requests.exceptions.RequestException: 连接失败、超时或状态码异常时抛出（包括读取数据块期间）。
+        """
+        start = time.monotonic()
+        received_bytes = 0
+        try:
+            with self._session.get(url, stream=True, timeout=(self.connect_timeout, self.read_timeout)) as response:
+                response.raise_for_status()
+
+                def _chunks() -> Iterator[bytes]:
+                    nonlocal received_bytes
+                    for chunk in response.iter_content(chunk_size=chunk_size):
+                        received_bytes += len(chunk)
+                        yield chunk
+
+                yield _chunks(), response.headers.get('Content-Type', 'image/png')
+        except requests.exceptions.RequestException:
+            self.stats.record_failure()
+            raise
+        self.stats.record(received_bytes, time.monotonic() - start)
+
+_download_pool: Optional[DownloadPool] = None
+_download_pool_lock = threading.Lock()
+
+def get_download_pool(pool_size: Optional[int] = None) -> DownloadPool:
+    """
+    获取进程内共享的下载连接池。
+
+    Args:
+        pool_size (Optional[int]): 预计同时下载的线程数；传入时连接池至少扩大到这个大小。
+    """
+    global _download_pool
+    with _download_pool_lock:
+        if _download_pool is None:
+            _download_pool = DownloadPool(max(DEFAULT_POOL_SIZE, pool_size or 0))
+    if pool_size:
+        _download_pool.ensure_pool_size(pool_size)
+    return _download_pool
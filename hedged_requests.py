@@ -0,0 +1,244 @@
+# hedged_requests.py
+# 对冲请求：一个请求的耗时超过近期延迟的某个百分位时，再发出一个相同的请求，采用先成功返回的结果。
+# 用于生成图片提示词这类短小、幂等的 LLM 调用，削掉偶发的长尾延迟（通常约 1 秒，偶尔 20 秒以上）。
+# 对冲请求会产生额外的调用费用，因此对冲次数受 HEDGE_MAX_RATE 限制。
+# 对冲请求不占用 adaptive_concurrency 的并发名额（也不参与其调整），同时在途的对冲请求数由 HEDGE_MAX_IN_FLIGHT 单独限制。
+#
+# 通过环境变量配置：IMAGE_PROMPT_HEDGING=1 开启；IMAGE_PROMPT_HEDGE_PERCENTILE、IMAGE_PROMPT_HEDGE_MAX_RATE、
+# IMAGE_PROMPT_HEDGE_MAX_IN_FLIGHT 调整参数。
+
+import os
+import time
+import asyncio
+import threading
+import contextvars
+from collections import deque
+from http import HTTPStatus
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional
+
+from resilience import RetryBudget
+from usage_accounting import submit_in_context
+
+HEDGING_ENABLED = os.environ.get("IMAGE_PROMPT_HEDGING", "0").lower() in ("1", "true", "yes")
+HEDGE_PERCENTILE = float(os.environ.get("IMAGE_PROMPT_HEDGE_PERCENTILE", "95")) # 超过近期延迟的这个百分位时发出对冲请求
+HEDGE_MAX_RATE = float(os.environ.get("IMAGE_PROMPT_HEDGE_MAX_RATE", "0.1")) # 对冲请求数最多占请求总数的比例
+HEDGE_MAX_IN_FLIGHT = int(os.environ.get("IMAGE_PROMPT_HEDGE_MAX_IN_FLIGHT", "4")) # 每个 Hedger 同时在途的对冲请求数上限
+HEDGE_MIN_DELAY = 0.5 # 对冲前至少等待的秒数
+HEDGE_DEFAULT_DELAY = 5.0 # 延迟样本不足时使用的等待秒数
+HEDGE_MIN_SAMPLES = 20
+HEDGE_LATENCY_WINDOW = 200 # 计算百分位时使用的最近样本数
+# 同步版本的主请求和对冲请求各有一个线程池，等待方只负责取先返回的结果；
+# 对冲请求不会排在主请求之后，对冲等待时间从主请求真正开始执行时算起
+HEDGE_WORKERS = 64
+
+# --- 近期延迟统计 ---
+class LatencyWindow:
+    """保存最近 HEDGE_LATENCY_WINDOW 个请求的耗时，用于计算百分位。"""
+    def __init__(self, size: int = HEDGE_LATENCY_WINDOW):
+        self._samples: Deque[float] = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def record(self, latency: float):
+        with self._lock:
+            self._samples.append(latency)
+
+    def percentile(self, percentile: float) -> Optional[float]:
+        """样本不足 HEDGE_MIN_SAMPLES 个时返回 None。"""
+        with self._lock:
+            if len(self._samples) < HEDGE_MIN_SAMPLES:
+                return None
+            ordered = sorted(self._samples)
+        index = min(len(ordered) - 1, int(len(ordered) * percentile / 100))
+        return ordered[index]
+
+def _is_success(response: Any) -> bool:
+    return getattr(response, "status_code", None) == HTTPStatus.OK
+
+# 当前调用是否为对冲请求；dashscope_client 据此不为其占用自适应并发名额
+_hedge_request: contextvars.ContextVar[bool] = contextvars.ContextVar("hedge_request", default=False)
+
+def is_hedge_request() -> bool:
+    return _hedge_request.get()
+
+def _as_hedge(func: Callable[[], Any]) -> Callable[[], Any]:
+    # 在 submit_in_context / asyncio 任务的上下文副本中执行，标记只作用于对冲请求本身
+    def _run():
+        _hedge_request.set(True)
+        return func()
+    return _run
+
+_primary_executor: Optional[ThreadPoolExecutor] = None
+_hedge_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+def _get_primary_executor() -> ThreadPoolExecutor:
+    global _primary_executor
+    with _executor_lock:
+        if _primary_executor is None:
+            _primary_executor = ThreadPoolExecutor(max_workers=HEDGE_WORKERS, thread_name_prefix="hedge-primary")
+        return _primary_executor
+
+def _get_hedge_executor() -> ThreadPoolExecutor:
+    global _hedge_executor
+    with _executor_lock:
+        if _hedge_executor is None:
+            _hedge_executor = ThreadPoolExecutor(max_workers=HEDGE_WORKERS, thread_name_prefix="hedge")
+        return _hedge_executor
+
+# --- 对冲执行器 ---
+class Hedger:
+    """
+    同一类请求共用一个 Hedger（共享延迟统计、对冲额度和统计数据）。
+    对冲额度复用 resilience.RetryBudget：每个请求存入 HEDGE_MAX_RATE 个额度，每次对冲取出 1 个；
+    此外同时在途的对冲请求不超过 max_in_flight 个。对冲请求不占用自适应并发名额，只受这两项限制。
+    """
+    def __init__(self, name: str, enabled: bool = HEDGING_ENABLED, percentile: float = HEDGE_PERCENTILE, max_rate: float = HEDGE_MAX_RATE,
+                 max_in_flight: int = HEDGE_MAX_IN_FLIGHT):
+        self.name = name
+        self.enabled = enabled
+        self.percentile = percentile
+        self.latencies = LatencyWindow()
+        self._budget = RetryBudget(ratio=max_rate, capacity=5.0)
+        self._in_flight = threading.BoundedSemaphore(max(1, max_in_flight))
+        self._stats = {"calls": 0, "hedged": 0, "hedge_won": 0, "primary_won": 0, "rate_limited": 0}
+        self._lock = threading.Lock()
+
+    def _count(self, key: str):
+        with self._lock:
+            self._stats[key] += 1
+
+    def hedge_delay(self) -> float:
+        """主请求发出后等待多久再发对冲请求。"""
+        delay = self.latencies.percentile(self.percentile)
+        return HEDGE_DEFAULT_DELAY if delay is None else max(HEDGE_MIN_DELAY, delay)
+
+    def _timed(self, func: Callable[[], Any], started: Optional[threading.Event] = None) -> Callable[[], Any]:
+        def _run():
+            if started is not None:
+                started.set()
+            start = time.monotonic()
+            result = func()
+            self.latencies.record(time.monotonic() - start)
+            return result
+        return _run
+
+    def _try_start_hedge(self) -> bool:
+        """取得对冲名额后必须在对冲请求结束时调用 _finish_hedge。"""
+        if not self._in_flight.acquire(blocking=False):
+            self._count("rate_limited")
+            return False
+        if self._budget.try_withdraw():
+            self._count("hedged")
+            return True
+        self._in_flight.release()
+        self._count("rate_limited")
+        return False
+
+    def _finish_hedge(self, _future: Any = None):
+        self._in_flight.release()
+
+    def call(self, func: Callable[[], Any]) -> Any:
+        """
+        执行 func（必须可以安全地重复调用），返回先成功的结果；两个请求都失败时返回主请求的结果（或抛出其异常）。
+        未开启对冲时直接调用 func。
+        同步版本无法取消落后的请求：它会在后台线程中执行完（照常产生费用），结果被丢弃；
+        落后的对冲请求执行完之前一直占用对冲名额。
+        """
+        if not self.enabled:
+            return func()
+        self._count("calls")
+        self._budget.deposit()
+        started = threading.Event()
+        primary = submit_in_context(_get_primary_executor(), self._timed(func, started))
+        # 主请求在线程池中排队的时间不计入等待，否则负载高时请求还没开始就被对冲
+        started.wait()
+        done, _ = wait([primary], timeout=self.hedge_delay())
+        if done or not self._try_start_hedge():
+            return primary.result()
+
+        print(f"--- 日志: {self.name} 请求超过 {self.hedge_delay():.1f} 秒未返回，发出对冲请求。---")
+        hedge = submit_in_context(_get_hedge_executor(), _as_hedge(self._timed(func)))
+        hedge.add_done_callback(self._finish_hedge)
+        pending = {primary, hedge}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None and _is_success(future.result()):
+                    self._count("hedge_won" if future is hedge else "primary_won")
+                    return future.result()
+        return primary.result()
+
+    async def call_async(self, func: Callable[[], Awaitable[Any]]) -> Any:
+        """call 的 asyncio 版本：func 每次调用返回一个新的协程，落后的请求会被取消（不会在后台执行完）。"""
+        if not self.enabled:
+            return await func()
+        self._count("calls")
+        self._budget.deposit()
+        primary = asyncio.ensure_future(self._timed_async(func))
+        done, _ = await asyncio.wait([primary], timeout=self.hedge_delay())
+        if done or not self._try_start_hedge():
+            return await primary
+
+        print(f"--- 日志: {self.name} 请求超过 {self.hedge_delay():.1f} 秒未返回，发出对冲请求 (async)。---")
+        hedge = asyncio.ensure_future(self._timed_hedge_async(func))
+        hedge.add_done_callback(self._finish_hedge)
+        pending = {primary, hedge}
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None and _is_success(task.result()):
+                        self._count("hedge_won" if task is hedge else "primary_won")
+                        return task.result()
+            return primary.result()
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def _timed_async(self, func: Callable[[], Awaitable[Any]]) -> Any:
+        start = time.monotonic()
+        result = await func()
+        self.latencies.record(time.monotonic() - start)
+        return result
+
+    async def _timed_hedge_async(self, func: Callable[[], Awaitable[Any]]) -> Any:
+        # 在对冲任务自己的上下文副本中设置标记
+        _hedge_request.set(True)
+        return await self._timed_async(func)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+        stats["enabled"] = self.enabled
+        stats["hedge_delay"] = round(self.hedge_delay(), 2)
+        stats["hedge_win_rate"] = round(stats["hedge_won"] / stats["hedged"], 2) if stats["hedged"] else None
+        return stats
+
+# --- 进程级的对冲执行器注册表 ---
+_hedgers: Dict[str, Hedger] = {}
+_hedgers_lock = threading.Lock()
+
+def get_hedger(name: str) -> Hedger:
+    """按名称获取进程内共享的 Hedger（首次调用时按环境变量中的配置创建）。"""
+    with _hedgers_lock:
+        if name not in _hedgers:
+            _hedgers[name] = Hedger(name, enabled=HEDGING_ENABLED, percentile=HEDGE_PERCENTILE)
+        return _hedgers[name]
+
+def configure_hedging(enabled: Optional[bool] = None, percentile: Optional[float] = None):
+    """修改所有 Hedger（包括之后创建的）的开关和百分位。"""
+    global HEDGING_ENABLED, HEDGE_PERCENTILE
+    with _hedgers_lock:
+        if enabled is not None:
+            HEDGING_ENABLED = enabled
+        if percentile is not None:
+            HEDGE_PERCENTILE = percentile
+        for hedger in _hedgers.values():
+            hedger.enabled = HEDGING_ENABLED
+            hedger.percentile = HEDGE_PERCENTILE
+
+def hedging_stats() -> Dict[str, Dict[str, Any]]:
+    with _hedgers_lock:
+        hedgers = list(_hedgers.values())
+    return {hedger.name: hedger.stats() for hedger in hedgers}
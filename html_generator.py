@@ -1,60 +1,112 @@
 from string import Template
 import os
-import markdown 
+import threading
+import itertools
+import markdown
+from typing import Dict, Iterable, Iterator, Tuple
 
-def generate_html_page(article_title: str, article_elements: list, output_filename: str = "generated_article.html", status_callback=None):
-    if status_callback:
-        status_callback.update(label=f"🌐 正在生成 HTML 页面: {output_filename}...", state="running")
+from image_assets import rebase_asset_reference
+
+TEMPLATE_FILE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "templates", "article_template.html")
+_CONTENT_PLACEHOLDER = "\0article_content\0" # 模板替换时先占位，再从这里把页面切成前后两段
+
+# Markdown 实例不是线程安全的，每个线程复用自己的实例，每次转换前 reset
+_markdown_local = threading.local()
+
+# --- 函数：把 Markdown 文本转换为 HTML（复用转换器） ---
+def markdown_to_html(text: str) -> str:
+    """与 markdown.markdown(text) 结果相同，但不会为每个段落新建一个 Markdown 实例。"""
+    converter = getattr(_markdown_local, "converter", None)
+    if converter is None:
+        converter = _markdown_local.converter = markdown.Markdown()
+    return converter.reset().convert(text)
+
+# 解析后的模板，按 (路径, 修改时间) 缓存，模板文件被修改后自动重新读取
+_template_cache: Dict[Tuple[str, float], Template] = {}
+_template_cache_lock = threading.Lock()
+
+def _load_template(template_file_path: str) -> Template:
+    """
+    Raises:
+        FileNotFoundError: 模板文件不存在时抛出。
+    """
+    cache_key = (template_file_path, os.path.getmtime(template_file_path))
+    with _template_cache_lock:
+        template = _template_cache.get(cache_key)
+        if template is None:
+            with open(template_file_path, "r", encoding="utf-8") as f:
+                template = Template(f.read())
+            _template_cache[cache_key] = template
+        return template
+
+# --- 函数：把模板切成正文之前和之后的两段 ---
+def render_template_parts(article_title: str, template_file_path: str = TEMPLATE_FILE_PATH) -> Tuple[str, str]:
+    """
+    正文不参与模板替换，调用方依次写出 head、正文各部分和 tail，避免把整篇正文拼成一个大字符串。
+
+    Raises:
+        FileNotFoundError: 模板文件不存在时抛出。
+    """
+    page = _load_template(template_file_path).substitute(
+        article_title=article_title,
+        article_content=_CONTENT_PLACEHOLDER
+    )
+    head, tail = page.split(_CONTENT_PLACEHOLDER, 1)
+    return head, tail
+
+# --- 函数：把一组 HTML 片段写入文件 ---
+def write_html_parts(output_filename: str, parts: Iterable[str]):
+    """逐段写出，Base64 图片数据直接写入文件，不会被复制进更大的字符串。"""
+    with open(output_filename, "w", encoding="utf-8") as f:
+        for part in parts:
+            f.write(part)
 
-    article_body_html = ""
-    image_counter = 0 
+def _strip_paragraph_tag(parsed_content: str) -> str:
+    parsed_content = parsed_content.strip()
+    if parsed_content.startswith('<p>') and parsed_content.endswith('</p>'):
+        parsed_content = parsed_content[3:-4].strip()
+    return parsed_content
 
+def _iter_article_body_parts(article_elements: list, output_dir: str) -> Iterator[str]:
+    image_counter = 0
     for item in article_elements:
         if item['type'] == 'paragraph':
-            parsed_paragraph_content = markdown.markdown(item['content']).strip()
-            if parsed_paragraph_content.startswith('<p>') and parsed_paragraph_content.endswith('</p>'):
-                parsed_paragraph_content = parsed_paragraph_content[3:-4].strip()
-            
-            article_body_html += f"    <p>{parsed_paragraph_content}</p>\n"
-            
+            yield f"    <p>{_strip_paragraph_tag(markdown_to_html(item['content']))}</p>\n"
+
         elif item['type'] == 'heading':
-            parsed_heading_content = markdown.markdown(item['content']).strip()
-            if parsed_heading_content.startswith('<p>') and parsed_heading_content.endswith('</p>'):
-                parsed_heading_content = parsed_heading_content[3:-4].strip()
-
-            article_body_html += f"    <h3>{parsed_heading_content}</h3>\n"
-        
-        elif item['type'] == 'image': 
-            image_counter += 1 
-            if 'base64_image_data' in item and item['base64_image_data']:
-                article_body_html += f"""
-    <div class="image-container">
-        <img src="{item['base64_image_data']}" alt="文章配图 {image_counter}">
+            yield f"    <h3>{_strip_paragraph_tag(markdown_to_html(item['content']))}</h3>\n"
+
+        elif item['type'] == 'image':
+            image_counter += 1
+            if item.get('image_path'):
+                # external 模式：引用图片文件，路径按 HTML 实际写入的目录换算
+                image_src = rebase_asset_reference(item['image_path'], output_dir)
+                image_attrs = ' loading="lazy"'
+            else:
+                image_src = item.get('base64_image_data')
+                image_attrs = ""
+            if image_src:
+                yield '\n    <div class="image-container">\n        <img src="'
+                yield image_src
+                yield f"""" alt="文章配图 {image_counter}"{image_attrs}>
         <div class="image-caption">图 {image_counter}</div>
     </div>
-""" 
+"""
 
-    script_dir = os.path.dirname(os.path.abspath(__file__))
-    template_file_path = os.path.join(script_dir, "templates", "article_template.html")
+def generate_html_page(article_title: str, article_elements: list, output_filename: str = "generated_article.html", status_callback=None):
+    if status_callback:
+        status_callback.update(label=f"🌐 正在生成 HTML 页面: {output_filename}...", state="running")
 
     try:
-        with open(template_file_path, "r", encoding="utf-8") as f:
-            template_string = f.read()
+        head, tail = render_template_parts(article_title)
     except FileNotFoundError:
-        error_msg = f"❌ 错误: 模板文件 '{template_file_path}' 未找到。请确保它位于正确的位置。"
+        error_msg = f"❌ 错误: 模板文件 '{TEMPLATE_FILE_PATH}' 未找到。请确保它位于正确的位置。"
         if status_callback:
             status_callback.update(label=error_msg, state="error")
         print(error_msg)
         return
-    
-    template = Template(template_string)
 
-    html_content = template.substitute(
-        article_title=article_title,
-        article_content=article_body_html
-    )
-    
-    with open(output_filename, "w", encoding="utf-8") as f:
-        f.write(html_content)
+    body_parts = _iter_article_body_parts(article_elements, os.path.dirname(output_filename))
+    write_html_parts(output_filename, itertools.chain([head], body_parts, [tail]))
     if status_callback:
-        status_callback.update(label=f"✅ HTML 页面已生成到: {output_filename}", state="running")
\ No newline at end of file
+        status_callback.update(label=f"✅ HTML 页面已生成到: {output_filename}", state="running")
@@ -0,0 +1,122 @@
+# image_assets.py
+# 外部图片文件输出：图片以内容哈希命名保存为 generated_images/<sha256>.<扩展名>，
+# HTML 和结果 JSON 只记录相对路径，不再内嵌 Base64。相同内容的图片只保存一份。
+
+import os
+import uuid
+import shutil
+import hashlib
+from typing import Optional
+
+from image_encoding import detect_image_type, MAGIC_BYTES_NEEDED, ENCODE_CHUNK_SIZE
+
+IMAGE_ASSET_PATH = "generated_images"
+# HTML 页面和结果 JSON 所在的目录，图片引用路径相对于这个目录计算
+ASSET_REFERENCE_BASE = "generated_output"
+
+IMAGE_OUTPUT_MODES = ("inline", "external") # inline: Base64 内嵌，单文件可移植；external: 引用图片文件
+
+_EXTENSIONS = {"image/jpeg": "jpg", "image/png": "png", "image/webp": "webp", "image/gif": "gif", "image/bmp": "bmp"}
+
+# --- 函数：校验图片输出方式 ---
+def resolve_image_output_mode(image_output_mode: Optional[str]) -> str:
+    """
+    为空时使用 "inline"。
+
+    Raises:
+        ValueError: image_output_mode 不是 IMAGE_OUTPUT_MODES 之一时抛出。
+    """
+    image_output_mode = image_output_mode or "inline"
+    if image_output_mode not in IMAGE_OUTPUT_MODES:
+        raise ValueError(f"不支持的图片输出方式: {image_output_mode}，可选值: {IMAGE_OUTPUT_MODES}")
+    return image_output_mode
+
+# --- 函数：计算图片文件相对于 HTML/JSON 目录的引用路径 ---
+def asset_reference(filename: str) -> str:
+    """例如 'ab12....jpg' -> '../generated_images/ab12....jpg'（始终使用 / 分隔，便于在 HTML 中使用）。"""
+    return os.path.relpath(os.path.join(IMAGE_ASSET_PATH, filename), ASSET_REFERENCE_BASE).replace(os.sep, "/")
+
+# --- 函数：由引用路径得到图片文件路径 ---
+def asset_file_path(image_path: str) -> str:
+    """asset_reference 的逆运算，例如 '../generated_images/ab12....jpg' -> 'generated_images/ab12....jpg'。"""
+    return os.path.normpath(os.path.join(ASSET_REFERENCE_BASE, image_path))
+
+class ImageAssetWriter:
+    """
+    边接收图片数据块边写入临时文件并计算 SHA-256，finish 时按内容哈希重命名。
+    用法：writer.write(chunk) ... ；path = writer.finish(fallback_content_type)。
+    """
+    def __init__(self, asset_dir: str = IMAGE_ASSET_PATH):
+        self.asset_dir = asset_dir
+        os.makedirs(asset_dir, exist_ok=True)
+        self._tmp_path = os.path.join(asset_dir, f"{uuid.uuid4().hex}.tmp")
+        self._file = open(self._tmp_path, "wb")
+        self._sha256 = hashlib.sha256()
+        self._header = b""
+        self.bytes_written = 0
+        self.content_type: Optional[str] = None
+        self.final_path: Optional[str] = None
+
+    def write(self, chunk: bytes):
+        if len(self._header) < MAGIC_BYTES_NEEDED:
+            self._header += chunk[:MAGIC_BYTES_NEEDED - len(self._header)]
+        self._sha256.update(chunk)
+        self._file.write(chunk)
+        self.bytes_written += len(chunk)
+
+    def finish(self, fallback_content_type: Optional[str] = "image/png") -> str:
+        """
+        Returns:
+            str: 图片相对于 HTML/JSON 目录的引用路径。
+        """
+        self._file.close()
+        self.content_type = detect_image_type(self._header) or (fallback_content_type or "image/png").split(";")[0].strip()
+        filename = f"{self._sha256.hexdigest()}.{_EXTENSIONS.get(self.content_type, 'png')}"
+        self.final_path = os.path.join(self.asset_dir, filename)
+        if os.path.exists(self.final_path):
+            # 相同内容的图片已经存在，丢弃这一份
+            os.remove(self._tmp_path)
+        else:
+            os.replace(self._tmp_path, self.final_path)
+        return asset_reference(filename)
+
+    def abort(self):
+        """写入失败时调用，删除临时文件。"""
+        self._file.close()
+        if os.path.exists(self._tmp_path):
+            os.remove(self._tmp_path)
+
+# --- 函数：把已有的本地图片文件（例如图片缓存中的文件）保存为外部图片 ---
+def save_image_asset_from_file(source_path: str, fallback_content_type: Optional[str] = "image/png") -> str:
+    """
+    读取 source_path 计算内容哈希，目标文件不存在时优先创建硬链接（不额外占用磁盘），不支持时复制。
+
+    Returns:
+        str: 图片相对于 HTML/JSON 目录的引用路径。
+    """
+    sha256 = hashlib.sha256()
+    with open(source_path, "rb") as f:
+        header = f.read(MAGIC_BYTES_NEEDED)
+        sha256.update(header)
+        for chunk in iter(lambda: f.read(ENCODE_CHUNK_SIZE), b""):
+            sha256.update(chunk)
+    content_type = detect_image_type(header) or (fallback_content_type or "image/png").split(";")[0].strip()
+    filename = f"{sha256.hexdigest()}.{_EXTENSIONS.get(content_type, 'png')}"
+    final_path = os.path.join(IMAGE_ASSET_PATH, filename)
+    if not os.path.exists(final_path):
+        os.makedirs(IMAGE_ASSET_PATH, exist_ok=True)
+        link_or_copy(source_path, final_path)
+    return asset_reference(filename)
+
+# --- 函数：把图片引用路径换算为相对于另一个输出目录的路径 ---
+def rebase_asset_reference(image_path: str, output_dir: str) -> str:
+    """image_path 是相对于 ASSET_REFERENCE_BASE 的路径；HTML 写到其他目录时需要换算。"""
+    absolute_path = os.path.normpath(os.path.join(os.path.abspath(ASSET_REFERENCE_BASE), image_path))
+    return os.path.relpath(absolute_path, os.path.abspath(output_dir or ".")).replace(os.sep, "/")
+
+def link_or_copy(source_path: str, target_path: str):
+    """优先创建硬链接（不额外占用磁盘），文件系统不支持时复制。"""
+    try:
+        os.link(source_path, target_path)
+    except OSError:
+        shutil.copyfile(source_path, target_path)
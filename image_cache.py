@@ -0,0 +1,179 @@
+# image_cache.py
+# 生成图片的磁盘缓存：以 (规范化提示词, 文生图模型, 图片尺寸) 为键，把图片字节保存在 generated_images/ 下，
+# 再次遇到相同的提示词和模型时直接复用，省去文生图调用和下载。缓存总大小超过上限时按最近最少使用淘汰。
+
+import os
+import atexit
+import re
+import json
+import time
+import uuid
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+IMAGE_CACHE_PATH = "generated_images"
+IMAGE_CACHE_INDEX_FILENAME = "image_cache_index.json"
+# 缓存总大小上限（MB），可通过环境变量 IMAGE_CACHE_MAX_MB 调整
+IMAGE_CACHE_MAX_BYTES = int(os.environ.get("IMAGE_CACHE_MAX_MB", "1024")) * 1024 * 1024
+# 命中只更新内存中的访问时间，距上次写索引超过这个间隔（秒）时才顺带写盘；批量任务结束和进程退出时也会写盘
+IMAGE_CACHE_FLUSH_INTERVAL = float(os.environ.get("IMAGE_CACHE_FLUSH_INTERVAL", "60"))
+
+_EXTENSIONS = {"image/jpeg": "jpg", "image/png": "png", "image/webp": "webp", "image/gif": "gif", "image/bmp": "bmp"}
+
+def normalize_prompt(prompt: str) -> str:
+    """去掉首尾空白、合并连续空白并转为小写，使仅有格式差异的提示词命中同一缓存项。"""
+    return re.sub(r'\s+', ' ', prompt.strip()).lower()
+
+class ImageCache:
+    """
+    线程安全的图片字节缓存。索引（键 -> 文件名、大小、类型、最近访问时间）保存在缓存目录下的 JSON 文件中，
+    进程重启后仍然有效。新增和淘汰条目时立即写索引；命中时只更新内存中的访问时间，由 flush 或下一次写索引时保存。
+    """
+    def __init__(self, cache_dir: str = IMAGE_CACHE_PATH, max_bytes: int = IMAGE_CACHE_MAX_BYTES,
+                 flush_interval: float = IMAGE_CACHE_FLUSH_INTERVAL):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.flush_interval = flush_interval
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._dirty = False # 内存中有尚未写盘的访问时间
+        self._last_save = time.monotonic()
+        self._index_path = os.path.join(cache_dir, IMAGE_CACHE_INDEX_FILENAME)
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        os.makedirs(cache_dir, exist_ok=True)
+        self._load_index()
+
+    @staticmethod
+    def make_key(prompt: str, image_model: str, size: str) -> str:
+        raw = f"{normalize_prompt(prompt)}\n{image_model}\n{size}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    # --- 索引读写 ---
+    def _load_index(self):
+        if not os.path.exists(self._index_path):
+            return
+        try:
+            with open(self._index_path, "r", encoding="utf-8") as f:
+                entries = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"--- 日志: ⚠️ 图片缓存索引读取失败，将重新建立索引。{e} ---")
+            return
+        # 按最近访问时间从旧到新排列，便于 LRU 淘汰
+        for key, entry in sorted(entries.items(), key=lambda item: item[1].get("last_access", 0)):
+            if os.path.exists(os.path.join(self.cache_dir, entry["filename"])):
+                self._entries[key] = entry
+
+    def _save_index_locked(self):
+        tmp_path = f"{self._index_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self._entries, f, ensure_ascii=False)
+        os.replace(tmp_path, self._index_path)
+        self._dirty = False
+        self._last_save = time.monotonic()
+
+    def flush(self):
+        """把内存中更新过的访问时间写入索引文件；没有变化时什么也不做。"""
+        with self._lock:
+            if self._dirty:
+                self._save_index_locked()
+
+    # --- 查询与写入 ---
+    def get_path(self, prompt: str, image_model: str, size: str) -> Optional[Tuple[str, str, Optional[str]]]:
+        """
+        查找缓存的图片，返回文件路径而不读取内容，调用方可以按需流式读取。
+
+        Returns:
+            Optional[Tuple[str, str, Optional[str]]]: (图片文件路径, Content-Type, 原始图片URL)，未命中时返回 None。
+        """
+        if not prompt:
+            return None
+        key = self.make_key(prompt, image_model, size)
+        with self._lock:
+            entry = self._entries.get(key)
+            file_path = os.path.join(self.cache_dir, entry["filename"]) if entry else None
+            if entry is None or not os.path.exists(file_path):
+                # 文件被外部删除，视为未命中
+                self._entries.pop(key, None)
+                self.misses += 1
+                return None
+            entry["last_access"] = time.time()
+            self._entries.move_to_end(key)
+            self.hits += 1
+            self._dirty = True
+            if time.monotonic() - self._last_save >= self.flush_interval:
+                self._save_index_locked()
+        return file_path, entry["content_type"], entry.get("source_url")
+
+    def new_temp_path(self) -> str:
+        """返回缓存目录下的一个临时文件路径，供调用方边下载边写入，写完后交给 put_file。"""
+        return os.path.join(self.cache_dir, f"{uuid.uuid4().hex}.tmp")
+
+    def put_file(self, prompt: str, image_model: str, size: str, tmp_path: str, content_type: str, source_url: Optional[str] = None) -> Optional[str]:
+        """
+        把已经写好的临时文件移入缓存（同一目录内重命名，不复制内容），返回缓存文件路径。
+        必要时按 LRU 淘汰旧条目直到总大小不超过上限。
+        """
+        if not prompt:
+            os.remove(tmp_path)
+            return None
+        key = self.make_key(prompt, image_model, size)
+        filename = f"{key}.{_EXTENSIONS.get(content_type, 'png')}"
+        file_size = os.path.getsize(tmp_path)
+        target_path = os.path.join(self.cache_dir, filename)
+        if os.path.exists(target_path) and os.path.samefile(tmp_path, target_path):
+            # 临时文件是目标文件的硬链接时 rename 什么也不做，需要手动删除
+            os.remove(tmp_path)
+        else:
+            os.replace(tmp_path, target_path)
+        with self._lock:
+            self._entries[key] = {
+                "filename": filename,
+                "size": file_size,
+                "content_type": content_type,
+                "source_url": source_url,
+                "image_model": image_model,
+                "prompt": prompt[:200],
+                "last_access": time.time(),
+            }
+            self._entries.move_to_end(key)
+            self._evict_locked()
+            self._save_index_locked()
+        return target_path
+
+    def _evict_locked(self):
+        total_bytes = sum(entry["size"] for entry in self._entries.values())
+        while total_bytes > self.max_bytes and len(self._entries) > 1:
+            key, entry = self._entries.popitem(last=False)
+            total_bytes -= entry["size"]
+            try:
+                os.remove(os.path.join(self.cache_dir, entry["filename"]))
+            except OSError:
+                pass
+            print(f"--- 日志: 图片缓存超出上限，已淘汰 {entry['filename']} ---")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+                "entries": len(self._entries),
+                "bytes": sum(entry["size"] for entry in self._entries.values()),
+                "max_bytes": self.max_bytes,
+            }
+
+_image_cache = None
+_image_cache_lock = threading.Lock()
+
+def get_image_cache() -> ImageCache:
+    """获取进程内共享的图片缓存（首次调用时加载索引）。"""
+    global _image_cache
+    with _image_cache_lock:
+        if _image_cache is None:
+            _image_cache = ImageCache()
+            atexit.register(_image_cache.flush)
+        return _image_cache
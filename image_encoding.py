@@ -0,0 +1,122 @@
+# image_encoding.py
+# 图片的流式 Base64 编码：边读取图片数据边把编码结果写入目标（文件、列表等），
+# 不需要先把整张图片读入内存，也不会同时保留原始字节、编码字节和字符串三份拷贝。
+
+import base64
+from typing import Callable, Iterable, Optional, Tuple
+
+ENCODE_CHUNK_SIZE = 64 * 1024 # 读取文件时的分块大小，必须是 3 的倍数以免产生中间填充
+MAGIC_BYTES_NEEDED = 12 # 识别下列所有格式所需的最少字节数
+
+# --- 函数：根据文件头识别图片类型 ---
+def detect_image_type(header: bytes) -> Optional[str]:
+    """
+    根据文件开头的魔数判断图片的 MIME 类型，无法识别时返回 None。
+    对象存储返回的 Content-Type 并不总是可靠（例如 webp 图片被标为 application/octet-stream）。
+    """
+    if header.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "image/png"
+    if header.startswith(b"\xff\xd8\xff"):
+        return "image/jpeg"
+    if header[:6] in (b"GIF87a", b"GIF89a"):
+        return "image/gif"
+    if header[:4] == b"RIFF" and header[8:12] == b"WEBP":
+        return "image/webp"
+    if header.startswith(b"BM"):
+        return "image/bmp"
+    return None
+
+class Base64StreamEncoder:
+    """
+    增量 Base64 编码器。每次 feed 只编码长度为 3 的倍数的部分，余下的字节留到下一次，
+    因此分块编码结果拼接起来与一次性编码完全相同。
+    """
+    def __init__(self, write: Callable[[str], object]):
+        self._write = write
+        self._remainder = b""
+        self.bytes_in = 0
+        self.chars_out = 0
+
+    def feed(self, chunk: bytes):
+        self.bytes_in += len(chunk)
+        data = self._remainder + chunk if self._remainder else chunk
+        aligned_length = len(data) - len(data) % 3
+        self._remainder = data[aligned_length:]
+        if aligned_length:
+            self._emit(base64.b64encode(memoryview(data)[:aligned_length]))
+
+    def close(self):
+        if self._remainder:
+            self._emit(base64.b64encode(self._remainder))
+            self._remainder = b""
+
+    def _emit(self, encoded: bytes):
+        text = encoded.decode("ascii")
+        self.chars_out += len(text)
+        self._write(text)
+
+class DataUriStreamEncoder:
+    """
+    把图片数据流编码为 data URI：先凑够识别图片类型所需的文件头，写出 "data:<类型>;base64," 前缀，
+    之后逐块写出编码结果。既可以在普通循环中使用，也可以在 async for 中使用。
+    """
+    def __init__(self, write: Callable[[str], object], fallback_content_type: str = "image/png"):
+        self._write = write
+        self._fallback_content_type = fallback_content_type
+        self._header = b""
+        self._encoder: Optional[Base64StreamEncoder] = None
+        self.content_type: Optional[str] = None
+
+    def feed(self, chunk: bytes):
+        if self._encoder is not None:
+            self._encoder.feed(chunk)
+            return
+        self._header += chunk
+        if len(self._header) >= MAGIC_BYTES_NEEDED:
+            self._start()
+
+    def close(self) -> Tuple[str, int]:
+        """
+        Returns:
+            Tuple[str, int]: (识别出的 MIME 类型, 处理的原始字节数)。
+        """
+        if self._encoder is None:
+            self._start()
+        self._encoder.close()
+        return self.content_type, self._encoder.bytes_in
+
+    def _start(self):
+        self.content_type = detect_image_type(self._header) or _normalize_content_type(self._fallback_content_type)
+        self._write(f"data:{self.content_type};base64,")
+        self._encoder = Base64StreamEncoder(self._write)
+        self._encoder.feed(self._header)
+        self._header = b""
+
+# --- 函数：把图片数据流编码为 data URI 写入目标 ---
+def encode_chunks_as_data_uri(chunks: Iterable[bytes], write: Callable[[str], object], fallback_content_type: str = "image/png") -> Tuple[str, int]:
+    """
+    Args:
+        chunks (Iterable[bytes]): 按顺序到达的图片数据块。
+        write (Callable[[str], object]): 接收编码文本的函数，例如 file.write 或 list.append。
+        fallback_content_type (str): 文件头无法识别时使用的类型（通常取自响应头）。
+
+    Returns:
+        Tuple[str, int]: (识别出的 MIME 类型, 处理的原始字节数)。
+    """
+    encoder = DataUriStreamEncoder(write, fallback_content_type)
+    for chunk in chunks:
+        encoder.feed(chunk)
+    return encoder.close()
+
+def _normalize_content_type(content_type: Optional[str]) -> str:
+    # 去掉 "; charset=..." 等参数；非图片类型按 png 处理，与之前的行为一致
+    content_type = (content_type or "").split(";")[0].strip().lower()
+    return content_type if content_type.startswith("image/") else "image/png"
+
+# --- 函数：读取本地图片文件并编码为 data URI ---
+def encode_file_as_data_uri(file_path: str, fallback_content_type: str = "image/png") -> str:
+    """分块读取本地图片并返回 data URI 字符串，内存中只保留编码结果。"""
+    encoded_parts = []
+    with open(file_path, "rb") as f:
+        encode_chunks_as_data_uri(iter(lambda: f.read(ENCODE_CHUNK_SIZE), b""), encoded_parts.append, fallback_content_type)
+    return "".join(encoded_parts)
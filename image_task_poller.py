@@ -0,0 +1,114 @@
+# image_task_poller.py
+# 异步文生图任务轮询器：任务通过 ImageSynthesis.async_call 提交后，由一个后台线程统一轮询所有任务的状态，
+# 因此几十个图片任务可以同时在服务端渲染，而不必为每个任务占用一个阻塞线程。
+
+import threading
+import time
+from concurrent.futures import Future
+from http import HTTPStatus
+from typing import Dict, Optional
+
+from dashscope_client import submit_image_synthesis, fetch_image_synthesis_task
+
+TASK_FINAL_STATES = ("SUCCEEDED", "FAILED", "CANCELED", "UNKNOWN")
+
+class _PendingTask:
+    def __init__(self, task_id: str, future: Future, deadline: float):
+        self.task_id = task_id
+        self.future = future
+        self.deadline = deadline
+
+class ImageTaskPoller:
+    """
+    提交文生图任务并在后台轮询。submit() 立即返回一个 Future，任务成功时其结果为图片 URL，失败或超时时为 None。
+    """
+    def __init__(self, poll_interval: float = 2.0, task_timeout: float = 600.0):
+        self.poll_interval = poll_interval
+        self.task_timeout = task_timeout
+        self._pending: Dict[str, _PendingTask] = {}
+        self._condition = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+
+    def submit(self, prompt: str, image_model: str, size: str = '1280*720') -> Future:
+        """
+        提交一个文生图任务，返回 Future。提交失败时返回的 Future 结果为 None。
+        """
+        future = Future()
+        try:
+            rsp = submit_image_synthesis(model=image_model, prompt=prompt, n=1, size=size)
+        except Exception as e:
+            print(f"--- 日志: ❌ 提交文生图任务异常: {e} ---")
+            future.set_result(None)
+            return future
+
+        if rsp.status_code != HTTPStatus.OK or not rsp.output or not rsp.output.task_id:
+            print(f"--- 日志: ❌ 提交文生图任务失败。状态码: {rsp.status_code}, 错误码: {rsp.code}, 消息: {rsp.message} ---")
+            future.set_result(None)
+            return future
+
+        task_id = rsp.output.task_id
+        print(f"--- 日志: 文生图任务已提交，任务ID: {task_id} ---")
+        with self._condition:
+            self._pending[task_id] = _PendingTask(task_id, future, time.monotonic() + self.task_timeout)
+            self._ensure_thread()
+            self._condition.notify()
+        return future
+
+    @property
+    def pending_count(self) -> int:
+        with self._condition:
+            return len(self._pending)
+
+    def _ensure_thread(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="image-task-poller", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._pending:
+                    self._condition.wait()
+                tasks = list(self._pending.values())
+
+            for task in tasks:
+                self._poll_task(task)
+
+            time.sleep(self.poll_interval)
+
+    def _poll_task(self, task: _PendingTask):
+        image_url = None
+        finished = False
+        try:
+            rsp = fetch_image_synthesis_task(task.task_id)
+            if rsp.status_code == HTTPStatus.OK and rsp.output:
+                task_status = rsp.output.task_status
+                if task_status == "SUCCEEDED":
+                    finished = True
+                    if rsp.output.results:
+                        image_url = rsp.output.results[0].url
+                        print(f"--- 日志: 文生图任务 {task.task_id} 完成，获取到图片URL: {image_url} ---")
+                    else:
+                        print(f"--- 日志: ❌ 文生图任务 {task.task_id} 完成但未返回图片结果。---")
+                elif task_status in TASK_FINAL_STATES:
+                    finished = True
+                    print(f"--- 日志: ❌ 文生图任务 {task.task_id} 失败，状态: {task_status}, 消息: {getattr(rsp.output, 'message', '')} ---")
+            else:
+                print(f"--- 日志: ⚠️ 查询文生图任务 {task.task_id} 失败。状态码: {rsp.status_code}, 错误码: {rsp.code}, 消息: {rsp.message} ---")
+        except Exception as e:
+            print(f"--- 日志: ⚠️ 查询文生图任务 {task.task_id} 异常: {e} ---")
+
+        if not finished and time.monotonic() > task.deadline:
+            finished = True
+            print(f"--- 日志: ❌ 文生图任务 {task.task_id} 等待超时。---")
+
+        if finished:
+            with self._condition:
+                self._pending.pop(task.task_id, None)
+            task.future.set_result(image_url)
+
+_poller = ImageTaskPoller()
+
+def get_image_task_poller() -> ImageTaskPoller:
+    """获取进程内共享的文生图任务轮询器。"""
+    return _poller
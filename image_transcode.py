@@ -0,0 +1,143 @@
+# image_transcode.py
+# 图片后处理：把文生图服务返回的原图（通常是较大的 PNG）转码为 WebP/JPEG、限制最大宽度，并可生成缩略图。
+# 编码是 CPU 密集型操作，放在独立的进程池中执行，不与下载线程争抢 GIL。
+# 进程之间只传递文件路径，不传递图片字节。
+
+import os
+import uuid
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional, Tuple
+
+# Pillow 为可选依赖：未安装时跳过图片后处理，按原图输出
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+TRANSCODE_WORKERS = int(os.environ.get("IMAGE_TRANSCODE_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+TRANSCODE_FORMATS = ("webp", "jpeg")
+_CONTENT_TYPES = {"webp": "image/webp", "jpeg": "image/jpeg"}
+
+# 默认的后处理参数，调用方传入的 image_transcode 字典中缺少的键使用这里的值
+DEFAULT_TRANSCODE_OPTIONS = {
+    "format": "webp",      # "webp" 或 "jpeg"
+    "quality": 80,         # 1-100
+    "max_width": 1280,     # 超过这个宽度时按比例缩小；0 表示不限制
+    "thumbnail_width": 0,  # 大于 0 时额外生成这个宽度的缩略图
+}
+
+# --- 辅助函数：在子进程中执行的转码（必须是模块级函数才能被 pickle） ---
+def _transcode_in_worker(
+    source_path: str,
+    target_path: str,
+    image_format: str,
+    quality: int,
+    max_width: int,
+    thumbnail_path: Optional[str],
+    thumbnail_width: int
+) -> bool:
+    """
+    Returns:
+        bool: 是否缩小了图片尺寸。
+    """
+    with Image.open(source_path) as source_image:
+        source_image.load()
+        image = source_image
+        if image_format == "jpeg" and image.mode not in ("RGB", "L"):
+            # JPEG 不支持透明通道，铺在白色背景上
+            background = Image.new("RGB", image.size, (255, 255, 255))
+            rgba_image = image.convert("RGBA")
+            background.paste(rgba_image, mask=rgba_image.getchannel("A"))
+            image = background
+        elif image.mode not in ("RGB", "RGBA", "L"):
+            image = image.convert("RGBA")
+
+        resized = bool(max_width) and image.width > max_width
+        if resized:
+            image = image.resize((max_width, max(1, round(image.height * max_width / image.width))), Image.LANCZOS)
+        _save_image(image, target_path, image_format, quality)
+
+        if thumbnail_path and thumbnail_width:
+            thumbnail = image.copy()
+            thumbnail.thumbnail((thumbnail_width, thumbnail_width * 10), Image.LANCZOS)
+            _save_image(thumbnail, thumbnail_path, image_format, quality)
+    return resized
+
+def _save_image(image, target_path: str, image_format: str, quality: int):
+    if image_format == "webp":
+        image.save(target_path, "WEBP", quality=quality, method=4)
+    else:
+        image.save(target_path, "JPEG", quality=quality, optimize=True, progressive=True)
+
+_transcode_pool: Optional[ProcessPoolExecutor] = None
+_transcode_pool_lock = threading.Lock()
+
+def get_transcode_pool() -> ProcessPoolExecutor:
+    """获取进程内共享的转码进程池（首次调用时创建）。"""
+    global _transcode_pool
+    with _transcode_pool_lock:
+        if _transcode_pool is None:
+            _transcode_pool = ProcessPoolExecutor(max_workers=max(1, TRANSCODE_WORKERS))
+            print(f"--- 日志: 图片转码进程池已启动，进程数: {max(1, TRANSCODE_WORKERS)}。---")
+        return _transcode_pool
+
+# --- 函数：规范化后处理参数 ---
+def resolve_transcode_options(image_transcode: Optional[dict]) -> Optional[dict]:
+    """
+    合并默认值并校验参数；image_transcode 为空或未安装 Pillow 时返回 None（表示不做后处理）。
+
+    Raises:
+        ValueError: format 不是 TRANSCODE_FORMATS 之一时抛出。
+    """
+    if not image_transcode:
+        return None
+    if Image is None:
+        print("--- 日志: ⚠️ 未安装 Pillow，跳过图片转码和缩放。---")
+        return None
+    options = {**DEFAULT_TRANSCODE_OPTIONS, **image_transcode}
+    if options["format"] not in TRANSCODE_FORMATS:
+        raise ValueError(f"不支持的图片转码格式: {options['format']}，可选值: {TRANSCODE_FORMATS}")
+    options["quality"] = min(100, max(1, int(options["quality"])))
+    return options
+
+# --- 函数：转码一个本地图片文件 ---
+def transcode_image_file(source_path: str, options: dict, work_dir: str) -> Tuple[Optional[str], Optional[str], Optional[str]]:
+    """
+    在进程池中转码 source_path，阻塞等待结果。输出写入 work_dir 下的临时文件，由调用方使用后删除。
+
+    Args:
+        source_path (str): 原图路径（不会被修改）。
+        options (dict): resolve_transcode_options 返回的参数。
+        work_dir (str): 临时文件所在目录，应与最终保存位置在同一文件系统上。
+
+    Returns:
+        Tuple[Optional[str], Optional[str], Optional[str]]: (转码后文件路径, MIME 类型, 缩略图路径)。
+        转码失败，或者既没有缩小尺寸、文件也没有变小时，前两项为 None，调用方应继续使用原图。
+    """
+    target_path = os.path.join(work_dir, f"{uuid.uuid4().hex}.tmp")
+    thumbnail_path = os.path.join(work_dir, f"{uuid.uuid4().hex}.tmp") if options["thumbnail_width"] else None
+    try:
+        resized = get_transcode_pool().submit(
+            _transcode_in_worker, source_path, target_path, options["format"], options["quality"],
+            options["max_width"], thumbnail_path, options["thumbnail_width"]
+        ).result()
+    except Exception as e:
+        print(f"--- 日志: ⚠️ 图片转码失败，使用原图: {e} ---")
+        _remove_files(target_path, thumbnail_path)
+        return None, None, None
+
+    source_size = os.path.getsize(source_path)
+    target_size = os.path.getsize(target_path)
+    if not resized and target_size >= source_size:
+        # 原图已经足够小（例如缓存中本来就是压缩过的 JPEG），保留原图
+        _remove_files(target_path)
+        return None, None, thumbnail_path
+    print(f"--- 日志: 图片已转码为 {options['format']}: {source_size} -> {target_size} 字节。---")
+    return target_path, _CONTENT_TYPES[options["format"]], thumbnail_path
+
+def _remove_files(*paths: Optional[str]):
+    for path in paths:
+        if path and os.path.exists(path):
+            os.remove(path)
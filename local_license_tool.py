@@ -6,6 +6,8 @@ import base64
 import time
 from datetime import datetime, timedelta
 
+from dashscope_client import call_generation
+
 # !!! 重要：这个 SECRET_SEED 应该是一个复杂、随机且在你的应用分发后不会改变的字符串。
 # !!! 在实际部署中，硬编码 SECRET_SEED 存在逆向工程的风险。
 # !!! 更安全的做法是，在构建时通过环境变量或 PyInstaller 的 hooks 注入。
@@ -102,7 +104,7 @@ def check_dashscope_api_key(api_key: str) -> bool:
     dashscope.api_key = api_key # <-- 直接赋值给 dashscope.api_key
 
     try:
-        response = dashscope.Generation.call(
+        response = call_generation(
             model='qwen-turbo',
             prompt='你好',
             result_format='message'
@@ -0,0 +1,348 @@
+# pipeline_metrics.py
+# 生成流程各阶段的指标：耗时直方图、次数、失败次数和字节数。
+# 每个批量任务有一个 BatchMetrics，在 metrics_scope(batch_metrics) 内记录的指标都记到它上面，
+# 多个批量任务同时运行时互不干扰。当前的 BatchMetrics 保存在 contextvars 中：asyncio 任务和 asyncio.to_thread 会自动继承；
+# 线程池不会，提交任务时需要使用 usage_accounting.submit_in_context。不在任何批量任务中的调用直接记到进程级注册表。
+# 批量任务结束时：
+# - 把本批次的指标写成 generated_output/metrics/<任务ID>_metrics.json；
+# - 把本批次的指标累加到进程级注册表（Prometheus 计数器语义），再把累计值写成 Prometheus 文本格式文件，
+#   供 node_exporter 的 textfile collector 抓取（路径由环境变量 METRICS_TEXTFILE_PATH 指定，通常指向 collector 的目录）。
+#
+# 用法：
+#     @instrument_stage(STAGE_IMAGE_SYNTHESIS)      # 返回值为空视为失败
+#     def generate_image_from_prompt(...): ...
+#
+#     with stage_timer(STAGE_IMAGE_PROMPT) as stage:
+#         response = call_generation(...)
+#         if response.status_code != HTTPStatus.OK:
+#             stage.fail()
+
+import os
+import json
+import time
+import uuid
+import bisect
+import inspect
+import functools
+import threading
+import contextvars
+from contextlib import contextmanager
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+STAGE_TITLES = "titles"
+STAGE_ARTICLE_TEXT = "article_text"
+STAGE_IMAGE_PROMPT = "image_prompt"
+STAGE_IMAGE_SYNTHESIS = "image_synthesis"
+STAGE_DOWNLOAD = "download" # inline 模式下边下载边编码，编码耗时包含在下载中
+STAGE_ENCODE = "encode" # 对已下载的图片文件转码、编码为 data URI 或保存为外部文件
+STAGE_RENDER = "render"
+STAGE_WRITE = "write"
+STAGES = (STAGE_TITLES, STAGE_ARTICLE_TEXT, STAGE_IMAGE_PROMPT, STAGE_IMAGE_SYNTHESIS,
+          STAGE_DOWNLOAD, STAGE_ENCODE, STAGE_RENDER, STAGE_WRITE)
+
+# 直方图的桶上限（秒），覆盖从本地文件写入到文生图渲染的范围
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0, 300.0)
+
+METRICS_SAVE_PATH = os.path.join("generated_output", "metrics")
+METRICS_TEXTFILE_PATH = os.environ.get("METRICS_TEXTFILE_PATH", os.path.join(METRICS_SAVE_PATH, "article_pipeline.prom"))
+_METRIC_PREFIX = "article_pipeline"
+
+# --- 单个阶段的累计指标 ---
+class StageMetrics:
+    def __init__(self):
+        self.bucket_counts = [0] * (len(LATENCY_BUCKETS) + 1) # 最后一个桶为 +Inf
+        self.count = 0
+        self.errors = 0
+        self.total_seconds = 0.0
+        self.total_bytes = 0
+
+    def observe(self, seconds: float, error: bool, num_bytes: int):
+        self.bucket_counts[bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        self.count += 1
+        self.total_seconds += seconds
+        self.total_bytes += num_bytes
+        if error:
+            self.errors += 1
+
+    def copy(self) -> "StageMetrics":
+        duplicate = StageMetrics()
+        duplicate.bucket_counts = list(self.bucket_counts)
+        duplicate.count, duplicate.errors = self.count, self.errors
+        duplicate.total_seconds, duplicate.total_bytes = self.total_seconds, self.total_bytes
+        return duplicate
+
+    def add(self, other: "StageMetrics"):
+        self.bucket_counts = [a + b for a, b in zip(self.bucket_counts, other.bucket_counts)]
+        self.count += other.count
+        self.errors += other.errors
+        self.total_seconds += other.total_seconds
+        self.total_bytes += other.total_bytes
+
+    def minus(self, baseline: "StageMetrics") -> "StageMetrics":
+        delta = StageMetrics()
+        delta.bucket_counts = [a - b for a, b in zip(self.bucket_counts, baseline.bucket_counts)]
+        delta.count, delta.errors = self.count - baseline.count, self.errors - baseline.errors
+        delta.total_seconds = self.total_seconds - baseline.total_seconds
+        delta.total_bytes = self.total_bytes - baseline.total_bytes
+        return delta
+
+    def quantile(self, q: float) -> Optional[float]:
+        """按桶内线性插值估计分位数（与 Prometheus 的 histogram_quantile 相同）。"""
+        if not self.count:
+            return None
+        rank = q * self.count
+        cumulative = 0
+        for index, bucket_count in enumerate(self.bucket_counts):
+            if cumulative + bucket_count >= rank and bucket_count:
+                if index == len(LATENCY_BUCKETS):
+                    return LATENCY_BUCKETS[-1]
+                lower = LATENCY_BUCKETS[index - 1] if index else 0.0
+                return lower + (LATENCY_BUCKETS[index] - lower) * (rank - cumulative) / bucket_count
+            cumulative += bucket_count
+        return LATENCY_BUCKETS[-1]
+
+    def summary(self) -> Dict[str, Any]:
+        quantiles = {f"p{int(q * 100)}": self.quantile(q) for q in (0.5, 0.95, 0.99)}
+        return {
+            "count": self.count,
+            "errors": self.errors,
+            "bytes": self.total_bytes,
+            "seconds_total": round(self.total_seconds, 3),
+            "seconds_mean": round(self.total_seconds / self.count, 3) if self.count else None,
+            **{name: round(value, 3) if value is not None else None for name, value in quantiles.items()},
+        }
+
+# --- 指标注册表（进程级的注册表和每个批量任务各有一个） ---
+class MetricsRegistry:
+    def __init__(self):
+        self._stages: Dict[str, StageMetrics] = {stage: StageMetrics() for stage in STAGES}
+        self._articles: Dict[str, int] = {"success": 0, "failed": 0}
+        self._batches = 0
+        self._lock = threading.Lock()
+
+    def observe(self, stage: str, seconds: float, error: bool = False, num_bytes: int = 0):
+        with self._lock:
+            self._stages.setdefault(stage, StageMetrics()).observe(seconds, error, num_bytes)
+
+    def record_articles(self, article_results: List[Dict[str, Any]]):
+        with self._lock:
+            for article_result in article_results:
+                status = "success" if article_result.get("status") == "success" else "failed"
+                self._articles[status] += 1
+            self._batches += 1
+
+    def snapshot(self) -> Dict[str, StageMetrics]:
+        with self._lock:
+            return {stage: metrics.copy() for stage, metrics in self._stages.items()}
+
+    def merge(self, other: "MetricsRegistry"):
+        """把另一个注册表（一个批量任务）的指标累加到本注册表。"""
+        with other._lock:
+            stages = {stage: metrics.copy() for stage, metrics in other._stages.items()}
+            articles, batches = dict(other._articles), other._batches
+        with self._lock:
+            for stage, metrics in stages.items():
+                self._stages.setdefault(stage, StageMetrics()).add(metrics)
+            for status, count in articles.items():
+                self._articles[status] += count
+            self._batches += batches
+
+    def to_prometheus(self) -> str:
+        """Prometheus 文本格式（exposition format 0.0.4）。"""
+        with self._lock:
+            stages = {stage: metrics.copy() for stage, metrics in self._stages.items()}
+            articles, batches = dict(self._articles), self._batches
+        name = f"{_METRIC_PREFIX}_stage_duration_seconds"
+        lines = [f"# HELP {name} 生成流程各阶段的耗时。", f"# TYPE {name} histogram"]
+        for stage, metrics in stages.items():
+            cumulative = 0
+            for bound, bucket_count in zip(list(LATENCY_BUCKETS) + ["+Inf"], metrics.bucket_counts):
+                cumulative += bucket_count
+                lines.append(f'{name}_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+            lines.append(f'{name}_sum{{stage="{stage}"}} {metrics.total_seconds:.6f}')
+            lines.append(f'{name}_count{{stage="{stage}"}} {metrics.count}')
+        for metric, help_text, attribute in (
+            ("stage_errors_total", "各阶段失败的次数。", "errors"),
+            ("stage_bytes_total", "各阶段处理的字节数（下载、编码、写出）。", "total_bytes"),
+        ):
+            lines += [f"# HELP {_METRIC_PREFIX}_{metric} {help_text}", f"# TYPE {_METRIC_PREFIX}_{metric} counter"]
+            lines += [f'{_METRIC_PREFIX}_{metric}{{stage="{stage}"}} {getattr(metrics, attribute)}' for stage, metrics in stages.items()]
+        lines += [f"# HELP {_METRIC_PREFIX}_articles_total 处理结束的文章数。", f"# TYPE {_METRIC_PREFIX}_articles_total counter"]
+        lines += [f'{_METRIC_PREFIX}_articles_total{{status="{status}"}} {count}' for status, count in articles.items()]
+        lines += [f"# HELP {_METRIC_PREFIX}_batches_total 完成的批量任务数。", f"# TYPE {_METRIC_PREFIX}_batches_total counter",
+                  f"{_METRIC_PREFIX}_batches_total {batches}"]
+        return "\n".join(lines) + "\n"
+
+_registry = MetricsRegistry()
+
+def get_metrics() -> MetricsRegistry:
+    """获取进程内共享的指标注册表（只包含已结束的批量任务和不属于任何批量任务的调用）。"""
+    return _registry
+
+_current_batch: contextvars.ContextVar[Optional["BatchMetrics"]] = contextvars.ContextVar("batch_metrics", default=None)
+
+@contextmanager
+def metrics_scope(batch_metrics: "BatchMetrics") -> Iterator["BatchMetrics"]:
+    """在 with 块内（包括其中创建的 asyncio 任务）记录的指标都记到 batch_metrics 上。"""
+    token = _current_batch.set(batch_metrics)
+    try:
+        yield batch_metrics
+    finally:
+        _current_batch.reset(token)
+
+def _current_registry() -> MetricsRegistry:
+    batch_metrics = _current_batch.get()
+    return batch_metrics.registry if batch_metrics is not None else _registry
+
+# --- 阶段计时 ---
+class StageTimer:
+    """上下文管理器：退出时记录耗时；块内抛出异常或调用了 fail() 时计为失败。"""
+    def __init__(self, stage: str):
+        self.stage = stage
+        self.registry = _current_registry()
+        self.failed = False
+        self.num_bytes = 0
+        self._start = 0.0
+
+    def fail(self):
+        self.failed = True
+
+    def add_bytes(self, num_bytes: int):
+        self.num_bytes += num_bytes
+
+    def __enter__(self) -> "StageTimer":
+        self._start = time.monotonic()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> bool:
+        self.registry.observe(self.stage, time.monotonic() - self._start, self.failed or exc_type is not None, self.num_bytes)
+        return False
+
+def stage_timer(stage: str) -> StageTimer:
+    return StageTimer(stage)
+
+def _default_failed(result: Any) -> bool:
+    return not result
+
+def instrument_stage(
+    stage: str,
+    failed: Callable[[Any], bool] = _default_failed,
+    size: Optional[Callable[[Any], int]] = None
+) -> Callable:
+    """
+    装饰器：为普通函数、协程函数和生成器函数计时。
+    failed(返回值) 为 True 时计为失败（默认返回值为空即失败），size(返回值) 为记录的字节数。
+    生成器从第一次取值计时到迭代结束，产出的字符串按 UTF-8 字节数累计。
+    """
+    def decorator(func: Callable) -> Callable:
+        def _finish(timer: StageTimer, result: Any):
+            if failed(result):
+                timer.fail()
+            if size is not None and not timer.failed:
+                timer.add_bytes(size(result) or 0)
+
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with StageTimer(stage) as timer:
+                    result = await func(*args, **kwargs)
+                    _finish(timer, result)
+                    return result
+            return async_wrapper
+
+        if inspect.isgeneratorfunction(func):
+            @functools.wraps(func)
+            def generator_wrapper(*args, **kwargs):
+                with StageTimer(stage) as timer:
+                    for item in func(*args, **kwargs):
+                        if isinstance(item, str):
+                            timer.add_bytes(len(item.encode("utf-8")))
+                        yield item
+            return generator_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with StageTimer(stage) as timer:
+                result = func(*args, **kwargs)
+                _finish(timer, result)
+                return result
+        return wrapper
+    return decorator
+
+def observe_future(stage: str, future: Future, failed: Callable[[Any], bool] = _default_failed) -> Future:
+    """
+    从现在到 future 完成计为一次 stage 耗时（用于提交后由其他线程完成的任务），返回 future 本身。
+    完成回调在其他线程中执行，因此在提交时就确定记到哪个批量任务上。
+    """
+    registry = _current_registry()
+    start = time.monotonic()
+
+    def _record(done: Future):
+        error = done.exception() is not None or failed(done.result())
+        registry.observe(stage, time.monotonic() - start, error)
+    future.add_done_callback(_record)
+    return future
+
+def text_size(text: Optional[str]) -> int:
+    return len(text.encode("utf-8")) if text else 0
+
+def file_size(file_path: Optional[str]) -> int:
+    return os.path.getsize(file_path) if file_path and os.path.exists(file_path) else 0
+
+# --- 批量任务的指标 ---
+class BatchMetrics:
+    """一个批量任务的指标，批量任务开始时创建；处理过程需要在 metrics_scope(batch_metrics) 内进行，finish 时输出。"""
+    def __init__(self, job_id: str):
+        self.job_id = job_id
+        self.registry = MetricsRegistry()
+        self._start = time.monotonic()
+        self._started_at = time.strftime("%Y-%m-%dT%H:%M:%S")
+
+    def finish(self, article_results: List[Dict[str, Any]]) -> Optional[str]:
+        """
+        写出本批次的 JSON 汇总并刷新 Prometheus 文件；写入失败只记录日志，不影响批量任务的结果。
+
+        Returns:
+            Optional[str]: JSON 汇总文件路径，写入失败时为 None。
+        """
+        self.registry.record_articles(article_results)
+        _registry.merge(self.registry)
+        elapsed = time.monotonic() - self._start
+        success_count = sum(1 for r in article_results if r.get("status") == "success")
+        summary = {
+            "job_id": self.job_id,
+            "started_at": self._started_at,
+            "duration_seconds": round(elapsed, 3),
+            "articles": {"total": len(article_results), "success": success_count, "failed": len(article_results) - success_count},
+            "articles_per_hour": round(success_count / elapsed * 3600, 2) if elapsed > 0 else None,
+            "stages": {stage: metrics.summary() for stage, metrics in self.registry.snapshot().items()},
+        }
+        try:
+            os.makedirs(METRICS_SAVE_PATH, exist_ok=True)
+            summary_path = os.path.join(METRICS_SAVE_PATH, f"{self.job_id}_metrics.json")
+            _write_atomic(summary_path, json.dumps(summary, ensure_ascii=False, indent=2))
+            write_prometheus_textfile()
+        except OSError as e:
+            print(f"--- 日志: ⚠️ 写入流程指标失败: {e} ---")
+            return None
+        print(f"--- 日志: 本批次流程指标已写入 {summary_path}（{summary['articles_per_hour']} 篇/小时）。---")
+        return summary_path
+
+_textfile_lock = threading.Lock()
+
+def write_prometheus_textfile(file_path: str = METRICS_TEXTFILE_PATH):
+    """
+    textfile collector 可能在任意时刻读取文件，必须先写临时文件再原子替换。
+    多个批量任务同时结束时依次写入，保证最后写入的是最新的累计值。
+    """
+    os.makedirs(os.path.dirname(file_path) or ".", exist_ok=True)
+    with _textfile_lock:
+        _write_atomic(file_path, _registry.to_prometheus())
+
+def _write_atomic(file_path: str, text: str):
+    # 临时文件名不能固定，否则同时写同一个文件的调用会互相覆盖或删除对方的临时文件
+    tmp_path = f"{file_path}.{uuid.uuid4().hex}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp_path, file_path)
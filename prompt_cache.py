@@ -0,0 +1,137 @@
+# prompt_cache.py
+# 图片提示词的持久化缓存：以 (提示词模板版本, 规范化段落) 的哈希为键，保存“段落 -> 英文提示词”的翻译结果，
+# 重新运行或补图时相同段落不再调用 LLM。条目超过有效期或总数超过上限时自动淘汰。
+
+import os
+import atexit
+import re
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+PROMPT_CACHE_FILE = os.path.join("generated_output", "image_prompt_cache.json")
+# 有效期（天）和条目上限，可通过环境变量 IMAGE_PROMPT_CACHE_TTL_DAYS / IMAGE_PROMPT_CACHE_MAX_ENTRIES 调整
+PROMPT_CACHE_TTL_SECONDS = float(os.environ.get("IMAGE_PROMPT_CACHE_TTL_DAYS", "30")) * 24 * 3600
+PROMPT_CACHE_MAX_ENTRIES = int(os.environ.get("IMAGE_PROMPT_CACHE_MAX_ENTRIES", "5000"))
+# 新条目先保存在内存中，距上次写文件超过这个间隔（秒）时才写盘；批量任务结束和进程退出时也会写盘
+PROMPT_CACHE_FLUSH_INTERVAL = float(os.environ.get("IMAGE_PROMPT_CACHE_FLUSH_INTERVAL", "60"))
+
+def normalize_paragraph(paragraph: str) -> str:
+    """去掉首尾空白并合并连续空白，使仅有排版差异的段落命中同一缓存项。"""
+    return re.sub(r'\s+', ' ', paragraph.strip())
+
+class PromptCache:
+    """
+    线程安全的“段落 -> 图片提示词”缓存，按最近使用顺序淘汰，整体保存在一个 JSON 文件中。
+    写入只修改内存并标记为待保存，由 flush 或距上次保存超过 flush_interval 后的下一次写入保存。
+    """
+    def __init__(self, cache_file: str = PROMPT_CACHE_FILE, ttl_seconds: float = PROMPT_CACHE_TTL_SECONDS,
+                 max_entries: int = PROMPT_CACHE_MAX_ENTRIES, flush_interval: float = PROMPT_CACHE_FLUSH_INTERVAL):
+        self.cache_file = cache_file
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.flush_interval = flush_interval
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._dirty = False # 内存中有尚未写盘的条目
+        self._last_save = time.monotonic()
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        cache_dir = os.path.dirname(cache_file)
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+        self._load()
+
+    @staticmethod
+    def make_key(paragraph: str, template_version: str) -> str:
+        raw = f"{template_version}\n{normalize_paragraph(paragraph)}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    # --- 文件读写 ---
+    def _load(self):
+        if not os.path.exists(self.cache_file):
+            return
+        try:
+            with open(self.cache_file, "r", encoding="utf-8") as f:
+                entries = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"--- 日志: ⚠️ 图片提示词缓存读取失败，将重新建立缓存。{e} ---")
+            return
+        now = time.time()
+        for key, entry in sorted(entries.items(), key=lambda item: item[1].get("last_access", 0)):
+            if not self._is_expired(entry, now):
+                self._entries[key] = entry
+
+    def _save_locked(self):
+        tmp_path = f"{self.cache_file}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self._entries, f, ensure_ascii=False)
+        os.replace(tmp_path, self.cache_file)
+        self._dirty = False
+        self._last_save = time.monotonic()
+
+    def flush(self):
+        """把内存中的新条目写入缓存文件；没有变化时什么也不做。"""
+        with self._lock:
+            if self._dirty:
+                self._save_locked()
+
+    def _is_expired(self, entry: Dict[str, Any], now: float) -> bool:
+        return self.ttl_seconds > 0 and now - entry.get("created_at", 0) > self.ttl_seconds
+
+    # --- 查询与写入 ---
+    def get(self, paragraph: str, template_version: str) -> Optional[str]:
+        """返回缓存的英文提示词；未命中或已过期时返回 None。"""
+        key = self.make_key(paragraph, template_version)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or self._is_expired(entry, time.time()):
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            entry["last_access"] = time.time()
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry["prompt"]
+
+    def put(self, paragraph: str, template_version: str, prompt: str):
+        """保存提示词（空提示词表示生成失败，不缓存），超过条目上限时淘汰最久未使用的条目。"""
+        if not prompt:
+            return
+        now = time.time()
+        with self._lock:
+            key = self.make_key(paragraph, template_version)
+            self._entries[key] = {"prompt": prompt, "created_at": now, "last_access": now}
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._dirty = True
+            if time.monotonic() - self._last_save >= self.flush_interval:
+                self._save_locked()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+            }
+
+_prompt_cache = None
+_prompt_cache_lock = threading.Lock()
+
+def get_prompt_cache() -> PromptCache:
+    """获取进程内共享的图片提示词缓存（首次调用时从磁盘加载）。"""
+    global _prompt_cache
+    with _prompt_cache_lock:
+        if _prompt_cache is None:
+            _prompt_cache = PromptCache()
+            atexit.register(_prompt_cache.flush)
+        return _prompt_cache
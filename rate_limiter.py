@@ -0,0 +1,158 @@
+# rate_limiter.py
+# 进程级的令牌桶限流器：所有 DashScope 调用都先经过这里，按端点和模型控制请求速率与令牌速率。
+# 限流器在模块导入时创建，Streamlit 在同一服务进程内只导入一次模块，因此所有会话共享同一份配额。
+
+import os
+import asyncio
+import json
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+# --- 默认限流配置 ---
+# 键为 "端点:模型"，"端点:*" 作为该端点下未单独配置的模型的默认值。
+# rpm: 每分钟请求数；tpm: 每分钟令牌数（仅对文本生成类接口有意义，不配置则不限制）。
+# 请根据账号在 DashScope 控制台中的实际配额调整，或通过环境变量 DASHSCOPE_RATE_LIMITS（JSON）覆盖。
+DEFAULT_RATE_LIMITS = {
+    "generation:*": {"rpm": 300, "tpm": 300000},
+    "generation:qwen-turbo": {"rpm": 600, "tpm": 500000},
+    "generation:qwen-plus": {"rpm": 600, "tpm": 500000},
+    "generation:qwen-max": {"rpm": 60, "tpm": 100000},
+    "image_synthesis:*": {"rpm": 120},
+}
+
+# --- 令牌桶 ---
+class TokenBucket:
+    """
+    经典令牌桶：容量为 capacity，每秒补充 refill_rate 个令牌。
+    允许令牌数暂时为负（预约式），每个调用方在预约时即算出自己需要等待的时长，
+    因此请求按到达顺序获得配额，不会出现大请求被小请求饿死的情况。
+    """
+    def __init__(self, capacity: float, refill_rate: float):
+        self.capacity = float(capacity)
+        self.refill_rate = float(refill_rate)
+        self._tokens = float(capacity)
+        self._last_refill = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._last_refill) * self.refill_rate)
+        self._last_refill = now
+
+    def reserve(self, amount: float = 1.0) -> float:
+        """预约 amount 个令牌，返回调用方在发出请求前需要等待的秒数。"""
+        with self._lock:
+            self._refill()
+            self._tokens -= amount
+            if self._tokens >= 0:
+                return 0.0
+            return -self._tokens / self.refill_rate
+
+    def adjust(self, amount: float):
+        """在预约之后修正令牌数（amount 为正表示多消耗，为负表示退还）。"""
+        with self._lock:
+            self._refill()
+            self._tokens = min(self.capacity, self._tokens - amount)
+
+    @property
+    def available(self) -> float:
+        with self._lock:
+            self._refill()
+            return self._tokens
+
+# --- 单个端点/模型的限流器 ---
+class EndpointLimiter:
+    """组合请求数令牌桶和（可选的）令牌数令牌桶。"""
+    def __init__(self, name: str, rpm: float, tpm: Optional[float] = None):
+        self.name = name
+        self.rpm = rpm
+        self.tpm = tpm
+        self.request_bucket = TokenBucket(capacity=max(1.0, rpm / 60.0 * 5), refill_rate=rpm / 60.0)
+        self.token_bucket = TokenBucket(capacity=tpm, refill_rate=tpm / 60.0) if tpm else None
+
+    def reserve(self, tokens: int = 0) -> float:
+        wait_seconds = self.request_bucket.reserve(1)
+        if self.token_bucket and tokens:
+            wait_seconds = max(wait_seconds, self.token_bucket.reserve(tokens))
+        return wait_seconds
+
+    def acquire(self, tokens: int = 0) -> float:
+        """阻塞直到获得配额，返回实际等待的秒数。"""
+        wait_seconds = self.reserve(tokens)
+        if wait_seconds > 0:
+            time.sleep(wait_seconds)
+        return wait_seconds
+
+    async def acquire_async(self, tokens: int = 0) -> float:
+        """acquire 的 asyncio 版本：等待期间让出事件循环而不是阻塞线程。"""
+        wait_seconds = self.reserve(tokens)
+        if wait_seconds > 0:
+            await asyncio.sleep(wait_seconds)
+        return wait_seconds
+
+    def record_tokens(self, estimated_tokens: int, actual_tokens: int):
+        """用响应中的实际令牌数修正预估值。"""
+        if self.token_bucket and actual_tokens:
+            self.token_bucket.adjust(actual_tokens - estimated_tokens)
+
+# --- 进程级限流器注册表 ---
+class RateLimiterRegistry:
+    """按 "端点:模型" 懒加载并缓存 EndpointLimiter。"""
+    def __init__(self, limits: Optional[Dict[str, dict]] = None):
+        self._limits = dict(limits or DEFAULT_RATE_LIMITS)
+        self._limiters: Dict[str, EndpointLimiter] = {}
+        self._lock = threading.Lock()
+
+    def _resolve_config(self, endpoint: str, model: str) -> Tuple[str, dict]:
+        key = f"{endpoint}:{model}"
+        if key in self._limits:
+            return key, self._limits[key]
+        return key, self._limits.get(f"{endpoint}:*", {"rpm": 60})
+
+    def get(self, endpoint: str, model: str) -> EndpointLimiter:
+        with self._lock:
+            key, config = self._resolve_config(endpoint, model)
+            limiter = self._limiters.get(key)
+            if limiter is None:
+                limiter = EndpointLimiter(key, rpm=config["rpm"], tpm=config.get("tpm"))
+                self._limiters[key] = limiter
+            return limiter
+
+    def configure(self, limits: Dict[str, dict]):
+        """更新限流配置。已创建的限流器会被丢弃，下次调用时按新配置重建。"""
+        with self._lock:
+            self._limits.update(limits)
+            self._limiters.clear()
+
+    def acquire(self, endpoint: str, model: str, tokens: int = 0) -> float:
+        return self.get(endpoint, model).acquire(tokens)
+
+    async def acquire_async(self, endpoint: str, model: str, tokens: int = 0) -> float:
+        return await self.get(endpoint, model).acquire_async(tokens)
+
+    def record_tokens(self, endpoint: str, model: str, estimated_tokens: int, actual_tokens: int):
+        self.get(endpoint, model).record_tokens(estimated_tokens, actual_tokens)
+
+def _load_limits_from_env() -> Dict[str, dict]:
+    limits = dict(DEFAULT_RATE_LIMITS)
+    raw = os.environ.get("DASHSCOPE_RATE_LIMITS")
+    if raw:
+        try:
+            limits.update(json.loads(raw))
+        except ValueError as e:
+            print(f"--- 日志: ⚠️ 环境变量 DASHSCOPE_RATE_LIMITS 解析失败，使用默认限流配置。{e} ---")
+    return limits
+
+_registry = RateLimiterRegistry(_load_limits_from_env())
+
+def get_rate_limiter() -> RateLimiterRegistry:
+    """获取进程内共享的限流器注册表。"""
+    return _registry
+
+def configure_rate_limits(limits: Dict[str, dict]):
+    """
+    覆盖部分限流配置，例如：
+        configure_rate_limits({"generation:qwen-max": {"rpm": 120, "tpm": 200000}})
+    """
+    _registry.configure(limits)
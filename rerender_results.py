@@ -0,0 +1,195 @@
+# rerender_results.py
+# 离线批量重新渲染：扫描 generated_output/ 中已有的结果 JSON，重新生成所有 HTML 页面，不调用任何 API。
+# 修改文章模板或页面样式后运行即可。结果文件和模板（含渲染代码）都没有变化的页面会被跳过。
+#
+# 用法：
+#     python rerender_results.py                       # 与批量生成相同的页面样式
+#     python rerender_results.py --renderer template   # 使用 templates/article_template.html，输出 *_template.html
+#     python rerender_results.py --force --workers 8
+
+import os
+import re
+import sys
+import glob
+import json
+import time
+import hashlib
+import inspect
+import argparse
+import markdown
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Dict, List, Optional, Tuple
+
+from batch_journal import JOBS_SAVE_PATH, STAGE_IMAGES
+from results_store import load_results
+import html_generator
+import image_assets
+
+OUTPUT_SAVE_PATH = "generated_output" # 与 batch_article_generator.OUTPUT_SAVE_PATH 相同
+MANIFEST_PATH = os.path.join(OUTPUT_SAVE_PATH, "rerender_manifest.json")
+RENDERERS = ("batch", "template") # batch: convert_json_to_markdown_to_html；template: html_generator.generate_html_page
+# 两种渲染方式写入不同的文件，互不覆盖；batch 方式与批量生成写入同一个文件
+_HTML_SUFFIXES = {"batch": "with_ai_images.html", "template": "template.html"}
+_RESULTS_FILE_PATTERN = re.compile(r"^(?P<base>.+)_(?P<index>\d+)_results\.json(\.gz|\.zst)?$")
+
+# --- 辅助函数：计算文件内容的 SHA-256 ---
+def _file_sha256(file_path: str) -> str:
+    sha256 = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+# --- 辅助函数：渲染方式依赖的代码 ---
+def _renderer_sources(renderer: str) -> list:
+    """
+    html_generator（Markdown 转换、写文件）和 image_assets（图片路径换算）整个模块都算进来，
+    以免遗漏其中新增的辅助函数；batch_article_generator 和 wanxiangimg 只取与渲染有关的函数。
+    """
+    if renderer == "template":
+        return [html_generator, image_assets]
+    import batch_article_generator
+    import wanxiangimg
+    return [
+        html_generator, image_assets,
+        batch_article_generator._iter_html_parts, batch_article_generator.convert_json_to_markdown_to_html,
+        wanxiangimg.image_element_src,
+    ]
+
+# --- 函数：计算渲染方式的指纹（模板文件 + 渲染代码） ---
+def renderer_fingerprint(renderer: str) -> str:
+    """
+    batch 方式的样式写在代码里，因此把渲染代码（见 _renderer_sources）和 markdown 库的版本算进指纹；
+    template 方式还包括模板文件内容。
+    """
+    sha256 = hashlib.sha256(f"{renderer}\n{markdown.__version__}".encode("utf-8"))
+    if renderer == "template":
+        sha256.update(_file_sha256(html_generator.TEMPLATE_FILE_PATH).encode("ascii"))
+    for source in _renderer_sources(renderer):
+        sha256.update(inspect.getsource(source).encode("utf-8"))
+    return sha256.hexdigest()
+
+# --- 函数：从任务日志中找出结果文件对应的文章标题 ---
+def _titles_from_journals() -> Dict[str, str]:
+    """结果 JSON 文件名中的标题经过了截断和字符替换，任务日志中保存的是原始标题。"""
+    titles = {}
+    for journal_path in glob.glob(os.path.join(JOBS_SAVE_PATH, "*.json")):
+        try:
+            with open(journal_path, "r", encoding="utf-8") as f:
+                journal_data = json.load(f)
+        except (OSError, ValueError):
+            continue
+        for article in journal_data.get("articles", {}).values():
+            images_stage = article.get("stages", {}).get(STAGE_IMAGES)
+            if images_stage and images_stage.get("path"):
+                titles[os.path.normpath(images_stage["path"])] = article["topic"]
+    return titles
+
+# --- 函数：列出需要渲染的结果文件 ---
+def find_results_files(output_dir: str = OUTPUT_SAVE_PATH, renderer: str = "batch") -> List[Tuple[str, str, str]]:
+    """
+    Returns:
+        List[Tuple[str, str, str]]: (结果文件路径, 文章标题, HTML 输出路径)。同一篇文章有多个压缩格式时只取最新的一个。
+        HTML 输出路径取决于渲染方式。
+    """
+    journal_titles = _titles_from_journals()
+    latest_by_html: Dict[str, Tuple[float, str, str]] = {}
+    for results_path in glob.glob(os.path.join(output_dir, "*_results.json*")):
+        match = _RESULTS_FILE_PATTERN.match(os.path.basename(results_path))
+        if not match:
+            continue
+        html_path = os.path.join(output_dir, f"{match['base']}_{match['index']}_{_HTML_SUFFIXES[renderer]}")
+        title = journal_titles.get(os.path.normpath(results_path), match["base"].replace("_", " "))
+        mtime = os.path.getmtime(results_path)
+        if html_path not in latest_by_html or mtime > latest_by_html[html_path][0]:
+            latest_by_html[html_path] = (mtime, results_path, title)
+    return sorted((results_path, title, html_path) for html_path, (_, results_path, title) in latest_by_html.items())
+
+# --- 辅助函数：在子进程中渲染一个页面（必须是模块级函数才能被 pickle） ---
+def _render_one(results_path: str, title: str, html_path: str, renderer: str) -> float:
+    start = time.monotonic()
+    processed_data = load_results(results_path)
+    if renderer == "template":
+        html_generator.generate_html_page(title, processed_data, html_path)
+    else:
+        from batch_article_generator import convert_json_to_markdown_to_html
+        # convert_json_to_markdown_to_html 总是写入 generated_output/ 目录
+        convert_json_to_markdown_to_html(title, processed_data, os.path.basename(html_path))
+    return time.monotonic() - start
+
+def _load_manifest() -> Dict[str, dict]:
+    try:
+        with open(MANIFEST_PATH, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def _save_manifest(manifest: Dict[str, dict]):
+    tmp_path = f"{MANIFEST_PATH}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, MANIFEST_PATH)
+
+# --- 主函数：重新渲染所有结果文件 ---
+def rerender_all(renderer: str = "batch", workers: Optional[int] = None, force: bool = False) -> Dict[str, int]:
+    """
+    Args:
+        renderer (str): "batch" 或 "template"。
+        workers (Optional[int]): 渲染进程数，默认等于 CPU 核数。
+        force (bool): 为 True 时忽略清单，全部重新渲染。
+
+    Returns:
+        Dict[str, int]: 渲染、跳过和失败的页面数量。
+    """
+    if renderer not in RENDERERS:
+        raise ValueError(f"不支持的渲染方式: {renderer}，可选值: {RENDERERS}")
+    fingerprint = renderer_fingerprint(renderer)
+    manifest = _load_manifest()
+    summary = {"rendered": 0, "skipped": 0, "failed": 0}
+
+    pending = []
+    for results_path, title, html_path in find_results_files(renderer=renderer):
+        input_hash = _file_sha256(results_path)
+        entry = manifest.get(html_path)
+        if (not force and entry and os.path.exists(html_path) and entry.get("renderer") == renderer
+                and entry.get("input_hash") == input_hash and entry.get("template_hash") == fingerprint):
+            summary["skipped"] += 1
+            continue
+        pending.append((results_path, title, html_path, input_hash))
+    print(f"--- 日志: 共 {len(pending) + summary['skipped']} 个结果文件，需要重新渲染 {len(pending)} 个，跳过 {summary['skipped']} 个。---")
+
+    if pending:
+        start = time.monotonic()
+        with ProcessPoolExecutor(max_workers=workers or os.cpu_count() or 1) as executor:
+            futures = {
+                executor.submit(_render_one, results_path, title, html_path, renderer): (results_path, html_path, input_hash)
+                for results_path, title, html_path, input_hash in pending
+            }
+            for future in as_completed(futures):
+                results_path, html_path, input_hash = futures[future]
+                try:
+                    future.result()
+                except Exception as e:
+                    summary["failed"] += 1
+                    print(f"--- 日志: ❌ 渲染 {results_path} 失败: {e} ---")
+                    continue
+                summary["rendered"] += 1
+                manifest[html_path] = {
+                    "results_path": results_path,
+                    "input_hash": input_hash,
+                    "template_hash": fingerprint,
+                    "renderer": renderer,
+                }
+        _save_manifest(manifest)
+        print(f"--- 日志: 渲染完成，用时 {time.monotonic() - start:.2f} 秒。---")
+    print(f"--- 日志: 重新渲染统计: {summary} ---")
+    return summary
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="根据 generated_output/ 中的结果 JSON 重新生成 HTML 页面（不调用 API）。")
+    parser.add_argument("--renderer", choices=RENDERERS, default="batch", help="batch: 与批量生成相同的页面；template: 使用文章模板，输出 *_template.html。")
+    parser.add_argument("--workers", type=int, default=None, help="渲染进程数，默认等于 CPU 核数。")
+    parser.add_argument("--force", action="store_true", help="忽略清单，重新渲染全部页面。")
+    args = parser.parse_args()
+    result = rerender_all(renderer=args.renderer, workers=args.workers, force=args.force)
+    sys.exit(1 if result["failed"] else 0)
@@ -0,0 +1,358 @@
+# resilience.py
+# DashScope 调用的重试与熔断：
+# - 按错误类型选择重试策略（限流、服务端错误、网络异常），参数错误、内容审核等不重试；
+# - 指数退避加随机抖动，避免大量并发请求在同一时刻重试；
+# - 每个端点一份重试预算，重试次数不超过正常请求数的一定比例，防止故障时重试把流量放大数倍；
+# - 每个端点一个熔断器：连续失败达到阈值后暂停该端点的所有请求，冷却后只放行一个探测请求，
+#   成功即恢复；暂停超过 CIRCUIT_MAX_PAUSE_SECONDS 仍未恢复时抛出 CircuitOpenError，由批量任务停止调度。
+
+import os
+import time
+import random
+import asyncio
+import threading
+from http import HTTPStatus
+from typing import Any, Callable, Awaitable, Dict, Optional, Tuple
+
+RETRY_BUDGET_RATIO = float(os.environ.get("DASHSCOPE_RETRY_BUDGET_RATIO", "0.2")) # 每个请求为重试预算增加的额度
+RETRY_BUDGET_CAPACITY = 20.0 # 重试预算的上限（也是初始值），允许刚启动时的突发重试
+CIRCUIT_FAILURE_THRESHOLD = int(os.environ.get("CIRCUIT_FAILURE_THRESHOLD", "5")) # 连续失败多少次后熔断
+CIRCUIT_COOLDOWN_SECONDS = float(os.environ.get("CIRCUIT_COOLDOWN_SECONDS", "30")) # 第一次熔断的冷却时间，探测失败后翻倍
+CIRCUIT_MAX_COOLDOWN_SECONDS = 300.0
+CIRCUIT_MAX_PAUSE_SECONDS = float(os.environ.get("CIRCUIT_MAX_PAUSE_SECONDS", "600")) # 单个请求最多等待熔断恢复的时间
+
+# --- 重试策略 ---
+class RetryPolicy:
+    """最多尝试 max_attempts 次（含第一次），第 n 次重试前等待 base_delay * 2^(n-1)（不超过 max_delay）的一半到全部。"""
+    def __init__(self, max_attempts: int, base_delay: float, max_delay: float):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def delay(self, retry_number: int) -> float:
+        backoff = min(self.max_delay, self.base_delay * (2 ** (retry_number - 1)))
+        return backoff / 2 + random.uniform(0, backoff / 2)
+
+ERROR_THROTTLING = "throttling"
+ERROR_SERVER = "server_error"
+ERROR_NETWORK = "network"
+
+RETRY_POLICIES = {
+    ERROR_THROTTLING: RetryPolicy(max_attempts=6, base_delay=2.0, max_delay=60.0), # 配额恢复需要时间，等得更久
+    ERROR_SERVER: RetryPolicy(max_attempts=4, base_delay=1.0, max_delay=30.0),
+    ERROR_NETWORK: RetryPolicy(max_attempts=4, base_delay=1.0, max_delay=30.0),
+}
+
+# DashScope 在响应的 code 字段中给出的可重试错误码
+_THROTTLING_CODE_PREFIX = "Throttling"
+_SERVER_ERROR_CODES = {"InternalError", "InternalError.Algo", "ServiceUnavailable", "RequestTimeOut", "SystemError"}
+
+# --- 函数：判断响应/异常属于哪一类可重试错误 ---
+def classify_response(response: Any) -> Optional[str]:
+    """
+    Returns:
+        Optional[str]: ERROR_THROTTLING / ERROR_SERVER；成功或不可重试的错误（参数错误、鉴权失败、内容审核等）返回 None。
+    """
+    status_code = getattr(response, "status_code", HTTPStatus.OK)
+    if status_code == HTTPStatus.OK:
+        return None
+    code = getattr(response, "code", None) or ""
+    if status_code == HTTPStatus.TOO_MANY_REQUESTS or code.startswith(_THROTTLING_CODE_PREFIX):
+        return ERROR_THROTTLING
+    if (isinstance(status_code, int) and status_code >= 500) or code in _SERVER_ERROR_CODES:
+        return ERROR_SERVER
+    return None
+
+def classify_exception(error: BaseException) -> Optional[str]:
+    # requests 的异常都继承自 OSError（IOError）；aiohttp 的连接错误同样如此
+    if isinstance(error, (OSError, asyncio.TimeoutError)):
+        return ERROR_NETWORK
+    return None
+
+class CircuitOpenError(RuntimeError):
+    """端点熔断后在 CIRCUIT_MAX_PAUSE_SECONDS 内没有恢复。"""
+
+# --- 重试预算 ---
+class RetryBudget:
+    """每个请求存入 ratio 个额度，每次重试取出 1 个；额度用完时不再重试，直接返回失败。"""
+    def __init__(self, ratio: float = RETRY_BUDGET_RATIO, capacity: float = RETRY_BUDGET_CAPACITY):
+        self.ratio = ratio
+        self.capacity = capacity
+        self._balance = capacity
+        self._lock = threading.Lock()
+
+    def deposit(self):
+        with self._lock:
+            self._balance = min(self.capacity, self._balance + self.ratio)
+
+    def try_withdraw(self) -> bool:
+        with self._lock:
+            if self._balance < 1:
+                return False
+            self._balance -= 1
+            return True
+
+# --- 熔断器 ---
+class CircuitBreaker:
+    """
+    closed: 正常放行；open: 冷却期内所有请求等待；half_open: 冷却结束，只放行一个探测请求，其余继续等待。
+    只有可重试类的失败（限流、服务端错误、网络异常）才计入连续失败次数。
+    """
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, endpoint: str):
+        self.endpoint = endpoint
+        self.state = self.CLOSED
+        self.exhausted = False # 等待超过 CIRCUIT_MAX_PAUSE_SECONDS 后置位，之后的请求不再等待，直接失败
+        self.open_count = 0
+        self._consecutive_failures = 0
+        self._cooldown = CIRCUIT_COOLDOWN_SECONDS
+        self._open_until = 0.0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    def _admit(self, waited: float) -> Tuple[float, bool]:
+        """返回 (调用方还需等待的秒数, 本次请求是否为探测请求)，等待秒数为 0 表示可以发出请求。"""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return 0.0, False
+            now = time.monotonic()
+            if now >= self._open_until and not self._probe_in_flight:
+                self.state = self.HALF_OPEN
+                self._probe_in_flight = True
+                print(f"--- 日志: 接口 {self.endpoint} 熔断冷却结束，发出探测请求。---")
+                return 0.0, True
+            if self.exhausted or waited >= CIRCUIT_MAX_PAUSE_SECONDS:
+                self.exhausted = True
+                raise CircuitOpenError(f"接口 {self.endpoint} 持续不可用，已暂停超过 {CIRCUIT_MAX_PAUSE_SECONDS:.0f} 秒。")
+            return min(1.0, max(0.2, self._open_until - now)), False
+
+    def before_call(self) -> bool:
+        """
+        熔断期间阻塞等待，直到可以发出请求。
+
+        Returns:
+            bool: 本次请求是否为半开状态下的探测请求（调用方结束时据此决定是否需要 release）。
+        """
+        waited = 0.0
+        while True:
+            wait_seconds, is_probe = self._admit(waited)
+            if wait_seconds <= 0:
+                return is_probe
+            time.sleep(wait_seconds)
+            waited += wait_seconds
+
+    async def before_call_async(self) -> bool:
+        waited = 0.0
+        while True:
+            wait_seconds, is_probe = self._admit(waited)
+            if wait_seconds <= 0:
+                return is_probe
+            await asyncio.sleep(wait_seconds)
+            waited += wait_seconds
+
+    def record_success(self):
+        with self._lock:
+            if self.state != self.CLOSED:
+                print(f"--- 日志: ✅ 接口 {self.endpoint} 已恢复，继续处理。---")
+            self.state = self.CLOSED
+            self.exhausted = False
+            self._consecutive_failures = 0
+            self._cooldown = CIRCUIT_COOLDOWN_SECONDS
+            self._probe_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._consecutive_failures += 1
+            if self.state == self.HALF_OPEN and self._probe_in_flight:
+                # 探测失败：冷却时间翻倍后重新熔断
+                self._cooldown = min(CIRCUIT_MAX_COOLDOWN_SECONDS, self._cooldown * 2)
+                self._open_locked()
+            elif self.state == self.CLOSED and self._consecutive_failures >= CIRCUIT_FAILURE_THRESHOLD:
+                self._open_locked()
+
+    def release(self):
+        """探测请求因与服务无关的原因结束（例如代码异常）时调用，让其他请求可以继续探测。"""
+        with self._lock:
+            self._probe_in_flight = False
+
+    def reset_exhausted(self):
+        with self._lock:
+            self.exhausted = False
+
+    def _open_locked(self):
+        self.state = self.OPEN
+        self.open_count += 1
+        self._probe_in_flight = False
+        self._open_until = time.monotonic() + self._cooldown
+        print(f"--- 日志: ⏸️ 接口 {self.endpoint} 连续失败 {self._consecutive_failures} 次，"
+              f"暂停该接口的所有请求 {self._cooldown:.0f} 秒。---")
+
+    def seconds_until_probe(self) -> Optional[float]:
+        """熔断中时返回距离下一次探测的秒数，未熔断时返回 None。"""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return None
+            return max(0.0, self._open_until - time.monotonic())
+
+# --- 进程级的重试与熔断注册表 ---
+class ResilienceRegistry:
+    """按端点懒加载熔断器和重试预算，并统计重试次数。"""
+    def __init__(self):
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._budgets: Dict[str, RetryBudget] = {}
+        self._counters: Dict[str, Dict[str, int]] = {}
+        self._lock = threading.Lock()
+
+    def breaker(self, endpoint: str) -> CircuitBreaker:
+        with self._lock:
+            if endpoint not in self._breakers:
+                self._breakers[endpoint] = CircuitBreaker(endpoint)
+                self._budgets[endpoint] = RetryBudget()
+                self._counters[endpoint] = {"calls": 0, "retries": 0, "gave_up": 0, "budget_exhausted": 0}
+            return self._breakers[endpoint]
+
+    def _count(self, endpoint: str, key: str):
+        with self._lock:
+            self._counters[endpoint][key] += 1
+
+    def _start_call(self, endpoint: str) -> CircuitBreaker:
+        breaker = self.breaker(endpoint)
+        self._budgets[endpoint].deposit()
+        self._count(endpoint, "calls")
+        return breaker
+
+    def _retry_delay(self, endpoint: str, error_kind: str, attempt: int, detail: str) -> Optional[float]:
+        """第 attempt 次尝试失败后，返回重试前的等待秒数；不应再重试时返回 None。"""
+        policy = RETRY_POLICIES[error_kind]
+        if attempt >= policy.max_attempts:
+            self._count(endpoint, "gave_up")
+            print(f"--- 日志: ❌ 接口 {endpoint} 已尝试 {attempt} 次仍失败（{detail}），放弃。---")
+            return None
+        if not self._budgets[endpoint].try_withdraw():
+            self._count(endpoint, "budget_exhausted")
+            print(f"--- 日志: ⚠️ 接口 {endpoint} 重试预算已用完，不再重试（{detail}）。---")
+            return None
+        self._count(endpoint, "retries")
+        delay = policy.delay(attempt)
+        print(f"--- 日志: ⚠️ 接口 {endpoint} 请求失败（{detail}），{delay:.1f} 秒后第 {attempt} 次重试。---")
+        return delay
+
+    def _handle_outcome(self, breaker: CircuitBreaker, is_probe: bool, result: Any, error: Optional[BaseException],
+                        check: Callable[[Any], Optional[str]]) -> Optional[str]:
+        """记录一次尝试的结果，返回可重试的错误类型（不可重试或成功时返回 None）。"""
+        if error is not None:
+            error_kind = classify_exception(error)
+            if error_kind is None:
+                # 只有持有探测名额的请求才释放，否则会让另一个请求在探测进行中再发出一次探测
+                if is_probe:
+                    breaker.release()
+                return None
+        else:
+            error_kind = check(result)
+            if error_kind is None:
+                if self._is_ok(result):
+                    breaker.record_success()
+                elif is_probe:
+                    # 参数错误、内容审核等不可重试的错误不能说明服务已恢复，也不计入连续失败次数
+                    breaker.release()
+                return None
+        breaker.record_failure()
+        return error_kind
+
+    @staticmethod
+    def _is_ok(result: Any) -> bool:
+        response = result[0] if isinstance(result, tuple) else result
+        return getattr(response, "status_code", HTTPStatus.OK) == HTTPStatus.OK
+
+    @staticmethod
+    def _describe(result: Any, error: Optional[BaseException]) -> str:
+        if error is not None:
+            return f"{type(error).__name__}: {error}"
+        response = result[0] if isinstance(result, tuple) else result
+        return f"状态码 {getattr(response, 'status_code', None)}, 错误码 {getattr(response, 'code', None)}"
+
+    def call(self, endpoint: str, attempt_func: Callable[[], Any], check: Callable[[Any], Optional[str]] = classify_response) -> Any:
+        """
+        执行 attempt_func，遇到可重试的错误时按策略重试。重试用尽后返回最后一次的响应（或抛出最后一次的异常），
+        调用方原有的错误处理逻辑保持不变。
+
+        Raises:
+            CircuitOpenError: 端点熔断且在 CIRCUIT_MAX_PAUSE_SECONDS 内没有恢复。
+        """
+        breaker = self._start_call(endpoint)
+        attempt = 0
+        while True:
+            is_probe = breaker.before_call()
+            attempt += 1
+            result, error = None, None
+            try:
+                result = attempt_func()
+            except Exception as e:
+                error = e
+            error_kind = self._handle_outcome(breaker, is_probe, result, error, check)
+            delay = self._retry_delay(endpoint, error_kind, attempt, self._describe(result, error)) if error_kind else None
+            if delay is None:
+                if error is not None:
+                    raise error
+                return result
+            time.sleep(delay)
+
+    async def call_async(self, endpoint: str, attempt_func: Callable[[], Awaitable[Any]],
+                         check: Callable[[Any], Optional[str]] = classify_response) -> Any:
+        """call 的 asyncio 版本，attempt_func 每次调用返回一个新的协程。"""
+        breaker = self._start_call(endpoint)
+        attempt = 0
+        while True:
+            is_probe = await breaker.before_call_async()
+            attempt += 1
+            result, error = None, None
+            try:
+                result = await attempt_func()
+            except Exception as e:
+                error = e
+            error_kind = self._handle_outcome(breaker, is_probe, result, error, check)
+            delay = self._retry_delay(endpoint, error_kind, attempt, self._describe(result, error)) if error_kind else None
+            if delay is None:
+                if error is not None:
+                    raise error
+                return result
+            await asyncio.sleep(delay)
+
+    def open_circuits(self) -> Dict[str, float]:
+        """当前处于熔断状态的端点及距离下一次探测的秒数。"""
+        with self._lock:
+            breakers = list(self._breakers.values())
+        open_circuits = {}
+        for breaker in breakers:
+            seconds = breaker.seconds_until_probe()
+            if seconds is not None:
+                open_circuits[breaker.endpoint] = seconds
+        return open_circuits
+
+    def exhausted_endpoints(self) -> list:
+        """熔断后长时间未恢复的端点；批量任务看到非空列表时应停止调度新的文章。"""
+        with self._lock:
+            return [endpoint for endpoint, breaker in self._breakers.items() if breaker.exhausted]
+
+    def reset_exhausted(self):
+        """新的批量任务开始时调用：熔断仍然有效，但请求重新等待最多 CIRCUIT_MAX_PAUSE_SECONDS。"""
+        with self._lock:
+            breakers = list(self._breakers.values())
+        for breaker in breakers:
+            breaker.reset_exhausted()
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            return {
+                endpoint: {**counters, "circuit_state": self._breakers[endpoint].state, "circuit_opens": self._breakers[endpoint].open_count}
+                for endpoint, counters in self._counters.items()
+            }
+
+_registry = ResilienceRegistry()
+
+def get_resilience() -> ResilienceRegistry:
+    """获取进程内共享的重试与熔断注册表。"""
+    return _registry
@@ -0,0 +1,129 @@
+# results_store.py
+# 单篇文章结果 JSON（processed_data）的读写：
+# 紧凑格式不缩进，并把图片元素中的 Base64 数据替换为按内容哈希保存的图片文件，
+# 与 external 模式相同用 image_path 记录（相对于 HTML/JSON 目录，见 image_assets.asset_reference），
+# 并以 inline 标记区分原本就是 external 模式的图片；同一张图片只保存一份原始字节；可选 gzip/zstd 压缩。
+# load_results 会透明地还原 inline 图片和解压。
+
+import os
+import gzip
+import json
+import base64
+from typing import Any, Dict, List, Optional
+
+from image_assets import ImageAssetWriter, asset_file_path
+from image_encoding import encode_file_as_data_uri
+
+# zstandard 为可选依赖：未安装时选择 zstd 压缩会退回到 gzip
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+RESULTS_COMPRESSIONS = ("none", "gzip", "zstd")
+_EXTENSIONS = {"none": ".json", "gzip": ".json.gz", "zstd": ".json.zst"}
+_GZIP_MAGIC = b"\x1f\x8b"
+_ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+
+# --- 函数：根据压缩方式确定结果文件名 ---
+def results_filename(filename_base: str, compression: str = "none") -> str:
+    return filename_base + _EXTENSIONS[_effective_compression(compression)]
+
+def _effective_compression(compression: Optional[str]) -> str:
+    compression = compression or "none"
+    if compression not in RESULTS_COMPRESSIONS:
+        raise ValueError(f"不支持的结果压缩方式: {compression}，可选值: {RESULTS_COMPRESSIONS}")
+    if compression == "zstd" and zstandard is None:
+        print("--- 日志: ⚠️ 未安装 zstandard，结果文件改用 gzip 压缩。---")
+        return "gzip"
+    return compression
+
+# --- 辅助函数：把 data URI 中的图片保存为按内容哈希命名的文件 ---
+def _save_data_uri_as_asset(data_uri: str) -> Optional[str]:
+    """
+    Returns:
+        Optional[str]: 图片相对于 HTML/JSON 目录的引用路径；data URI 无法解析时返回 None。
+    """
+    header, _, payload = data_uri.partition(",")
+    if not header.startswith("data:") or ";base64" not in header:
+        return None
+    asset_writer = ImageAssetWriter()
+    try:
+        asset_writer.write(base64.b64decode(payload))
+        return asset_writer.finish(header[5:].split(";")[0])
+    except Exception:
+        asset_writer.abort()
+        raise
+
+# --- 函数：把处理后的数据转换为紧凑格式 ---
+def compact_processed_data(processed_data: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    返回新的列表（不修改传入的数据）：图片元素的 base64_image_data 被替换为 image_path（图片引用路径），
+    并标记 inline: true，load_results 据此还原为 base64_image_data。
+    """
+    compacted = []
+    for item in processed_data:
+        if item.get("type") == "image" and item.get("base64_image_data"):
+            image_path = _save_data_uri_as_asset(item["base64_image_data"])
+            if image_path:
+                item = {key: value for key, value in item.items() if key != "base64_image_data"}
+                item["image_path"] = image_path
+                item["inline"] = True
+        compacted.append(item)
+    return compacted
+
+# --- 函数：保存结果文件 ---
+def write_results(file_path: str, processed_data: List[Dict[str, Any]], compact: bool = True, compression: str = "none"):
+    """
+    Args:
+        file_path (str): 输出路径，扩展名应由 results_filename 生成。
+        processed_data (List[Dict[str, Any]]): 文章的段落和图片元素列表。
+        compact (bool): 是否使用紧凑格式（不缩进、图片改为引用）；False 时与之前的格式完全相同。
+        compression (str): "none"、"gzip" 或 "zstd"。
+    """
+    if compact:
+        text = json.dumps(compact_processed_data(processed_data), ensure_ascii=False, separators=(",", ":"))
+    else:
+        text = json.dumps(processed_data, ensure_ascii=False, indent=4)
+    data = text.encode("utf-8")
+
+    compression = _effective_compression(compression)
+    if compression == "gzip":
+        data = gzip.compress(data, compresslevel=6)
+    elif compression == "zstd":
+        data = zstandard.ZstdCompressor(level=10).compress(data)
+    with open(file_path, "wb") as f:
+        f.write(data)
+
+# --- 函数：读取结果文件 ---
+def load_results(file_path: str, resolve_images: bool = True) -> List[Dict[str, Any]]:
+    """
+    读取 write_results 保存的任意格式（包括旧版缩进格式），根据文件头自动解压。
+    resolve_images 为 True 时把紧凑格式中的 inline 图片还原为 base64_image_data，调用方无需关心文件格式；
+    external 模式的图片（没有 inline 标记）保持 image_path 不变。
+
+    Raises:
+        RuntimeError: 文件使用 zstd 压缩但未安装 zstandard 时抛出。
+    """
+    with open(file_path, "rb") as f:
+        data = f.read()
+    if data.startswith(_GZIP_MAGIC):
+        data = gzip.decompress(data)
+    elif data.startswith(_ZSTD_MAGIC):
+        if zstandard is None:
+            raise RuntimeError(f"结果文件 {file_path} 使用 zstd 压缩，需要安装 zstandard 才能读取。")
+        data = zstandard.ZstdDecompressor().decompressobj().decompress(data)
+    processed_data = json.loads(data.decode("utf-8"))
+
+    if resolve_images:
+        for item in processed_data:
+            if item.get("type") != "image" or not item.pop("inline", False):
+                continue
+            asset_path = asset_file_path(item["image_path"])
+            item["image_path"] = None # 与生成时的 inline 图片元素相同
+            if os.path.exists(asset_path):
+                item["base64_image_data"] = encode_file_as_data_uri(asset_path)
+            else:
+                print(f"--- 日志: ⚠️ 结果文件引用的图片 {asset_path} 不存在。---")
+                item["base64_image_data"] = None
+    return processed_data
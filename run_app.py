@@ -1,6 +1,7 @@
 import os
 import sys
 import logging # 导入 logging 模块，用于调试
+import multiprocessing
 
 # 尝试导入 Streamlit 的 main_run 函数
 try:
@@ -50,6 +51,9 @@ def setup_resource_dirs():
             print(f"⚠️ 目录创建失败 {full_path}: {e}")
 
 if __name__ == "__main__":
+    # 打包后的程序中，图片转码进程池启动的子进程会重新执行可执行文件，需要先交给 multiprocessing 处理
+    multiprocessing.freeze_support()
+
     # 配置日志，以便在控制台中看到 Streamlit 的内部输出
     logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
 
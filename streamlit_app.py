@@ -4,7 +4,8 @@ import sys
 import datetime
 import re
 import dashscope # 导入 DashScope SDK
-from batch_article_generator import batch_generate_articles
+from batch_article_generator import batch_generate_articles, resume_batch_job
+from batch_journal import list_batch_jobs
 from local_license_tool import verify_certificate, check_dashscope_api_key
 
 import platform # 新增导入
@@ -79,6 +80,24 @@ def open_file_directory(directory_path):
         print(f"--- 错误: 打开目录时发生未知异常: {e} ---")
 
 
+def show_article_results(article_results):
+    """以表格形式展示每篇文章的处理结果。"""
+    if not article_results:
+        return
+    st.write(f"每篇文章的处理结果（任务ID: `{article_results[0].get('job_id', '')}`）：")
+    st.table([
+        {
+            "序号": r["index"],
+            "标题": r["topic"],
+            "状态": "✅ 成功" if r["status"] == "success" else "❌ 失败",
+            "HTML 文件": os.path.basename(r["html_path"]) if r["html_path"] else "",
+            "费用（元）": f"{r['usage']['cost']:.2f}" if r.get("usage") else "",
+            "错误信息": r["error"] or "",
+        }
+        for r in article_results
+    ])
+
+
 # --- 密钥认证逻辑 ---
 
 # 初始化 session state，用于在 Streamlit 页面刷新时保持状态
@@ -203,6 +222,68 @@ else:
             help="请根据您的需求和API额度选择合适的文生图模型。"
         )
         
+        async_image_tasks = st.checkbox(
+            "以异步任务方式提交文生图",
+            value=False,
+            help="开启后图片任务提交后由后台统一轮询，大量图片可同时渲染而不占用工作线程。"
+        )
+        
+        stream_article = st.checkbox(
+            "边生成文章边配图（流式）",
+            value=False,
+            help="开启后文章以流式方式生成，每个 <IMAGE> 标记一出现就开始生成对应图片，不必等全文写完。"
+        )
+        
+        use_image_cache = st.checkbox(
+            "复用已生成的图片",
+            value=True,
+            help="相同的图片提示词和模型之前生成过图片时直接复用 generated_images/ 中的缓存，不再调用文生图接口。"
+        )
+        
+        use_prompt_cache = st.checkbox(
+            "复用已生成的图片提示词",
+            value=True,
+            help="相同段落之前生成过英文提示词时直接复用。关闭后每次都重新生成，图片会更有变化。"
+        )
+        
+        external_images = st.checkbox(
+            "图片保存为独立文件",
+            value=False,
+            help="开启后图片保存在 generated_images/ 中，HTML 和 JSON 只引用文件路径，体积更小、加载更快；关闭则把图片以 Base64 内嵌，单个 HTML 文件即可分享。"
+        )
+        
+        transcode_images = st.checkbox(
+            "压缩并缩放图片",
+            value=False,
+            help="下载后把图片转码为 WebP/JPEG 并限制最大宽度，可显著减小 HTML 页面体积（需要安装 Pillow）。"
+        )
+        image_transcode = None
+        if transcode_images:
+            image_transcode = {
+                'format': st.selectbox("图片格式", ["webp", "jpeg"]),
+                'quality': st.slider("图片质量", min_value=30, max_value=100, value=80),
+                'max_width': st.number_input("最大宽度（像素，0 表示不限制）", min_value=0, value=1280, step=160),
+                'thumbnail_width': st.number_input("缩略图宽度（像素，0 表示不生成）", min_value=0, value=0, step=80),
+            }
+        
+        results_compression = st.selectbox(
+            "结果JSON压缩方式",
+            ["none", "gzip", "zstd"],
+            help="结果 JSON 始终以紧凑格式保存（图片只引用 generated_images/ 中的文件），可以再选择压缩方式；zstd 需要安装 zstandard。"
+        )
+        
+        use_title_history = st.checkbox(
+            "避开以前生成过的标题",
+            value=True,
+            help="同一主课题下，与以前生成过的标题相似的新标题会被丢弃并重新生成（历史记录保存在 generated_output/title_index.json）。"
+        )
+        
+        budget = st.number_input(
+            "本批次费用上限（元，0 表示不限制）",
+            min_value=0.0, value=0.0, step=1.0,
+            help="按已完成文章的平均费用预估，继续处理会超过上限时不再开始新的文章。令牌和图片用量明细保存在 generated_output/<任务ID>_usage.json。"
+        )
+        
         audience = st.selectbox(
             "文章受众", 
             ["通用读者", "行业专家", "学生群体", "科技爱好者", "儿童", "老年人", "投资者", "企业管理者", "创作者"]
@@ -231,15 +312,52 @@ else:
         )
         
         delay_between_articles = st.slider(
-            "每篇文章生成之间的延迟 (秒)",
-            min_value=5,
+            "每篇文章生成之间的额外延迟 (秒)",
+            min_value=0,
             max_value=60,
-            value=15,
-            help="为了避免API调用过于频繁，建议设置延迟。"
+            value=0,
+            help="所有 API 调用已按模型配额统一限流，通常无需额外延迟。"
+        )
+
+        max_workers = st.slider(
+            "同时处理的文章数量 (并发数)",
+            min_value=1,
+            max_value=16,
+            value=1,
+            help="大于 1 时多篇文章将并发生成，每篇文章的状态会单独显示；此时不再使用上面的固定延迟。"
+                 "实际同时发出的 API 请求数会根据限流错误和响应延迟自动调整，这里可以设得大一些。"
         )
 
         submitted = st.form_submit_button("🚀 开始批量生成", type="primary")
 
+    # --- 恢复中断的批量任务 ---
+    unfinished_jobs = list_batch_jobs(unfinished_only=True)
+    resume_clicked = False
+    if unfinished_jobs:
+        with st.expander(f"♻️ 恢复中断的批量任务（{len(unfinished_jobs)} 个）"):
+            job_options = {
+                f"{job['job_id']} · {job['main_topic']}（已完成 {job['completed']}/{job['total']}）": job['job_id']
+                for job in unfinished_jobs
+            }
+            selected_job_label = st.selectbox("选择要继续的任务", list(job_options.keys()))
+            st.caption("已完成的文章和阶段会被跳过，只重试未完成的部分。")
+            resume_clicked = st.button("♻️ 继续该任务")
+
+    if resume_clicked:
+        with st.status("正在恢复任务...", expanded=True) as status_container:
+            try:
+                dashscope.api_key = st.session_state['api_key']
+                article_results = resume_batch_job(
+                    job_options[selected_job_label],
+                    status_callback=status_container,
+                    max_workers=max_workers
+                )
+                status_container.update(label="🎉 任务恢复完成！", state="complete", expanded=True)
+                show_article_results(article_results)
+            except Exception as e:
+                status_container.update(label=f"❌ 恢复任务时发生错误: {e}", state="error")
+                st.exception(e)
+
     # --- 提交表单后的处理逻辑 ---
     if submitted:
         # 再次检查 API Key 是否已设置（虽然在认证时已设置，但作为双重保障）
@@ -259,7 +377,16 @@ else:
                 'keywords': keywords,
                 'extra_requirements': extra_requirements,
                 'llm_model': selected_llm_model, 
-                'image_model': selected_image_model 
+                'image_model': selected_image_model,
+                'image_synthesis_mode': "async" if async_image_tasks else "sync",
+                'use_image_cache': use_image_cache,
+                'use_prompt_cache': use_prompt_cache,
+                'stream_article': stream_article,
+                'image_output_mode': "external" if external_images else "inline",
+                'results_compression': results_compression,
+                'image_transcode': image_transcode,
+                'use_title_history': use_title_history,
+                'budget': budget or None
             }
 
             # 使用 st.status 显示任务状态，提供实时反馈
@@ -270,16 +397,20 @@ else:
                     dashscope.api_key = st.session_state['api_key']
                     
                     # 调用核心的批量生成函数
-                    batch_generate_articles(
+                    article_results = batch_generate_articles(
                         main_topic=main_batch_topic,
                         num_articles=num_of_articles,
                         article_gen_params=article_generation_parameters,
                         delay_between_articles=delay_between_articles,
-                        status_callback=status_container
+                        status_callback=status_container,
+                        max_workers=max_workers
                     )
                     
                     # 任务完成后，更新状态为“完成”
                     status_container.update(label="🎉 所有文章生成完毕！", state="complete", expanded=True)
+
+                    # --- 展示每篇文章的处理结果 ---
+                    show_article_results(article_results)
                     
                     # --- 生成完成后，在主页面展示可点击的链接和打开目录按钮 ---
                     output_dir = os.path.join(get_base_path(), "generated_output") # 确保使用绝对路径
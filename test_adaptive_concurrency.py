@@ -0,0 +1,80 @@
+# test_adaptive_concurrency.py
+# adaptive_concurrency 的单元测试：AIMD 的加性增加、乘性减少，以及名额的占用和释放。
+
+from http import HTTPStatus
+from types import SimpleNamespace
+
+from adaptive_concurrency import AdaptiveLimit, AdaptiveConcurrencyRegistry, DECREASE_FACTOR, MIN_LATENCY_SAMPLES
+
+def _fill(adaptive_limit: AdaptiveLimit):
+    while adaptive_limit.try_acquire():
+        pass
+
+def test_try_acquire_respects_the_limit():
+    adaptive_limit = AdaptiveLimit("test", initial=2, min_limit=1, max_limit=4)
+    assert adaptive_limit.try_acquire()
+    assert adaptive_limit.try_acquire()
+    assert not adaptive_limit.try_acquire()
+    adaptive_limit.release()
+    assert adaptive_limit.in_flight == 1
+    assert adaptive_limit.try_acquire()
+
+def test_limit_grows_by_about_one_per_saturated_round():
+    adaptive_limit = AdaptiveLimit("test", initial=2, min_limit=1, max_limit=4)
+    _fill(adaptive_limit)
+    # 每个请求增加 1/上限：2 -> 2.5 -> 2.9 -> 3.24
+    for _ in range(3):
+        adaptive_limit.release(latency=1.0)
+        adaptive_limit.try_acquire()
+    assert adaptive_limit.limit == 3
+
+def test_limit_does_not_grow_when_slots_are_idle():
+    adaptive_limit = AdaptiveLimit("test", initial=2, min_limit=1, max_limit=4)
+    for _ in range(10):
+        adaptive_limit.try_acquire()
+        adaptive_limit.release(latency=1.0)
+    assert adaptive_limit.limit == 2
+
+def test_limit_never_exceeds_max():
+    adaptive_limit = AdaptiveLimit("test", initial=3, min_limit=1, max_limit=3)
+    _fill(adaptive_limit)
+    adaptive_limit.release(latency=1.0)
+    assert adaptive_limit.limit == 3
+
+def test_throttling_decreases_multiplicatively_once_per_cooldown():
+    adaptive_limit = AdaptiveLimit("test", initial=10, min_limit=1, max_limit=16)
+    adaptive_limit.try_acquire()
+    adaptive_limit.try_acquire()
+    adaptive_limit.release_for_response(SimpleNamespace(status_code=HTTPStatus.TOO_MANY_REQUESTS, code="Throttling"), 1.0)
+    assert adaptive_limit.limit == int(10 * DECREASE_FACTOR)
+    # 同一波过载中其他请求的限流错误不再重复降低
+    adaptive_limit.release(latency=1.0, throttled=True)
+    assert adaptive_limit.limit == int(10 * DECREASE_FACTOR)
+    assert adaptive_limit.decreases == 1
+
+def test_decrease_stops_at_min():
+    adaptive_limit = AdaptiveLimit("test", initial=2, min_limit=2, max_limit=8)
+    adaptive_limit.try_acquire()
+    adaptive_limit.release(throttled=True)
+    assert adaptive_limit.limit == 2
+
+def test_latency_spike_decreases_limit():
+    adaptive_limit = AdaptiveLimit("test", initial=8, min_limit=1, max_limit=16)
+    for _ in range(MIN_LATENCY_SAMPLES):
+        adaptive_limit.try_acquire()
+        adaptive_limit.release(latency=1.0)
+    assert adaptive_limit.limit == 8
+    for _ in range(5):
+        adaptive_limit.try_acquire()
+        adaptive_limit.release(latency=10.0)
+    assert adaptive_limit.limit < 8
+    assert adaptive_limit.decreases == 1
+
+def test_registry_uses_endpoint_defaults():
+    registry = AdaptiveConcurrencyRegistry({"generation:*": {"initial": 3, "min": 1, "max": 6}})
+    adaptive_limit = registry.get("generation", "qwen-plus")
+    assert adaptive_limit is registry.get("generation", "qwen-plus")
+    assert adaptive_limit.limit == 3
+    adaptive_limit.try_acquire()
+    assert registry.snapshot()["generation:qwen-plus"] == {"limit": 3, "in_flight": 1, "decreases": 0}
+    assert registry.get("image_synthesis", "wanx-v1").limit == 2
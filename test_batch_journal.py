@@ -0,0 +1,111 @@
+# test_batch_journal.py
+# batch_journal 的单元测试：阶段记录与产物检查、未完成文章的判断，以及 resume_batch_job 跳过已完成的阶段。
+
+import os
+
+import pytest
+
+import batch_journal
+from batch_journal import BatchJournal, list_batch_jobs, STAGE_CONTENT, STAGE_IMAGES, STAGE_HTML
+from results_store import write_results
+
+TITLES = ["标题一", "标题二", "标题三"]
+ARTICLE_GEN_PARAMS = {"llm_model": "qwen-plus", "image_model": "wanx-v1", "use_title_history": False}
+
+@pytest.fixture(autouse=True)
+def work_dir(tmp_path, monkeypatch):
+    # 任务日志写入 generated_output/jobs/，文章输出写入 generated_output/
+    monkeypatch.chdir(tmp_path)
+    jobs_path = os.path.join("generated_output", "jobs")
+    os.makedirs(jobs_path)
+    monkeypatch.setattr(batch_journal, "JOBS_SAVE_PATH", jobs_path)
+    return tmp_path
+
+def _new_journal() -> BatchJournal:
+    journal = BatchJournal.create("测试主课题", len(TITLES), ARTICLE_GEN_PARAMS)
+    journal.set_titles(TITLES)
+    return journal
+
+def _write_artifact(path: str, text: str = "内容") -> str:
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(text)
+    return path
+
+def test_mark_stage_is_persisted():
+    journal = _new_journal()
+    content_path = _write_artifact(os.path.join(journal.artifact_dir, "1_article.txt"))
+    journal.mark_stage(1, STAGE_CONTENT, path=content_path)
+    reloaded = BatchJournal.load(journal.job_id)
+    assert reloaded.titles == TITLES
+    assert reloaded.stage_artifacts(1, STAGE_CONTENT)["path"] == content_path
+    assert reloaded.stage_artifacts(1, STAGE_IMAGES) is None
+    assert reloaded.stage_artifacts(99, STAGE_CONTENT) is None
+
+def test_stage_artifacts_is_none_when_the_artifact_file_is_gone():
+    journal = _new_journal()
+    content_path = _write_artifact(os.path.join(journal.artifact_dir, "1_article.txt"))
+    journal.mark_stage(1, STAGE_CONTENT, path=content_path)
+    os.remove(content_path)
+    assert journal.stage_artifacts(1, STAGE_CONTENT) is None # 视为需要重做
+
+def test_unfinished_indices_and_job_listing():
+    journal = _new_journal()
+    assert journal.unfinished_indices() == [1, 2, 3]
+    journal.set_article_status(2, "success")
+    journal.set_article_status(3, "failed", "未能生成文章内容")
+    assert journal.unfinished_indices() == [1, 3]
+    assert not journal.is_finished()
+    assert [job["job_id"] for job in list_batch_jobs(unfinished_only=True)] == [journal.job_id]
+
+    journal.set_article_status(1, "success")
+    journal.set_article_status(3, "success")
+    assert journal.is_finished()
+    assert list_batch_jobs(unfinished_only=True) == []
+    assert list_batch_jobs()[0]["completed"] == 3
+
+def test_journal_without_titles_is_not_finished():
+    journal = BatchJournal.create("测试主课题", 3, ARTICLE_GEN_PARAMS)
+    assert not journal.is_finished()
+    assert journal.summary()["total"] == 3
+
+def test_resume_skips_completed_stages(monkeypatch):
+    pytest.importorskip("dashscope")
+    import batch_article_generator
+
+    journal = _new_journal()
+    # 第 1 篇已成功；第 2 篇只完成了文章内容；第 3 篇完成了内容和配图，HTML 未生成
+    journal.set_article_status(1, "success")
+    for article_index in (2, 3):
+        content_path = _write_artifact(os.path.join(journal.artifact_dir, f"{article_index}_article.txt"), f"文章{article_index}")
+        journal.mark_stage(article_index, STAGE_CONTENT, path=content_path)
+    json_path = os.path.join("generated_output", "3_results.json")
+    write_results(json_path, [{"type": "paragraph", "content": "文章3"}])
+    journal.mark_stage(3, STAGE_IMAGES, path=json_path)
+
+    image_calls, html_calls = [], []
+
+    def _no_article_content(**kwargs):
+        raise AssertionError("文章内容已在任务日志中，不应重新生成")
+
+    def _process_images(article_content, **kwargs):
+        image_calls.append(article_content)
+        return [{"type": "paragraph", "content": article_content}]
+
+    def _write_html(topic, article_index, processed_data, status_callback=None):
+        html_calls.append((article_index, processed_data[0]["content"]))
+        return _write_artifact(os.path.join("generated_output", f"{article_index}.html"))
+    monkeypatch.setattr(batch_article_generator, "generate_article_content", _no_article_content)
+    monkeypatch.setattr(batch_article_generator, "process_article_and_generate_images", _process_images)
+    monkeypatch.setattr(batch_article_generator, "_write_article_html", _write_html)
+    monkeypatch.setattr(batch_article_generator, "_flush_caches", lambda: None)
+    monkeypatch.setattr(batch_article_generator, "_log_batch_stats", lambda: None)
+
+    article_results = batch_article_generator.resume_batch_job(journal.job_id)
+    assert [(r["index"], r["status"]) for r in article_results] == [(2, "success"), (3, "success")]
+    assert image_calls == ["文章2"]
+    assert sorted(html_calls) == [(2, "文章2"), (3, "文章3")]
+
+    reloaded = BatchJournal.load(journal.job_id)
+    assert reloaded.is_finished()
+    assert reloaded.stage_artifacts(2, STAGE_HTML)["path"] == os.path.join("generated_output", "2.html")
+    assert batch_article_generator.resume_batch_job(journal.job_id) == [] # 全部完成后不再处理任何文章
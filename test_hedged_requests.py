@@ -0,0 +1,109 @@
+# test_hedged_requests.py
+# hedged_requests 的单元测试：对冲请求的触发时机、先成功的结果胜出、对冲额度和在途数量限制，以及对冲请求标记。
+
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+from types import SimpleNamespace
+
+import pytest
+
+import hedged_requests
+from hedged_requests import Hedger, is_hedge_request
+
+HEDGE_DELAY = 0.05
+
+@pytest.fixture(autouse=True)
+def short_delay(monkeypatch):
+    # 延迟样本不足时使用 HEDGE_DEFAULT_DELAY
+    monkeypatch.setattr(hedged_requests, "HEDGE_DEFAULT_DELAY", HEDGE_DELAY)
+    monkeypatch.setattr(hedged_requests, "HEDGE_MIN_DELAY", 0.0)
+
+class FakeRequest:
+    """按调用顺序返回预设的 (耗时, 状态码)，并记录每次调用是否为对冲请求。"""
+    def __init__(self, *plans):
+        self._plans = list(plans)
+        self._lock = threading.Lock()
+        self.hedge_flags = []
+
+    def _next(self):
+        with self._lock:
+            self.hedge_flags.append(is_hedge_request())
+            call_index = len(self.hedge_flags) - 1
+            return call_index, self._plans[min(call_index, len(self._plans) - 1)]
+
+    def __call__(self):
+        call_index, (seconds, status_code) = self._next()
+        time.sleep(seconds)
+        return SimpleNamespace(status_code=status_code, call_index=call_index)
+
+    async def call_async(self):
+        call_index, (seconds, status_code) = self._next()
+        await asyncio.sleep(seconds)
+        return SimpleNamespace(status_code=status_code, call_index=call_index)
+
+def test_disabled_hedger_calls_func_directly():
+    request = FakeRequest((0.0, HTTPStatus.OK))
+    assert Hedger("test", enabled=False).call(request).call_index == 0
+    assert request.hedge_flags == [False]
+
+def test_fast_primary_is_not_hedged():
+    hedger = Hedger("test", enabled=True)
+    request = FakeRequest((0.0, HTTPStatus.OK))
+    assert hedger.call(request).call_index == 0
+    assert hedger.stats()["hedged"] == 0
+
+def test_slow_primary_is_hedged_and_the_hedge_wins():
+    hedger = Hedger("test", enabled=True)
+    request = FakeRequest((1.0, HTTPStatus.OK), (0.0, HTTPStatus.OK))
+    start = time.monotonic()
+    assert hedger.call(request).call_index == 1
+    assert time.monotonic() - start < 0.5 # 不等待落后的主请求
+    assert request.hedge_flags == [False, True]
+    assert hedger.stats()["hedge_won"] == 1
+
+def test_failed_hedge_does_not_beat_a_later_successful_primary():
+    hedger = Hedger("test", enabled=True)
+    request = FakeRequest((0.3, HTTPStatus.OK), (0.0, HTTPStatus.INTERNAL_SERVER_ERROR))
+    assert hedger.call(request).call_index == 0
+    assert hedger.stats()["primary_won"] == 1
+
+def test_hedge_delay_starts_when_the_primary_starts(monkeypatch):
+    primary_executor = ThreadPoolExecutor(max_workers=1)
+    monkeypatch.setattr(hedged_requests, "_primary_executor", primary_executor)
+    primary_executor.submit(time.sleep, 0.3) # 主请求在线程池中排队
+    hedger = Hedger("test", enabled=True)
+    request = FakeRequest((0.0, HTTPStatus.OK))
+    assert hedger.call(request).call_index == 0
+    assert hedger.stats()["hedged"] == 0
+    primary_executor.shutdown()
+
+def test_hedge_budget_limits_hedges_to_max_rate():
+    hedger = Hedger("test", enabled=True, max_rate=0.0, max_in_flight=100)
+    # 初始额度为 5，之后每个请求只存入 max_rate 个
+    started = [hedger._try_start_hedge() for _ in range(7)]
+    assert started == [True] * 5 + [False] * 2
+    assert hedger.stats()["rate_limited"] == 2
+
+def test_in_flight_hedges_are_capped():
+    hedger = Hedger("test", enabled=True, max_in_flight=1)
+    assert hedger._try_start_hedge()
+    assert not hedger._try_start_hedge()
+    hedger._finish_hedge()
+    assert hedger._try_start_hedge()
+
+def test_async_hedge_wins_and_cancels_the_primary():
+    hedger = Hedger("test", enabled=True)
+    request = FakeRequest((1.0, HTTPStatus.OK), (0.0, HTTPStatus.OK))
+
+    async def _run():
+        start = time.monotonic()
+        response = await hedger.call_async(request.call_async)
+        return response, time.monotonic() - start
+    response, elapsed = asyncio.run(_run())
+    assert response.call_index == 1
+    assert elapsed < 0.5
+    assert request.hedge_flags == [False, True]
+    assert not is_hedge_request() # 标记不会泄漏到调用方
@@ -0,0 +1,102 @@
+# test_image_cache.py
+# image_cache 的单元测试：命中/未命中统计、按最近使用淘汰、索引持久化，以及访问时间的延迟写盘。
+
+import json
+import os
+
+import pytest
+
+import image_cache
+from image_cache import ImageCache, IMAGE_CACHE_INDEX_FILENAME
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self) -> float:
+        return self.now
+
+    def monotonic(self) -> float:
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake_clock = FakeClock()
+    monkeypatch.setattr(image_cache, "time", fake_clock)
+    return fake_clock
+
+def _put(cache: ImageCache, prompt: str, num_bytes: int = 100, content_type: str = "image/png") -> str:
+    tmp_path = cache.new_temp_path()
+    with open(tmp_path, "wb") as f:
+        f.write(b"x" * num_bytes)
+    return cache.put_file(prompt, "wanx-v1", "1024*1024", tmp_path, content_type, source_url=f"https://example.com/{prompt}.png")
+
+def _get(cache: ImageCache, prompt: str):
+    return cache.get_path(prompt, "wanx-v1", "1024*1024")
+
+def _index(cache: ImageCache) -> dict:
+    with open(os.path.join(cache.cache_dir, IMAGE_CACHE_INDEX_FILENAME), encoding="utf-8") as f:
+        return json.load(f)
+
+def test_hit_and_miss_counters(tmp_path, clock):
+    cache = ImageCache(str(tmp_path))
+    assert _get(cache, "a cat") is None
+    file_path = _put(cache, "a cat", content_type="image/jpeg")
+    assert file_path.endswith(".jpg")
+    # 提示词只有空白和大小写差异时命中同一条目
+    assert _get(cache, "  A   cat ") == (file_path, "image/jpeg", "https://example.com/a cat.png")
+    assert cache.get_path("a cat", "wanx-v2", "1024*1024") is None
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 2
+    assert cache.stats()["hit_rate"] == pytest.approx(0.333)
+
+def test_least_recently_used_entry_is_evicted(tmp_path, clock):
+    cache = ImageCache(str(tmp_path), max_bytes=250)
+    cat_path = _put(cache, "a cat")
+    dog_path = _put(cache, "a dog")
+    assert _get(cache, "a cat") # a dog 成为最久未使用的条目
+    _put(cache, "a bird")
+    assert _get(cache, "a dog") is None
+    assert not os.path.exists(dog_path)
+    assert os.path.exists(cat_path)
+    assert cache.stats()["bytes"] == 200
+
+def test_file_deleted_outside_the_cache_counts_as_miss(tmp_path, clock):
+    cache = ImageCache(str(tmp_path))
+    os.remove(_put(cache, "a cat"))
+    assert _get(cache, "a cat") is None
+    assert cache.stats()["entries"] == 0
+
+def test_index_is_reloaded_in_lru_order(tmp_path, clock):
+    cache = ImageCache(str(tmp_path), max_bytes=250)
+    _put(cache, "a cat")
+    clock.now += 1
+    _put(cache, "a dog")
+    clock.now += 1
+    _get(cache, "a cat")
+    cache.flush()
+
+    reloaded = ImageCache(str(tmp_path), max_bytes=250)
+    assert reloaded.stats()["entries"] == 2
+    _put(reloaded, "a bird") # 按保存的访问时间，a dog 最久未使用
+    assert _get(reloaded, "a dog") is None
+    assert _get(reloaded, "a cat")
+
+def test_hits_are_saved_only_after_flush_interval(tmp_path, clock):
+    cache = ImageCache(str(tmp_path), flush_interval=60)
+    _put(cache, "a cat")
+    saved_access = next(iter(_index(cache).values()))["last_access"]
+    clock.now += 10
+    _get(cache, "a cat")
+    assert next(iter(_index(cache).values()))["last_access"] == saved_access # 只更新了内存
+    clock.now += 60
+    _get(cache, "a cat")
+    assert next(iter(_index(cache).values()))["last_access"] == clock.now
+
+def test_flush_writes_pending_access_times(tmp_path, clock):
+    cache = ImageCache(str(tmp_path), flush_interval=60)
+    _put(cache, "a cat")
+    clock.now += 5
+    _get(cache, "a cat")
+    cache.flush()
+    assert next(iter(_index(cache).values()))["last_access"] == clock.now
@@ -0,0 +1,75 @@
+# test_image_encoding.py
+# image_encoding 的单元测试：流式 Base64 编码在任意分块下都与一次性编码结果相同，以及图片类型识别。
+
+import base64
+import os
+
+import pytest
+
+from image_encoding import (
+    Base64StreamEncoder, DataUriStreamEncoder, detect_image_type, encode_chunks_as_data_uri, encode_file_as_data_uri
+)
+
+PNG_HEADER = b"\x89PNG\r\n\x1a\n"
+
+def _data_uri(content_type: str, data: bytes) -> str:
+    return f"data:{content_type};base64,{base64.b64encode(data).decode('ascii')}"
+
+def _chunks(data: bytes, size: int):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+@pytest.mark.parametrize("length", [0, 1, 2, 3, 4, 5, 1000, 4096 + 1])
+@pytest.mark.parametrize("chunk_size", [1, 2, 3, 7, 64, 10_000])
+def test_stream_encoder_matches_b64encode(length, chunk_size):
+    data = os.urandom(length)
+    parts = []
+    encoder = Base64StreamEncoder(parts.append)
+    for chunk in _chunks(data, chunk_size):
+        encoder.feed(chunk)
+    encoder.close()
+    expected = base64.b64encode(data).decode("ascii")
+    assert "".join(parts) == expected
+    assert encoder.bytes_in == length
+    assert encoder.chars_out == len(expected)
+
+def test_stream_encoder_accepts_empty_chunks():
+    parts = []
+    encoder = Base64StreamEncoder(parts.append)
+    for chunk in (b"", b"ab", b"", b"c", b"d", b""):
+        encoder.feed(chunk)
+    encoder.close()
+    assert "".join(parts) == base64.b64encode(b"abcd").decode("ascii")
+
+def test_detect_image_type():
+    assert detect_image_type(PNG_HEADER + b"\x00" * 4) == "image/png"
+    assert detect_image_type(b"\xff\xd8\xff\xe0") == "image/jpeg"
+    assert detect_image_type(b"GIF89a") == "image/gif"
+    assert detect_image_type(b"RIFF\x00\x00\x00\x00WEBP") == "image/webp"
+    assert detect_image_type(b"BM\x00\x00") == "image/bmp"
+    assert detect_image_type(b"<html>") is None
+
+@pytest.mark.parametrize("chunk_size", [1, 5, 12, 4096])
+def test_data_uri_stream_matches_whole_body_encoding(chunk_size):
+    data = PNG_HEADER + os.urandom(5000)
+    parts = []
+    content_type, byte_count = encode_chunks_as_data_uri(_chunks(data, chunk_size), parts.append, "image/jpeg")
+    assert content_type == "image/png" # 文件头优先于响应头
+    assert byte_count == len(data)
+    assert "".join(parts) == _data_uri("image/png", data)
+
+def test_data_uri_falls_back_to_response_content_type():
+    parts = []
+    encoder = DataUriStreamEncoder(parts.append, "image/webp; charset=binary")
+    encoder.feed(b"abc") # 不足 MAGIC_BYTES_NEEDED 个字节，在 close 时才写前缀
+    assert parts == []
+    assert encoder.close() == ("image/webp", 3)
+    assert "".join(parts) == _data_uri("image/webp", b"abc")
+    parts = []
+    assert encode_chunks_as_data_uri([b"abc"], parts.append, "application/octet-stream") == ("image/png", 3)
+    assert "".join(parts) == _data_uri("image/png", b"abc")
+
+def test_encode_file_as_data_uri(tmp_path):
+    data = PNG_HEADER + os.urandom(200_000)
+    image_file = tmp_path / "image.png"
+    image_file.write_bytes(data)
+    assert encode_file_as_data_uri(str(image_file)) == _data_uri("image/png", data)
@@ -0,0 +1,110 @@
+# test_pipeline_metrics.py
+# pipeline_metrics 的单元测试：直方图分位数、按批量任务隔离的指标，以及批次结束时累加到进程级注册表。
+
+import json
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import pytest
+
+import pipeline_metrics
+from pipeline_metrics import (
+    BatchMetrics, MetricsRegistry, StageMetrics, instrument_stage, metrics_scope, observe_future, stage_timer,
+    STAGE_DOWNLOAD, STAGE_IMAGE_SYNTHESIS, STAGE_WRITE
+)
+from usage_accounting import submit_in_context
+
+@pytest.fixture
+def registry(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    process_registry = MetricsRegistry()
+    monkeypatch.setattr(pipeline_metrics, "_registry", process_registry)
+    return process_registry
+
+def test_quantile_interpolates_within_bucket():
+    metrics = StageMetrics()
+    assert metrics.quantile(0.5) is None
+    for _ in range(4):
+        metrics.observe(0.75, False, 0) # 落在 (0.5, 1.0] 桶
+    assert metrics.quantile(0.5) == pytest.approx(0.75)
+    assert metrics.quantile(1.0) == pytest.approx(1.0)
+
+def test_stage_timer_counts_failures_and_exceptions(registry):
+    with stage_timer(STAGE_WRITE) as stage:
+        stage.add_bytes(10)
+    with stage_timer(STAGE_WRITE) as stage:
+        stage.fail()
+    with pytest.raises(ValueError):
+        with stage_timer(STAGE_WRITE):
+            raise ValueError("bad")
+    write_metrics = registry.snapshot()[STAGE_WRITE]
+    assert (write_metrics.count, write_metrics.errors, write_metrics.total_bytes) == (3, 2, 10)
+
+def test_concurrent_batches_record_only_their_own_stages(registry):
+    @instrument_stage(STAGE_IMAGE_SYNTHESIS)
+    def synthesize(ok: bool):
+        return "url" if ok else None
+
+    batch_a, batch_b = BatchMetrics("a"), BatchMetrics("b")
+    barrier = threading.Barrier(2)
+
+    def _run(batch_metrics: BatchMetrics, calls: int):
+        with metrics_scope(batch_metrics):
+            barrier.wait()
+            with ThreadPoolExecutor(max_workers=2) as executor:
+                futures = [submit_in_context(executor, synthesize, i % 2 == 0) for i in range(calls)]
+                for future in futures:
+                    future.result()
+    threads = [threading.Thread(target=_run, args=(batch_a, 3)), threading.Thread(target=_run, args=(batch_b, 5))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert batch_a.registry.snapshot()[STAGE_IMAGE_SYNTHESIS].count == 3
+    assert batch_b.registry.snapshot()[STAGE_IMAGE_SYNTHESIS].count == 5
+    assert batch_b.registry.snapshot()[STAGE_IMAGE_SYNTHESIS].errors == 2
+    assert registry.snapshot()[STAGE_IMAGE_SYNTHESIS].count == 0 # 批次结束前不写入进程级注册表
+
+def test_observe_future_records_to_the_submitting_batch(registry):
+    batch_metrics = BatchMetrics("a")
+    future = Future()
+    with metrics_scope(batch_metrics):
+        observe_future(STAGE_DOWNLOAD, future)
+    future.set_result(b"data") # 在 metrics_scope 之外完成
+    assert batch_metrics.registry.snapshot()[STAGE_DOWNLOAD].count == 1
+    assert registry.snapshot()[STAGE_DOWNLOAD].count == 0
+
+def test_finish_writes_batch_summary_and_merges_into_process_registry(registry):
+    batch_metrics = BatchMetrics("job1")
+    with metrics_scope(batch_metrics):
+        with stage_timer(STAGE_WRITE):
+            pass
+    summary_path = batch_metrics.finish([{"status": "success"}, {"status": "failed"}])
+    with open(summary_path, encoding="utf-8") as f:
+        summary = json.load(f)
+    assert summary["articles"] == {"total": 2, "success": 1, "failed": 1}
+    assert summary["stages"][STAGE_WRITE]["count"] == 1
+
+    BatchMetrics("job2").finish([{"status": "success"}])
+    assert registry.snapshot()[STAGE_WRITE].count == 1
+    prometheus_text = registry.to_prometheus()
+    assert 'article_pipeline_articles_total{status="success"} 2' in prometheus_text
+    assert "article_pipeline_batches_total 2" in prometheus_text
+
+def test_concurrent_finishes_all_export(registry):
+    batches = [BatchMetrics(f"job{i}") for i in range(8)]
+    barrier = threading.Barrier(len(batches))
+    summary_paths = []
+
+    def _finish(batch_metrics: BatchMetrics):
+        barrier.wait()
+        summary_paths.append(batch_metrics.finish([{"status": "success"}]))
+    threads = [threading.Thread(target=_finish, args=(batch_metrics,)) for batch_metrics in batches]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert None not in summary_paths
+    with open(pipeline_metrics.METRICS_TEXTFILE_PATH, encoding="utf-8") as f:
+        assert f"article_pipeline_batches_total {len(batches)}" in f.read()
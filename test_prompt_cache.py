@@ -0,0 +1,91 @@
+# test_prompt_cache.py
+# prompt_cache 的单元测试：有效期、条目上限、按间隔写盘，以及重新加载。时间由 FakeClock 控制。
+
+import json
+import os
+
+import pytest
+
+import prompt_cache
+from prompt_cache import PromptCache
+
+TEMPLATE_VERSION = "v1"
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self) -> float:
+        return self.now
+
+    def monotonic(self) -> float:
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake_clock = FakeClock()
+    monkeypatch.setattr(prompt_cache, "time", fake_clock)
+    return fake_clock
+
+@pytest.fixture
+def cache_file(tmp_path):
+    return str(tmp_path / "image_prompt_cache.json")
+
+def _saved_entries(cache_file: str) -> dict:
+    if not os.path.exists(cache_file):
+        return {}
+    with open(cache_file, encoding="utf-8") as f:
+        return json.load(f)
+
+def test_get_normalizes_whitespace_and_counts_hits(cache_file, clock):
+    cache = PromptCache(cache_file)
+    assert cache.get("一只 猫", TEMPLATE_VERSION) is None
+    cache.put("一只 猫", TEMPLATE_VERSION, "a cat")
+    assert cache.get("  一只\n猫 ", TEMPLATE_VERSION) == "a cat"
+    assert cache.get("一只 猫", "v2") is None # 提示词模板更新后不再命中
+    cache.put("一条狗", TEMPLATE_VERSION, "") # 空提示词表示生成失败，不缓存
+    assert cache.get("一条狗", TEMPLATE_VERSION) is None
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 3
+
+def test_entries_expire_after_ttl(cache_file, clock):
+    cache = PromptCache(cache_file, ttl_seconds=100)
+    cache.put("一只猫", TEMPLATE_VERSION, "a cat")
+    clock.now += 99
+    assert cache.get("一只猫", TEMPLATE_VERSION) == "a cat"
+    clock.now += 2 # 有效期从写入时算起，命中不会延长
+    assert cache.get("一只猫", TEMPLATE_VERSION) is None
+    assert cache.stats()["entries"] == 0
+
+def test_least_recently_used_entry_is_evicted_at_max_entries(cache_file, clock):
+    cache = PromptCache(cache_file, max_entries=2)
+    cache.put("一只猫", TEMPLATE_VERSION, "a cat")
+    cache.put("一条狗", TEMPLATE_VERSION, "a dog")
+    assert cache.get("一只猫", TEMPLATE_VERSION)
+    cache.put("一只鸟", TEMPLATE_VERSION, "a bird")
+    assert cache.get("一条狗", TEMPLATE_VERSION) is None
+    assert cache.get("一只猫", TEMPLATE_VERSION) == "a cat"
+    assert cache.stats()["entries"] == 2
+
+def test_puts_are_written_after_flush_interval(cache_file, clock):
+    cache = PromptCache(cache_file, flush_interval=60)
+    cache.put("一只猫", TEMPLATE_VERSION, "a cat")
+    assert _saved_entries(cache_file) == {}
+    clock.now += 60
+    cache.put("一条狗", TEMPLATE_VERSION, "a dog")
+    assert len(_saved_entries(cache_file)) == 2
+    cache.put("一只鸟", TEMPLATE_VERSION, "a bird")
+    assert len(_saved_entries(cache_file)) == 2
+    cache.flush()
+    assert len(_saved_entries(cache_file)) == 3
+
+def test_reload_skips_expired_entries(cache_file, clock):
+    cache = PromptCache(cache_file, ttl_seconds=100)
+    cache.put("一只猫", TEMPLATE_VERSION, "a cat")
+    clock.now += 50
+    cache.put("一条狗", TEMPLATE_VERSION, "a dog")
+    cache.flush()
+    clock.now += 60
+    reloaded = PromptCache(cache_file, ttl_seconds=100)
+    assert reloaded.stats()["entries"] == 1
+    assert reloaded.get("一条狗", TEMPLATE_VERSION) == "a dog"
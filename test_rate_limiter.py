@@ -0,0 +1,76 @@
+# test_rate_limiter.py
+# rate_limiter 的单元测试：令牌桶的补充、预约和修正，以及注册表的配置解析。时间由 FakeClock 控制，不会真正等待。
+
+import pytest
+
+import rate_limiter
+from rate_limiter import TokenBucket, EndpointLimiter, RateLimiterRegistry
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+        self.slept = []
+
+    def monotonic(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float):
+        self.slept.append(seconds)
+        self.now += seconds
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake_clock = FakeClock()
+    monkeypatch.setattr(rate_limiter, "time", fake_clock)
+    return fake_clock
+
+def test_full_bucket_serves_burst_without_waiting(clock):
+    bucket = TokenBucket(capacity=5, refill_rate=1)
+    assert [bucket.reserve() for _ in range(5)] == [0.0] * 5
+
+def test_reservation_beyond_capacity_waits_for_refill(clock):
+    bucket = TokenBucket(capacity=2, refill_rate=2)
+    bucket.reserve(2)
+    # 令牌数允许为负：后到的调用方排在前面的预约之后
+    assert bucket.reserve() == pytest.approx(0.5)
+    assert bucket.reserve() == pytest.approx(1.0)
+
+def test_refill_is_capped_at_capacity(clock):
+    bucket = TokenBucket(capacity=3, refill_rate=1)
+    bucket.reserve(3)
+    clock.now += 1.5
+    assert bucket.available == pytest.approx(1.5)
+    clock.now += 100
+    assert bucket.available == pytest.approx(3.0)
+
+def test_adjust_refunds_overestimated_tokens(clock):
+    bucket = TokenBucket(capacity=100, refill_rate=1)
+    bucket.reserve(80)
+    bucket.adjust(-50) # 实际只用了 30 个
+    assert bucket.available == pytest.approx(70)
+    bucket.adjust(-1000)
+    assert bucket.available == pytest.approx(100)
+
+def test_endpoint_limiter_waits_for_the_slower_bucket(clock):
+    limiter = EndpointLimiter("generation:test", rpm=60, tpm=600)
+    assert limiter.reserve(tokens=600) == 0.0
+    # 请求数桶还有余量，令牌数桶欠 300 个，按每秒 10 个补充需要 30 秒
+    assert limiter.reserve(tokens=300) == pytest.approx(30.0)
+    assert limiter.acquire() == 0.0
+
+def test_acquire_sleeps_for_the_reserved_wait(clock):
+    limiter = EndpointLimiter("image_synthesis:test", rpm=60)
+    for _ in range(5):
+        limiter.acquire()
+    assert clock.slept == []
+    assert limiter.acquire() == pytest.approx(1.0)
+    assert clock.slept == [pytest.approx(1.0)]
+
+def test_registry_falls_back_to_endpoint_default_and_reconfigures(clock):
+    registry = RateLimiterRegistry({"generation:*": {"rpm": 120}, "generation:qwen-max": {"rpm": 6, "tpm": 1000}})
+    assert registry.get("generation", "qwen-plus").name == "generation:qwen-plus"
+    assert registry.get("generation", "qwen-plus").rpm == 120
+    assert registry.get("generation", "qwen-max").tpm == 1000
+    assert registry.get("generation", "qwen-plus") is registry.get("generation", "qwen-plus")
+    registry.configure({"generation:qwen-plus": {"rpm": 30}})
+    assert registry.get("generation", "qwen-plus").rpm == 30
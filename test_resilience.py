@@ -0,0 +1,143 @@
+# test_resilience.py
+# resilience 的单元测试：错误分类、重试预算、熔断器的状态变化，以及 ResilienceRegistry.call 的重试行为。
+
+from http import HTTPStatus
+from types import SimpleNamespace
+
+import pytest
+
+import resilience
+from resilience import (
+    CircuitBreaker, ResilienceRegistry, RetryBudget, classify_response, classify_exception,
+    ERROR_THROTTLING, ERROR_SERVER, ERROR_NETWORK, CIRCUIT_FAILURE_THRESHOLD, CIRCUIT_COOLDOWN_SECONDS
+)
+
+def _response(status_code, code=None):
+    return SimpleNamespace(status_code=status_code, code=code)
+
+def _open_breaker() -> CircuitBreaker:
+    breaker = CircuitBreaker("test")
+    for _ in range(CIRCUIT_FAILURE_THRESHOLD):
+        breaker.record_failure()
+    return breaker
+
+def _end_cooldown(breaker: CircuitBreaker):
+    breaker._open_until = 0.0
+
+@pytest.fixture
+def no_sleep(monkeypatch):
+    slept = []
+    monkeypatch.setattr(resilience, "time", SimpleNamespace(monotonic=resilience.time.monotonic, sleep=slept.append))
+    return slept
+
+def test_classify_response_and_exception():
+    assert classify_response(_response(HTTPStatus.OK)) is None
+    assert classify_response(_response(HTTPStatus.TOO_MANY_REQUESTS)) == ERROR_THROTTLING
+    assert classify_response(_response(HTTPStatus.BAD_REQUEST, "Throttling.RateQuota")) == ERROR_THROTTLING
+    assert classify_response(_response(HTTPStatus.INTERNAL_SERVER_ERROR)) == ERROR_SERVER
+    assert classify_response(_response(HTTPStatus.BAD_REQUEST, "DataInspectionFailed")) is None
+    assert classify_exception(ConnectionError()) == ERROR_NETWORK
+    assert classify_exception(ValueError()) is None
+
+def test_retry_budget_limits_withdrawals_to_deposits():
+    budget = RetryBudget(ratio=0.5, capacity=1.0)
+    assert budget.try_withdraw()
+    assert not budget.try_withdraw()
+    budget.deposit()
+    assert not budget.try_withdraw()
+    budget.deposit()
+    assert budget.try_withdraw()
+
+def test_breaker_opens_after_consecutive_failures():
+    breaker = CircuitBreaker("test")
+    for _ in range(CIRCUIT_FAILURE_THRESHOLD - 1):
+        breaker.record_failure()
+    assert breaker.state == CircuitBreaker.CLOSED
+    breaker.record_success()
+    for _ in range(CIRCUIT_FAILURE_THRESHOLD - 1):
+        breaker.record_failure()
+    assert breaker.state == CircuitBreaker.CLOSED # 成功会清零连续失败次数
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert breaker.seconds_until_probe() > 0
+
+def test_half_open_admits_a_single_probe():
+    breaker = _open_breaker()
+    assert breaker._admit(0.0)[0] > 0 # 冷却期内需要等待
+    _end_cooldown(breaker)
+    assert breaker._admit(0.0) == (0.0, True)
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    wait_seconds, is_probe = breaker._admit(0.0)
+    assert wait_seconds > 0 and not is_probe
+
+def test_probe_success_closes_and_probe_failure_doubles_cooldown():
+    breaker = _open_breaker()
+    _end_cooldown(breaker)
+    assert breaker.before_call()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert breaker._cooldown == 2 * CIRCUIT_COOLDOWN_SECONDS
+
+    _end_cooldown(breaker)
+    assert breaker.before_call()
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.before_call() is False
+
+def test_code_error_releases_the_probe_only_from_the_probe_call():
+    registry = ResilienceRegistry()
+    breaker = _open_breaker()
+    _end_cooldown(breaker)
+    assert breaker.before_call()
+    # 另一个在熔断前就已发出的请求以代码异常结束，不能释放探测名额
+    registry._handle_outcome(breaker, False, None, ValueError("bug"), classify_response)
+    assert breaker._admit(0.0)[0] > 0
+    registry._handle_outcome(breaker, True, None, ValueError("bug"), classify_response)
+    assert breaker._admit(0.0) == (0.0, True)
+
+def test_call_retries_retryable_responses_until_success(no_sleep):
+    registry = ResilienceRegistry()
+    responses = iter([_response(HTTPStatus.INTERNAL_SERVER_ERROR), _response(HTTPStatus.TOO_MANY_REQUESTS), _response(HTTPStatus.OK)])
+    result = registry.call("test", lambda: next(responses))
+    assert result.status_code == HTTPStatus.OK
+    assert len(no_sleep) == 2
+    assert registry.stats()["test"]["retries"] == 2
+
+def test_call_returns_last_response_when_attempts_run_out(no_sleep):
+    registry = ResilienceRegistry()
+    attempts = []
+
+    def _attempt():
+        attempts.append(1)
+        return _response(HTTPStatus.INTERNAL_SERVER_ERROR)
+    assert registry.call("test", _attempt).status_code == HTTPStatus.INTERNAL_SERVER_ERROR
+    assert len(attempts) == resilience.RETRY_POLICIES[ERROR_SERVER].max_attempts
+
+def test_call_does_not_retry_non_retryable_errors(no_sleep):
+    registry = ResilienceRegistry()
+
+    def _broken_attempt():
+        raise ValueError("bad")
+    with pytest.raises(ValueError):
+        registry.call("test", _broken_attempt)
+    assert no_sleep == []
+    assert registry.call("test", lambda: _response(HTTPStatus.BAD_REQUEST)).status_code == HTTPStatus.BAD_REQUEST
+    assert no_sleep == []
+
+def test_non_retryable_error_response_neither_closes_nor_resets_the_breaker():
+    registry = ResilienceRegistry()
+    breaker = CircuitBreaker("test")
+    for _ in range(CIRCUIT_FAILURE_THRESHOLD - 1):
+        breaker.record_failure()
+    # 内容审核拒绝穿插在服务端错误之间，不会清零连续失败次数
+    registry._handle_outcome(breaker, False, _response(HTTPStatus.BAD_REQUEST, "DataInspectionFailed"), None, classify_response)
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+
+    _end_cooldown(breaker)
+    assert breaker.before_call()
+    registry._handle_outcome(breaker, True, _response(HTTPStatus.BAD_REQUEST, "InvalidParameter"), None, classify_response)
+    assert breaker.state == CircuitBreaker.HALF_OPEN # 4xx 探测不代表服务已恢复
+    assert breaker._admit(0.0) == (0.0, True) # 但探测名额已释放
+    registry._handle_outcome(breaker, True, _response(HTTPStatus.OK), None, classify_response)
+    assert breaker.state == CircuitBreaker.CLOSED
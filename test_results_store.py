@@ -0,0 +1,73 @@
+# test_results_store.py
+# results_store 的单元测试：紧凑格式把 inline 图片存为文件，load_results 读回后与原始数据完全相同。
+
+import base64
+import copy
+import json
+import os
+
+import pytest
+
+from results_store import compact_processed_data, load_results, results_filename, write_results
+
+PNG_BYTES = b"\x89PNG\r\n\x1a\n" + os.urandom(3000)
+
+def _processed_data():
+    data_uri = f"data:image/png;base64,{base64.b64encode(PNG_BYTES).decode('ascii')}"
+    return [
+        {"type": "text", "content": "第一段"},
+        {"type": "image", "base64_image_data": data_uri, "image_path": None, "prompt": "a cat"},
+        {"type": "text", "content": "第二段"},
+        {"type": "image", "base64_image_data": data_uri, "image_path": None, "prompt": "the same cat"},
+        {"type": "image", "base64_image_data": None, "image_path": "../generated_images/external.png"},
+    ]
+
+@pytest.fixture(autouse=True)
+def work_dir(tmp_path, monkeypatch):
+    # 图片文件写入当前目录下的 generated_images/，结果文件放在 generated_output/
+    monkeypatch.chdir(tmp_path)
+    os.makedirs("generated_output")
+    return tmp_path
+
+def test_compact_replaces_inline_images_with_image_path():
+    processed_data = _processed_data()
+    original = copy.deepcopy(processed_data)
+    compacted = compact_processed_data(processed_data)
+    assert processed_data == original # 不修改传入的数据
+
+    image_item = compacted[1]
+    assert "base64_image_data" not in image_item
+    assert image_item["inline"] is True
+    assert image_item["image_path"].startswith("../generated_images/")
+    assert image_item["image_path"].endswith(".png")
+    assert compacted[3]["image_path"] == image_item["image_path"] # 相同内容只保存一份
+    assert os.listdir("generated_images") == [os.path.basename(image_item["image_path"])]
+    assert compacted[4] == original[4] # external 模式的图片保持不变
+
+@pytest.mark.parametrize("compression", ["none", "gzip"])
+def test_write_and_load_round_trip(compression):
+    processed_data = _processed_data()
+    file_path = os.path.join("generated_output", results_filename("article", compression))
+    write_results(file_path, processed_data, compact=True, compression=compression)
+    assert load_results(file_path) == processed_data
+
+def test_load_without_resolving_keeps_references():
+    file_path = os.path.join("generated_output", "article.json")
+    write_results(file_path, _processed_data())
+    raw_items = load_results(file_path, resolve_images=False)
+    assert raw_items[1]["inline"] is True
+    assert base64.b64decode(load_results(file_path)[1]["base64_image_data"].split(",", 1)[1]) == PNG_BYTES
+
+def test_legacy_indented_format_loads_unchanged():
+    file_path = os.path.join("generated_output", "article.json")
+    write_results(file_path, _processed_data(), compact=False)
+    with open(file_path, encoding="utf-8") as f:
+        assert json.load(f) == _processed_data()
+    assert load_results(file_path) == _processed_data()
+
+def test_missing_image_file_resolves_to_none():
+    file_path = os.path.join("generated_output", "article.json")
+    write_results(file_path, _processed_data())
+    for filename in os.listdir("generated_images"):
+        os.remove(os.path.join("generated_images", filename))
+    assert load_results(file_path)[1]["base64_image_data"] is None
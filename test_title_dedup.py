@@ -0,0 +1,51 @@
+# test_title_dedup.py
+# title_dedup 的单元测试：MinHash 近似重复判断、批内去重，以及按主课题保存的标题历史索引。
+
+import json
+
+from title_dedup import TitleDeduplicator, TitleIndex, estimate_similarity, minhash_signature, normalize_title
+
+TITLE = "如何在三个月内提高英语口语水平"
+NEAR_DUPLICATE = "如何在三个月内提升英语口语水平" # 只改了一个字
+UNRELATED = "家庭理财的五个实用技巧"
+
+def test_normalize_title_ignores_width_case_and_punctuation():
+    assert normalize_title("ＡＩ 写作：入门！") == normalize_title("ai写作入门")
+
+def test_signature_similarity_tracks_title_overlap():
+    signature = minhash_signature(TITLE)
+    assert estimate_similarity(signature, minhash_signature(TITLE)) == 1.0
+    assert estimate_similarity(signature, minhash_signature(NEAR_DUPLICATE)) >= 0.7
+    assert estimate_similarity(signature, minhash_signature(UNRELATED)) < 0.2
+    assert minhash_signature("！？") == ()
+    assert estimate_similarity((), signature) == 0.0
+
+def test_deduplicator_rejects_exact_and_near_duplicates():
+    dedup = TitleDeduplicator()
+    assert dedup.add(TITLE)
+    assert not dedup.add(f"{TITLE}！") # 规范化后完全相同
+    assert not dedup.add(NEAR_DUPLICATE)
+    assert dedup.add(UNRELATED)
+    assert not dedup.add("")
+    assert len(dedup) == 2
+    assert dedup.rejected == 3
+
+def test_title_index_finds_similar_titles_per_topic(tmp_path):
+    index = TitleIndex(str(tmp_path / "title_index.json"))
+    index.add("英语学习", [TITLE])
+    assert index.find_similar("英语学习", NEAR_DUPLICATE) == TITLE
+    assert index.find_similar("英语学习", UNRELATED) is None
+    assert index.find_similar("个人理财", NEAR_DUPLICATE) is None # 其他主课题不受影响
+    assert index.count("英语学习") == 1
+
+def test_title_index_persists_and_recomputes_stale_signatures(tmp_path):
+    index_file = tmp_path / "title_index.json"
+    TitleIndex(str(index_file)).add("英语学习", [TITLE, UNRELATED])
+    reloaded = TitleIndex(str(index_file))
+    assert reloaded.count("英语学习") == 2
+    assert reloaded.find_similar("英语学习", NEAR_DUPLICATE) == TITLE
+
+    data = json.loads(index_file.read_text(encoding="utf-8"))
+    data["signature_version"] = "old"
+    index_file.write_text(json.dumps(data, ensure_ascii=False), encoding="utf-8")
+    assert TitleIndex(str(index_file)).find_similar("英语学习", NEAR_DUPLICATE) == TITLE
@@ -0,0 +1,87 @@
+# test_usage_accounting.py
+# usage_accounting 的单元测试：费用计算、按文章/批次的用量归属，以及批量任务的预算上限。
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from usage_accounting import (
+    BatchBudget, UsageMeter, estimate_article_cost, model_cost, record_usage, submit_in_context, usage_scope
+)
+
+def test_model_cost_uses_per_thousand_token_and_per_image_prices():
+    assert model_cost("qwen-plus", input_tokens=1000, output_tokens=1000) == pytest.approx(0.0028)
+    assert model_cost("wanx-v1", images=3) == pytest.approx(0.48)
+    assert model_cost("unknown-model", input_tokens=1000) == 0.0
+
+def test_article_usage_rolls_up_to_batch():
+    batch_usage = UsageMeter()
+    article_usage = UsageMeter(parent=batch_usage)
+    with usage_scope(article_usage):
+        record_usage("qwen-plus", input_tokens=500, output_tokens=1500)
+        record_usage("wanx-v1", images=2)
+    record_usage("qwen-plus", input_tokens=10_000) # 不在任何 usage_scope 中，忽略
+    assert article_usage.summary()["images"] == 2
+    assert batch_usage.summary()["input_tokens"] == 500
+    assert batch_usage.cost() == pytest.approx(article_usage.cost())
+
+def test_submit_in_context_attributes_thread_pool_calls():
+    article_usage = UsageMeter()
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        with usage_scope(article_usage):
+            future = submit_in_context(executor, record_usage, "wanx-v1", images=1)
+            plain_future = executor.submit(record_usage, "wanx-v1", images=1)
+        future.result()
+        plain_future.result()
+    assert article_usage.summary()["images"] == 1
+
+def test_budget_without_limit_never_refuses():
+    budget = BatchBudget(UsageMeter(), None, estimated_article_cost=100.0)
+    assert all(budget.try_start_article() for _ in range(10))
+    assert not budget.exhausted
+
+def test_budget_uses_estimate_before_any_article_finishes():
+    budget = BatchBudget(UsageMeter(), 1.0, estimated_article_cost=0.4)
+    assert budget.try_start_article()
+    assert budget.try_start_article()
+    assert not budget.try_start_article() # 0.4 x 3 > 1.0
+    assert budget.exhausted
+    # 一旦拒绝就不再开始新文章，即使之后有文章完成
+    budget.finish_article(UsageMeter())
+    assert not budget.try_start_article()
+
+def test_budget_switches_to_average_of_finished_articles():
+    batch_usage = UsageMeter()
+    budget = BatchBudget(batch_usage, 1.0, estimated_article_cost=0.9)
+    assert budget.try_start_article()
+    article_usage = UsageMeter(parent=batch_usage)
+    article_usage.record("wanx-v1", images=1) # 实际 0.16 元
+    budget.finish_article(article_usage)
+    assert budget.average_article_cost() == pytest.approx(0.16)
+    started = 1
+    while budget.try_start_article():
+        started += 1
+    # 0.16 + 0.16 x 5 <= 1.0 < 0.16 + 0.16 x 6
+    assert started == 6
+
+def test_budget_check_and_reservation_are_atomic():
+    budget = BatchBudget(UsageMeter(), 1.0, estimated_article_cost=0.3)
+    barrier = threading.Barrier(16)
+    results = []
+
+    def _worker():
+        barrier.wait()
+        results.append(budget.try_start_article())
+    threads = [threading.Thread(target=_worker) for _ in range(16)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results.count(True) == 3
+
+def test_estimate_article_cost_includes_images_only_when_enabled():
+    with_images = estimate_article_cost("qwen-plus", "wanx-v1")
+    without_images = estimate_article_cost("qwen-plus", "wanx-v1", enable_images=False)
+    assert with_images - without_images >= model_cost("wanx-v1", images=1)
+    assert without_images > 0
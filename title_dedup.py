@@ -0,0 +1,216 @@
+# title_dedup.py
+# 标题近似去重：把标题规范化后切成字符 n-gram，用 MinHash 估计两两之间的 Jaccard 相似度，
+# 相似度达到阈值的标题视为重复。中文没有空格分词，字符 n-gram 对“换一两个字”的改写很敏感。
+
+import os
+import json
+import struct
+import random
+import hashlib
+import threading
+import unicodedata
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+SHINGLE_SIZE = 2 # 中文标题较短，使用字符二元组
+NUM_PERMUTATIONS = 64
+# 估计的 Jaccard 相似度达到这个值即视为近似重复；只改了一两个字的标题通常在 0.7 以上，换了说法的同义标题约 0.4-0.5
+SIMILARITY_THRESHOLD = float(os.environ.get("TITLE_SIMILARITY_THRESHOLD", "0.5"))
+
+LSH_BANDS = 32 # LSH_BANDS * LSH_ROWS 必须等于 NUM_PERMUTATIONS
+LSH_ROWS = 2
+TITLE_INDEX_FILE = os.path.join("generated_output", "title_index.json")
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+# 固定随机种子，保证不同进程、不同运行之间的签名可以互相比较
+_rng = random.Random(20240601)
+_PERMUTATIONS = [(_rng.randrange(1, _MERSENNE_PRIME), _rng.randrange(0, _MERSENNE_PRIME)) for _ in range(NUM_PERMUTATIONS)]
+# 签名参数变化后，历史索引中保存的签名需要重新计算
+_SIGNATURE_VERSION = f"bigram-minhash-{SHINGLE_SIZE}-{NUM_PERMUTATIONS}-20240601"
+
+# --- 函数：规范化标题文本 ---
+def normalize_title(title: str) -> str:
+    """全角转半角、转小写，并去掉空白和标点，只保留文字和数字。"""
+    title = unicodedata.normalize("NFKC", title).lower()
+    return "".join(ch for ch in title if ch.isalnum())
+
+def _shingles(normalized_title: str) -> Set[str]:
+    if len(normalized_title) <= SHINGLE_SIZE:
+        return {normalized_title} if normalized_title else set()
+    return {normalized_title[i:i + SHINGLE_SIZE] for i in range(len(normalized_title) - SHINGLE_SIZE + 1)}
+
+def _shingle_hash(shingle: str) -> int:
+    return struct.unpack("<I", hashlib.blake2b(shingle.encode("utf-8"), digest_size=4).digest())[0]
+
+# --- 函数：计算标题的 MinHash 签名 ---
+def minhash_signature(title: str) -> Tuple[int, ...]:
+    """
+    Returns:
+        Tuple[int, ...]: 长度为 NUM_PERMUTATIONS 的签名；空标题返回空元组。
+    """
+    hashes = [_shingle_hash(shingle) for shingle in _shingles(normalize_title(title))]
+    if not hashes:
+        return ()
+    return tuple(
+        min((a * h + b) % _MERSENNE_PRIME for h in hashes) & _MAX_HASH
+        for a, b in _PERMUTATIONS
+    )
+
+def estimate_similarity(signature_a: Tuple[int, ...], signature_b: Tuple[int, ...]) -> float:
+    """两个签名中相同位置取值相等的比例，即 Jaccard 相似度的估计值。"""
+    if not signature_a or not signature_b:
+        return 0.0
+    return sum(1 for x, y in zip(signature_a, signature_b) if x == y) / len(signature_a)
+
+class _LshIndex:
+    """
+    MinHash 签名的局部敏感哈希索引：签名切成 LSH_BANDS 段，任一段完全相同的标题才作为候选逐个比较，
+    查询耗时与历史标题总数基本无关。32 段 x 2 行时，相似度 0.5 的标题成为候选的概率约 99.99%。
+    """
+    def __init__(self, threshold: float):
+        self.threshold = threshold
+        self._signatures: List[Tuple[int, ...]] = []
+        self._buckets: Dict[Tuple[int, Tuple[int, ...]], List[int]] = {}
+
+    def _bands(self, signature: Tuple[int, ...]):
+        for band in range(LSH_BANDS):
+            yield band, signature[band * LSH_ROWS:(band + 1) * LSH_ROWS]
+
+    def find(self, signature: Tuple[int, ...]) -> Optional[int]:
+        """返回第一个相似度达到阈值的已索引条目的序号，没有则返回 None。"""
+        if not signature:
+            return None
+        checked = set()
+        for band_key in self._bands(signature):
+            for entry_index in self._buckets.get(band_key, ()):
+                if entry_index in checked:
+                    continue
+                checked.add(entry_index)
+                if estimate_similarity(signature, self._signatures[entry_index]) >= self.threshold:
+                    return entry_index
+        return None
+
+    def add(self, signature: Tuple[int, ...]) -> int:
+        entry_index = len(self._signatures)
+        self._signatures.append(signature)
+        if signature:
+            for band_key in self._bands(signature):
+                self._buckets.setdefault(band_key, []).append(entry_index)
+        return entry_index
+
+    def __len__(self) -> int:
+        return len(self._signatures)
+
+class TitleDeduplicator:
+    """
+    依次接收候选标题，只保留与已保留标题都不相似的标题。
+    用法：if dedup.add(title): accepted.append(title)
+    """
+    def __init__(self, threshold: float = SIMILARITY_THRESHOLD):
+        self.threshold = threshold
+        self._normalized: Set[str] = set()
+        self._index = _LshIndex(threshold)
+        self.rejected = 0
+
+    def add(self, title: str) -> bool:
+        """
+        Returns:
+            bool: 标题被保留时返回 True；完全重复或近似重复时返回 False。
+        """
+        normalized = normalize_title(title)
+        if not normalized or normalized in self._normalized:
+            self.rejected += 1
+            return False
+        signature = minhash_signature(title)
+        if self._index.find(signature) is not None:
+            self.rejected += 1
+            return False
+        self._normalized.add(normalized)
+        self._index.add(signature)
+        return True
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+class TitleIndex:
+    """
+    按主课题保存所有已成功生成文章的标题（generated_output/title_index.json），进程内只加载一次。
+    新一批标题在生成文章之前先与历史标题比较，避免在不同的运行中反复写同一个题目。
+    签名随标题一起保存，加载时不需要重新计算；签名参数变化时自动重新计算。
+    """
+    def __init__(self, index_file: str = TITLE_INDEX_FILE, threshold: float = SIMILARITY_THRESHOLD):
+        self.index_file = index_file
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        self._topics: Dict[str, Dict[str, Any]] = {} # 规范化的主课题 -> {"titles": [...], "signatures": [...]}
+        self._indexes: Dict[str, _LshIndex] = {}
+        self._load()
+
+    # --- 文件读写 ---
+    def _load(self):
+        if not os.path.exists(self.index_file):
+            return
+        try:
+            with open(self.index_file, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"--- 日志: ⚠️ 标题历史索引读取失败，将重新建立。{e} ---")
+            return
+        signatures_valid = data.get("signature_version") == _SIGNATURE_VERSION
+        for topic_key, entry in data.get("topics", {}).items():
+            titles = entry.get("titles", [])
+            signatures = entry.get("signatures", []) if signatures_valid else []
+            if len(signatures) != len(titles):
+                signatures = [list(minhash_signature(title)) for title in titles]
+            self._topics[topic_key] = {"titles": titles, "signatures": signatures}
+            index = self._indexes[topic_key] = _LshIndex(self.threshold)
+            for signature in signatures:
+                index.add(tuple(signature))
+        print(f"--- 日志: 已加载标题历史索引，共 {len(self._topics)} 个主课题、{sum(len(e['titles']) for e in self._topics.values())} 个标题。---")
+
+    def _save_locked(self):
+        os.makedirs(os.path.dirname(self.index_file) or ".", exist_ok=True)
+        tmp_path = f"{self.index_file}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"signature_version": _SIGNATURE_VERSION, "topics": self._topics}, f, ensure_ascii=False)
+        os.replace(tmp_path, self.index_file)
+
+    # --- 查询与写入 ---
+    def find_similar(self, main_topic: str, title: str) -> Optional[str]:
+        """返回该主课题下与 title 相似的历史标题，没有则返回 None。"""
+        topic_key = normalize_title(main_topic)
+        signature = minhash_signature(title)
+        with self._lock:
+            index = self._indexes.get(topic_key)
+            entry_index = index.find(signature) if index else None
+            return self._topics[topic_key]["titles"][entry_index] if entry_index is not None else None
+
+    def add(self, main_topic: str, titles: List[str]):
+        """把一批新标题记入历史并写盘。"""
+        if not titles:
+            return
+        topic_key = normalize_title(main_topic)
+        with self._lock:
+            entry = self._topics.setdefault(topic_key, {"titles": [], "signatures": []})
+            index = self._indexes.setdefault(topic_key, _LshIndex(self.threshold))
+            for title in titles:
+                signature = minhash_signature(title)
+                entry["titles"].append(title)
+                entry["signatures"].append(list(signature))
+                index.add(signature)
+            self._save_locked()
+
+    def count(self, main_topic: str) -> int:
+        with self._lock:
+            return len(self._topics.get(normalize_title(main_topic), {}).get("titles", []))
+
+_title_index: Optional[TitleIndex] = None
+_title_index_lock = threading.Lock()
+
+def get_title_index() -> TitleIndex:
+    """获取进程内共享的标题历史索引（首次调用时从磁盘加载）。"""
+    global _title_index
+    with _title_index_lock:
+        if _title_index is None:
+            _title_index = TitleIndex()
+        return _title_index
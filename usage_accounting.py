@@ -0,0 +1,204 @@
+# usage_accounting.py
+# 令牌与费用统计：dashscope_client 在每次调用后把响应中的 usage（输入/输出令牌数）和生成的图片数记到当前的 UsageMeter 上，
+# 每篇文章一个 UsageMeter，其 parent 为所在批量任务的 UsageMeter，记录时逐级累加。
+# 当前的 UsageMeter 保存在 contextvars 中：asyncio 任务和 asyncio.to_thread 会自动继承；
+# 线程池不会，提交任务时需要使用 submit_in_context，否则该任务中的调用不计入任何文章。
+#
+# 单价可通过环境变量 DASHSCOPE_MODEL_PRICES（JSON）覆盖，格式与 DEFAULT_MODEL_PRICES 相同。
+
+import os
+import json
+import threading
+import contextvars
+from contextlib import contextmanager
+from concurrent.futures import Executor, Future
+from typing import Any, Callable, Dict, Iterator, Optional
+
+# --- 默认单价（元） ---
+# input / output: 每千个输入/输出令牌的价格；image: 每张图片的价格。以阿里云百炼的公开价格为准，价格调整时请同步修改或用环境变量覆盖。
+DEFAULT_MODEL_PRICES = {
+    "qwen-turbo": {"input": 0.0003, "output": 0.0006},
+    "qwen-plus": {"input": 0.0008, "output": 0.002},
+    "qwen-max": {"input": 0.0024, "output": 0.0096},
+    "wanx-v1": {"image": 0.16},
+    "wanx2.0-t2i-turbo": {"image": 0.04},
+}
+CURRENCY = "CNY"
+
+def _load_prices_from_env() -> Dict[str, dict]:
+    prices = dict(DEFAULT_MODEL_PRICES)
+    raw = os.environ.get("DASHSCOPE_MODEL_PRICES")
+    if raw:
+        try:
+            prices.update(json.loads(raw))
+        except ValueError as e:
+            print(f"--- 日志: ⚠️ 环境变量 DASHSCOPE_MODEL_PRICES 解析失败，使用默认单价。{e} ---")
+    return prices
+
+MODEL_PRICES = _load_prices_from_env()
+_warned_models = set()
+
+def model_cost(model: str, input_tokens: int = 0, output_tokens: int = 0, images: int = 0) -> float:
+    """按 MODEL_PRICES 计算费用（元）；未配置单价的模型按 0 计，并提示一次。"""
+    price = MODEL_PRICES.get(model)
+    if price is None:
+        if model not in _warned_models:
+            _warned_models.add(model)
+            print(f"--- 日志: ⚠️ 模型 {model} 未配置单价，费用按 0 计算，可通过 DASHSCOPE_MODEL_PRICES 设置。---")
+        return 0.0
+    return (input_tokens * price.get("input", 0.0) + output_tokens * price.get("output", 0.0)) / 1000 + images * price.get("image", 0.0)
+
+# --- 使用量计量 ---
+class UsageMeter:
+    """按模型累计调用次数、令牌数和图片数。"""
+    def __init__(self, parent: Optional["UsageMeter"] = None):
+        self.parent = parent
+        self._models: Dict[str, Dict[str, int]] = {}
+        self._lock = threading.Lock()
+
+    def record(self, model: str, input_tokens: int = 0, output_tokens: int = 0, images: int = 0):
+        with self._lock:
+            usage = self._models.setdefault(model, {"calls": 0, "input_tokens": 0, "output_tokens": 0, "images": 0})
+            usage["calls"] += 1
+            usage["input_tokens"] += input_tokens
+            usage["output_tokens"] += output_tokens
+            usage["images"] += images
+        if self.parent is not None:
+            self.parent.record(model, input_tokens, output_tokens, images)
+
+    def cost(self) -> float:
+        with self._lock:
+            models = {model: dict(usage) for model, usage in self._models.items()}
+        return sum(model_cost(model, usage["input_tokens"], usage["output_tokens"], usage["images"]) for model, usage in models.items())
+
+    def summary(self) -> Dict[str, Any]:
+        with self._lock:
+            models = {model: dict(usage) for model, usage in self._models.items()}
+        for model, usage in models.items():
+            usage["cost"] = round(model_cost(model, usage["input_tokens"], usage["output_tokens"], usage["images"]), 4)
+        return {
+            "input_tokens": sum(usage["input_tokens"] for usage in models.values()),
+            "output_tokens": sum(usage["output_tokens"] for usage in models.values()),
+            "images": sum(usage["images"] for usage in models.values()),
+            "cost": round(sum(usage["cost"] for usage in models.values()), 4),
+            "models": models,
+        }
+
+_current_meter: contextvars.ContextVar[Optional[UsageMeter]] = contextvars.ContextVar("usage_meter", default=None)
+
+@contextmanager
+def usage_scope(meter: UsageMeter) -> Iterator[UsageMeter]:
+    """在 with 块内（包括其中创建的 asyncio 任务）发起的调用都记到 meter 上。"""
+    token = _current_meter.set(meter)
+    try:
+        yield meter
+    finally:
+        _current_meter.reset(token)
+
+def record_usage(model: str, input_tokens: int = 0, output_tokens: int = 0, images: int = 0):
+    """记到当前的 UsageMeter 上；不在任何 usage_scope 中时忽略。"""
+    meter = _current_meter.get()
+    if meter is not None:
+        meter.record(model, input_tokens, output_tokens, images)
+
+def submit_in_context(executor: Executor, func: Callable, *args, **kwargs) -> Future:
+    """与 executor.submit 相同，但任务在提交方当前上下文的副本中执行，调用产生的使用量记到提交方的 UsageMeter 上。"""
+    return executor.submit(contextvars.copy_context().run, func, *args, **kwargs)
+
+# --- 批量任务的预算 ---
+# 还没有文章完成时，按这份用量预估单篇文章的费用：一篇长文（含提示词）+ 逐段生成图片提示词 + 配图
+ESTIMATED_ARTICLE_USAGE = {"input_tokens": 1500, "output_tokens": 3000, "prompt_tokens": 4000, "images": 5}
+IMAGE_PROMPT_MODEL = "qwen-turbo"
+
+def estimate_article_cost(llm_model: str, image_model: str, enable_images: bool = True) -> float:
+    """按 MODEL_PRICES 和 ESTIMATED_ARTICLE_USAGE 预估一篇文章的费用（元），偏保守。"""
+    usage = ESTIMATED_ARTICLE_USAGE
+    cost = model_cost(llm_model, usage["input_tokens"], usage["output_tokens"])
+    if enable_images:
+        cost += model_cost(IMAGE_PROMPT_MODEL, usage["prompt_tokens"], usage["prompt_tokens"] // 4)
+        cost += model_cost(image_model, images=usage["images"])
+    return cost
+
+class BatchBudget:
+    """
+    批量任务的费用上限。每篇文章开始前调用 try_start_article：
+    已花费 + (进行中的文章数 + 1) × 单篇文章的预计费用 超过预算时不再开始新文章（之后一直拒绝）。
+    单篇文章的预计费用在有文章完成前取 estimated_article_cost，之后取已完成文章的平均费用。
+    已经开始的文章会继续完成，因此实际花费可能略高于预算。limit 为 None 或 0 时不限制。
+    """
+    def __init__(self, usage: UsageMeter, limit: Optional[float] = None, estimated_article_cost: float = 0.0):
+        self.usage = usage
+        self.limit = limit or None
+        self.estimated_article_cost = estimated_article_cost
+        self.exhausted = False
+        self._in_flight = 0
+        self._finished_articles = 0
+        self._finished_cost = 0.0
+        self._lock = threading.Lock()
+
+    def _article_cost_locked(self) -> float:
+        if self._finished_articles:
+            return self._finished_cost / self._finished_articles
+        return self.estimated_article_cost
+
+    def average_article_cost(self) -> float:
+        with self._lock:
+            return self._article_cost_locked()
+
+    def projected_cost(self) -> float:
+        with self._lock:
+            return self._projected_cost_locked()
+
+    def _projected_cost_locked(self) -> float:
+        return self.usage.cost() + (self._in_flight + 1) * self._article_cost_locked()
+
+    def try_start_article(self) -> bool:
+        # 检查和占位在同一把锁内完成，多个工作线程不会同时通过检查
+        with self._lock:
+            if self.exhausted:
+                return False
+            if self.limit is not None:
+                projected = self._projected_cost_locked()
+                if projected > self.limit:
+                    self.exhausted = True
+                    print(f"--- 日志: ⚠️ 预计费用 {projected:.2f} 元将超过预算 {self.limit:.2f} 元，不再开始新的文章。---")
+                    return False
+            self._in_flight += 1
+            return True
+
+    def finish_article(self, article_usage: UsageMeter):
+        cost = article_usage.cost()
+        with self._lock:
+            self._in_flight -= 1
+            self._finished_articles += 1
+            self._finished_cost += cost
+
+def write_usage_report(file_path: str, usage: UsageMeter, budget: Optional[BatchBudget], article_results: list, **extra) -> Optional[str]:
+    """
+    把批量任务的使用量写入 JSON 文件（原子替换）；写入失败只记录日志。
+
+    Returns:
+        Optional[str]: 文件路径，写入失败时为 None。
+    """
+    report = {
+        **extra,
+        "currency": CURRENCY,
+        "budget": budget.limit if budget else None,
+        "budget_exhausted": budget.exhausted if budget else False,
+        "total": usage.summary(),
+        "articles": [
+            {"index": r["index"], "topic": r["topic"], "status": r["status"], "usage": r.get("usage")}
+            for r in sorted(article_results, key=lambda r: r["index"])
+        ],
+    }
+    tmp_path = f"{file_path}.tmp"
+    try:
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, file_path)
+    except OSError as e:
+        print(f"--- 日志: ⚠️ 写入费用统计失败: {e} ---")
+        return None
+    print(f"--- 日志: 本批次共消耗 {report['total']['input_tokens']} 个输入令牌、{report['total']['output_tokens']} 个输出令牌、"
+          f"{report['total']['images']} 张图片，约 {report['total']['cost']:.2f} 元，明细已写入 {file_path}。---")
+    return file_path
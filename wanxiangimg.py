@@ -2,22 +2,80 @@
 # 负责调用文生图模型，并根据文章内容智能插入图片。
 
 import os
+import asyncio
 import dashscope
 from http import HTTPStatus
 import re
-import base64
+import json
 import requests
 import time
-from typing import Union, List
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from typing import Callable, Dict, Iterable, Iterator, Optional, Tuple, Union, List
+
+# aiohttp 为可选依赖：安装后 asyncio 版本的图片下载使用非阻塞 HTTP，否则退回到线程池中执行 requests
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+from dashscope_client import (
+    call_generation, call_image_synthesis,
+    call_generation_async, submit_image_synthesis_async, fetch_image_synthesis_task_async
+)
+from image_task_poller import get_image_task_poller
+from hedged_requests import get_hedger
+from image_cache import get_image_cache
+from prompt_cache import get_prompt_cache
+from download_pool import get_download_pool, DOWNLOAD_CHUNK_SIZE, DOWNLOAD_CONNECT_TIMEOUT, DOWNLOAD_READ_TIMEOUT
+from image_encoding import (
+    DataUriStreamEncoder, MAGIC_BYTES_NEEDED, detect_image_type,
+    encode_chunks_as_data_uri, encode_file_as_data_uri
+)
+from image_assets import ImageAssetWriter, link_or_copy, resolve_image_output_mode, save_image_asset_from_file
+from image_transcode import resolve_transcode_options, transcode_image_file
+from usage_accounting import submit_in_context
+from pipeline_metrics import (
+    instrument_stage, stage_timer, observe_future,
+    STAGE_IMAGE_PROMPT, STAGE_IMAGE_SYNTHESIS, STAGE_DOWNLOAD, STAGE_ENCODE
+)
 
 # --- 配置 ---
 # 注意：API Key 在 streamlit_app.py 中统一设置，这里无需重复设置
 AI_IMAGE_INTENT_MARKER = "<IMAGE>"
 PARAGRAPHS_PER_IMAGE = 3 # 默认每隔3个自然段落插入一张图片
+IMAGE_SIZE = '1280*720'
+IMAGE_SYNTHESIS_MODES = ("sync", "async") # sync: 阻塞调用 ImageSynthesis.call；async: 提交任务后由后台线程统一轮询
+HEDGER_IMAGE_PROMPT = "image_prompt" # 对冲统计的名称，逐段和批量生成提示词的延迟差别很大，分开统计
+HEDGER_IMAGE_PROMPT_BATCH = "image_prompt_batch"
+IMAGE_PROMPT_TEMPLATE_VERSION = "v1" # 修改 _build_image_prompt_messages 中的提示词模板时请同步递增，使旧的提示词缓存失效
 IMAGE_SAVE_PATH = "generated_images"
 if not os.path.exists(IMAGE_SAVE_PATH):
     os.makedirs(IMAGE_SAVE_PATH)
 
+# --- 辅助函数：流式下载图片并编码为 data URI ---
+@instrument_stage(STAGE_DOWNLOAD, failed=lambda result: False, size=lambda result: result[2])
+def _stream_image_as_data_uri(image_url: str, raw_write: Optional[Callable[[bytes], object]] = None) -> Tuple[str, str, int]:
+    """
+    边下载边编码，内存中不保留完整的原始图片；raw_write 不为 None 时，原始数据块同时写给它（例如缓存文件）。
+
+    Returns:
+        Tuple[str, str, int]: (data URI, 识别出的 MIME 类型, 下载的字节数)。
+
+    Raises:
+        requests.exceptions.RequestException: 下载失败时抛出。
+    """
+    encoded_parts = []
+    with get_download_pool().stream(image_url) as (chunks, header_content_type):
+        if raw_write is not None:
+            chunks = _tee_chunks(chunks, raw_write)
+        content_type, num_bytes = encode_chunks_as_data_uri(chunks, encoded_parts.append, header_content_type)
+    return "".join(encoded_parts), content_type, num_bytes
+
+def _tee_chunks(chunks: Iterable[bytes], raw_write: Callable[[bytes], object]) -> Iterator[bytes]:
+    for chunk in chunks:
+        raw_write(chunk)
+        yield chunk
+
 # --- 辅助函数：将图片URL下载并编码为Base64 ---
 def download_and_encode_image_as_base64(image_url: str, status_callback=None) -> Union[str, None]:
     """
@@ -34,21 +92,9 @@ def download_and_encode_image_as_base64(image_url: str, status_callback=None) ->
     if status_callback:
         status_callback.update(label=f"🖼️ 正在下载并编码图片...", state="running")
     try:
-        response = requests.get(image_url, stream=True)
-        response.raise_for_status()
-
-        # 根据响应头判断图片类型
-        content_type = response.headers.get('Content-Type', 'image/png')
-        if 'image/jpeg' in content_type:
-            image_type = 'jpeg'
-        elif 'image/png' in content_type:
-            image_type = 'png'
-        else:
-            image_type = 'png'
-
-        encoded_image = base64.b64encode(response.content).decode('utf-8')
-        print(f"--- 日志: 图片下载并编码成功。---")
-        return f"data:image/{image_type};base64,{encoded_image}"
+        data_uri, _, num_bytes = _stream_image_as_data_uri(image_url)
+        print(f"--- 日志: 图片下载并编码成功（{num_bytes} 字节）。---")
+        return data_uri
     except requests.exceptions.RequestException as e:
         error_msg = f"❌ 下载图片时出错: {e}"
         if status_callback:
@@ -62,18 +108,154 @@ def download_and_encode_image_as_base64(image_url: str, status_callback=None) ->
         print(f"--- 日志: ❌ 图片编码失败。{error_msg} ---")
         return None
 
+# --- 辅助函数：下载图片、写入缓存并编码 ---
+def _download_encode_and_cache(image_url: str, image_prompt: str, image_model: str, use_image_cache: bool = True) -> Union[str, None]:
+    """
+    一次流式读取同时完成两件事：原始数据块直接写入缓存的临时文件，同时编码为 data URI。
+    """
+    if not use_image_cache:
+        return download_and_encode_image_as_base64(image_url)
+
+    image_cache = get_image_cache()
+    tmp_path = image_cache.new_temp_path()
+    try:
+        with open(tmp_path, "wb") as raw_file:
+            data_uri, content_type, num_bytes = _stream_image_as_data_uri(image_url, raw_write=raw_file.write)
+        image_cache.put_file(image_prompt, image_model, IMAGE_SIZE, tmp_path, content_type, source_url=image_url)
+        print(f"--- 日志: 图片下载、编码并写入缓存成功（{num_bytes} 字节）。---")
+        return data_uri
+    except Exception as e:
+        print(f"--- 日志: ❌ 图片下载或编码失败: {e} ---")
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return None
+
+# --- 辅助函数：下载图片并按输出方式保存 ---
+def _download_image_data(
+    image_url: str,
+    image_prompt: str,
+    image_model: str,
+    use_image_cache: bool = True,
+    image_output_mode: str = "inline",
+    image_transcode: Optional[dict] = None
+) -> Tuple[Union[str, None], Union[str, None], Union[str, None]]:
+    """
+    inline 模式下返回 (data URI, None, None)；external 模式下图片写入 generated_images/<内容哈希>.<扩展名>，
+    返回 (None, 相对于 HTML/JSON 目录的图片路径, None)。失败时返回 (None, None, None)。
+    image_transcode 不为空时先把原图完整下载到本地，转码后再按输出方式处理，第三项为缩略图路径。
+    """
+    if image_transcode:
+        return _download_and_transcode(image_url, image_prompt, image_model, use_image_cache, image_output_mode, image_transcode)
+    if image_output_mode != "external":
+        return _download_encode_and_cache(image_url, image_prompt, image_model, use_image_cache), None, None
+
+    asset_writer = ImageAssetWriter()
+    try:
+        with stage_timer(STAGE_DOWNLOAD) as stage, get_download_pool().stream(image_url) as (chunks, header_content_type):
+            for chunk in chunks:
+                asset_writer.write(chunk)
+            stage.add_bytes(asset_writer.bytes_written)
+        image_path = asset_writer.finish(header_content_type)
+    except Exception as e:
+        asset_writer.abort()
+        print(f"--- 日志: ❌ 图片下载失败: {e} ---")
+        return None, None, None
+    print(f"--- 日志: 图片已保存为外部文件 {image_path}（{asset_writer.bytes_written} 字节）。---")
+    if use_image_cache:
+        _add_asset_to_image_cache(asset_writer, image_prompt, image_model, image_url)
+    return None, image_path, None
+
+# --- 辅助函数：下载原图并转码 ---
+def _download_and_transcode(
+    image_url: str,
+    image_prompt: str,
+    image_model: str,
+    use_image_cache: bool,
+    image_output_mode: str,
+    image_transcode: dict
+) -> Tuple[Union[str, None], Union[str, None], Union[str, None]]:
+    # 缓存中保存的始终是原图，更换转码参数后仍可复用
+    image_cache = get_image_cache()
+    tmp_path = image_cache.new_temp_path()
+    try:
+        with stage_timer(STAGE_DOWNLOAD) as stage, open(tmp_path, "wb") as raw_file, \
+                get_download_pool().stream(image_url) as (chunks, header_content_type):
+            header = b""
+            for chunk in chunks:
+                if len(header) < MAGIC_BYTES_NEEDED:
+                    header += chunk[:MAGIC_BYTES_NEEDED - len(header)]
+                raw_file.write(chunk)
+                stage.add_bytes(len(chunk))
+        content_type = detect_image_type(header) or header_content_type
+        if use_image_cache and image_prompt:
+            source_path = image_cache.put_file(image_prompt, image_model, IMAGE_SIZE, tmp_path, content_type, source_url=image_url)
+        else:
+            source_path = tmp_path
+        return _image_data_from_file(source_path, content_type, image_output_mode, image_transcode)
+    except Exception as e:
+        print(f"--- 日志: ❌ 图片下载或转码失败: {e} ---")
+        return None, None, None
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+# --- 辅助函数：对本地图片文件做后处理，并按输出方式生成图片数据 ---
+@instrument_stage(STAGE_ENCODE, failed=lambda result: not (result[0] or result[1]))
+def _image_data_from_file(
+    file_path: str,
+    content_type: str,
+    image_output_mode: str = "inline",
+    image_transcode: Optional[dict] = None
+) -> Tuple[Union[str, None], Union[str, None], Union[str, None]]:
+    """
+    Returns:
+        Tuple: (data URI, 图片路径, 缩略图路径)，与 _download_image_data 相同。缩略图总是保存为外部文件。
+    """
+    transcoded_path, transcoded_type, thumbnail_tmp_path = (None, None, None)
+    if image_transcode:
+        transcoded_path, transcoded_type, thumbnail_tmp_path = transcode_image_file(file_path, image_transcode, IMAGE_SAVE_PATH)
+    try:
+        if transcoded_path:
+            file_path, content_type = transcoded_path, transcoded_type
+        thumbnail_path = save_image_asset_from_file(thumbnail_tmp_path) if thumbnail_tmp_path else None
+        if image_output_mode == "external":
+            return None, save_image_asset_from_file(file_path, content_type), thumbnail_path
+        return encode_file_as_data_uri(file_path, content_type), None, thumbnail_path
+    finally:
+        for tmp_path in (transcoded_path, thumbnail_tmp_path):
+            if tmp_path and os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+def _add_asset_to_image_cache(asset_writer: ImageAssetWriter, image_prompt: str, image_model: str, image_url: str):
+    # 外部图片文件与缓存文件内容相同，用硬链接登记到缓存中，不重复占用磁盘
+    image_cache = get_image_cache()
+    tmp_path = image_cache.new_temp_path()
+    try:
+        link_or_copy(asset_writer.final_path, tmp_path)
+        image_cache.put_file(image_prompt, image_model, IMAGE_SIZE, tmp_path, asset_writer.content_type, source_url=image_url)
+    except OSError as e:
+        print(f"--- 日志: ⚠️ 写入图片缓存失败: {e} ---")
+
 # --- 函数：调用LLM生成图片提示词（英文） ---
-def generate_image_prompt_from_paragraph(paragraph_content: str, status_callback=None) -> str:
+def generate_image_prompt_from_paragraph(paragraph_content: str, status_callback=None, use_prompt_cache: bool = True) -> str:
     """
     根据一段中文内容，调用LLM生成一个适合文生图模型的英文提示词。
+    相同段落之前生成过提示词时直接返回缓存结果。
     
     Args:
         paragraph_content (str): 用于提炼提示词的中文段落。
         status_callback (streamlit.status): 用于在Streamlit UI中更新状态。
+        use_prompt_cache (bool): 是否使用提示词缓存；关闭后每次都重新生成（提示词带有随机性）。
         
     Returns:
         str: 生成的英文提示词，如果失败则返回空字符串。
     """
+    if use_prompt_cache:
+        cached_prompt = get_prompt_cache().get(paragraph_content, IMAGE_PROMPT_TEMPLATE_VERSION)
+        if cached_prompt:
+            print(f"--- 日志: 图片提示词缓存命中: '{cached_prompt[:50]}...' ---")
+            return cached_prompt
+
     print(f"--- 日志: 开始为段落生成图片提示词: '{paragraph_content[:50]}...' ---")
     
     # 在调用API之前检查API Key
@@ -87,6 +269,31 @@ def generate_image_prompt_from_paragraph(paragraph_content: str, status_callback
     if status_callback:
         status_callback.update(label=f"✨ 正在为图片生成提示词...", state="running")
 
+    try:
+        # 偶发的长尾延迟会拖住整条配图流程，开启对冲时超时后会再发一个相同的请求
+        with stage_timer(STAGE_IMAGE_PROMPT) as stage:
+            response = get_hedger(HEDGER_IMAGE_PROMPT).call(lambda: call_generation(
+                model="qwen-turbo",
+                messages=_build_image_prompt_messages(paragraph_content),
+                result_format='message',
+                temperature=0.9,
+                top_p=0.9
+            ))
+            generated_prompt = _handle_image_prompt_response(response, status_callback=status_callback)
+            if not generated_prompt:
+                stage.fail()
+        if use_prompt_cache:
+            get_prompt_cache().put(paragraph_content, IMAGE_PROMPT_TEMPLATE_VERSION, generated_prompt)
+        return generated_prompt
+    except Exception as e:
+        error_msg = f"❌ 调用 LLM 生成图片提示词时出错: {e}"
+        if status_callback:
+            status_callback.update(label=error_msg, state="error")
+        print(f"--- 日志: ❌ 图片提示词生成异常。{error_msg} ---")
+        return ""
+
+# --- 辅助函数：构造图片提示词生成的对话消息 ---
+def _build_image_prompt_messages(paragraph_content: str) -> List[dict]:
     # 系统提示词：定义LLM生成英文提示词的角色
     system_prompt = "你是一个创意图像提示词生成器。你将根据用户提供的中文段落内容，提炼出关键视觉元素和意境，生成一个简洁、富有想象力、适合图像AI（如Stable Diffusion, DALL-E）生成的高质量英文提示词。提示词应直接表达画面内容，无需任何额外说明或对话。"
     # 用户提示词：提供具体的中文段落
@@ -98,41 +305,130 @@ def generate_image_prompt_from_paragraph(paragraph_content: str, status_callback
 
     英文提示词:
     """
-    messages = [
+    return [
         {'role': 'system', 'content': system_prompt},
         {'role': 'user', 'content': user_prompt}
     ]
 
-    try:
-        response = dashscope.Generation.call(
-            model="qwen-turbo",
-            messages=messages,
-            result_format='message',
-            temperature=0.9,
-            top_p=0.9
+# --- 辅助函数：处理图片提示词生成的响应 ---
+def _handle_image_prompt_response(response, status_callback=None) -> str:
+    if response.status_code == HTTPStatus.OK:
+        generated_prompt = response.output.choices[0].message.content.strip()
+        print(f"--- 日志: 图片提示词生成成功: '{generated_prompt[:50]}...' ---")
+        return generated_prompt
+    else:
+        error_msg = (
+            f"❌ 图片提示词生成失败。状态码: {response.status_code}, "
+            f"错误码: {response.code}, 消息: {response.message}"
         )
-        if response.status_code == HTTPStatus.OK:
-            generated_prompt = response.output.choices[0].message.content.strip()
-            print(f"--- 日志: 图片提示词生成成功: '{generated_prompt[:50]}...' ---")
-            return generated_prompt
-        else:
-            error_msg = (
-                f"❌ 图片提示词生成失败。状态码: {response.status_code}, "
-                f"错误码: {response.code}, 消息: {response.message}"
-            )
-            if status_callback:
-                status_callback.update(label=error_msg, state="error")
-            print(f"--- 日志: ❌ 图片提示词生成失败。{error_msg} ---")
-            return ""
-    except Exception as e:
-        error_msg = f"❌ 调用 LLM 生成图片提示词时出错: {e}"
         if status_callback:
             status_callback.update(label=error_msg, state="error")
-        print(f"--- 日志: ❌ 图片提示词生成异常。{error_msg} ---")
+        print(f"--- 日志: ❌ 图片提示词生成失败。{error_msg} ---")
         return ""
 
+# --- 函数：一次请求为整篇文章的所有图片位置生成提示词 ---
+def generate_image_prompts_for_paragraphs(paragraphs: List[str], status_callback=None, use_prompt_cache: bool = True) -> List[Optional[str]]:
+    """
+    把一篇文章中所有 <IMAGE> 标记前的段落放进同一个请求，让LLM返回一个英文提示词数组。
+    相比逐段调用，系统提示词只发送一次，往返次数从“图片数”降为 1。
+    
+    Args:
+        paragraphs (List[str]): 用于提炼提示词的中文段落列表。
+        status_callback (streamlit.status): 用于在Streamlit UI中更新状态。
+        use_prompt_cache (bool): 是否使用提示词缓存。
+        
+    Returns:
+        List[Optional[str]]: 与 paragraphs 一一对应的提示词；批量结果无法解析时对应位置为 None，
+        调用方应对这些段落退回到 generate_image_prompt_from_paragraph 逐段生成。
+    """
+    prompts, pending = _lookup_cached_prompts(paragraphs, use_prompt_cache)
+    if not pending:
+        return prompts
+    if not dashscope.api_key:
+        print(f"--- 日志: ❌ API Key 未设置，无法批量生成图片提示词。---")
+        return prompts
+
+    print(f"--- 日志: 开始批量生成 {len(pending)} 个图片提示词。---")
+    if status_callback:
+        status_callback.update(label=f"✨ 正在为 {len(pending)} 张图片批量生成提示词...", state="running")
+    try:
+        with stage_timer(STAGE_IMAGE_PROMPT) as stage:
+            response = get_hedger(HEDGER_IMAGE_PROMPT_BATCH).call(lambda: call_generation(
+                model="qwen-turbo",
+                messages=_build_batched_image_prompt_messages(pending),
+                result_format='message',
+                temperature=0.9,
+                top_p=0.9
+            ))
+            generated_prompts = _handle_batched_image_prompt_response(response, len(pending))
+            if not generated_prompts:
+                stage.fail()
+    except Exception as e:
+        print(f"--- 日志: ❌ 批量生成图片提示词时出错，将逐段生成: {e} ---")
+        generated_prompts = None
+    return _merge_batched_prompts(paragraphs, prompts, pending, generated_prompts, use_prompt_cache)
+
+# --- 辅助函数：批量提示词的缓存查询与结果合并 ---
+def _lookup_cached_prompts(paragraphs: List[str], use_prompt_cache: bool) -> Tuple[List[Optional[str]], List[str]]:
+    """返回 (按位置对应的缓存提示词, 去重后仍需生成的段落列表)。"""
+    prompts = [get_prompt_cache().get(p, IMAGE_PROMPT_TEMPLATE_VERSION) if use_prompt_cache else None for p in paragraphs]
+    pending = list(dict.fromkeys(p for p, prompt in zip(paragraphs, prompts) if not prompt))
+    return prompts, pending
+
+def _merge_batched_prompts(
+    paragraphs: List[str],
+    prompts: List[Optional[str]],
+    pending: List[str],
+    generated_prompts: Optional[List[str]],
+    use_prompt_cache: bool
+) -> List[Optional[str]]:
+    if generated_prompts is None:
+        return prompts
+    generated_by_paragraph = dict(zip(pending, generated_prompts))
+    if use_prompt_cache:
+        for paragraph, prompt in generated_by_paragraph.items():
+            get_prompt_cache().put(paragraph, IMAGE_PROMPT_TEMPLATE_VERSION, prompt)
+    return [prompt or generated_by_paragraph.get(paragraph) for paragraph, prompt in zip(paragraphs, prompts)]
+
+# --- 辅助函数：构造批量提示词生成的对话消息 ---
+def _build_batched_image_prompt_messages(paragraphs: List[str]) -> List[dict]:
+    system_prompt = "你是一个创意图像提示词生成器。你将根据用户提供的多个中文段落，分别提炼出每段的关键视觉元素和意境，为每段生成一个简洁、富有想象力、适合图像AI（如Stable Diffusion, DALL-E）生成的高质量英文提示词。你只输出 JSON，不输出任何额外说明或对话。"
+    numbered_paragraphs = "\n".join(f'段落{i + 1}: "{paragraph}"' for i, paragraph in enumerate(paragraphs))
+    user_prompt = f"""
+    请为以下 {len(paragraphs)} 个中文段落分别生成一个用于图像AI的英文提示词（prompt）。
+    请只输出一个 JSON 字符串数组，数组长度必须为 {len(paragraphs)}，第 i 个元素对应第 i 个段落，不要包含任何其他文字。
+
+    {numbered_paragraphs}
+
+    JSON 数组:
+    """
+    return [
+        {'role': 'system', 'content': system_prompt},
+        {'role': 'user', 'content': user_prompt}
+    ]
+
+# --- 辅助函数：解析批量提示词生成的响应 ---
+def _handle_batched_image_prompt_response(response, expected_count: int) -> Optional[List[str]]:
+    """解析出长度为 expected_count 的非空字符串列表；状态码异常或格式不符时返回 None。"""
+    if response.status_code != HTTPStatus.OK:
+        print(f"--- 日志: ❌ 批量图片提示词生成失败。状态码: {response.status_code}, 错误码: {response.code}, 消息: {response.message} ---")
+        return None
+    content = response.output.choices[0].message.content
+    # 模型有时会用 ```json 代码块包裹输出，只取第一个 [ 到最后一个 ] 之间的内容
+    start, end = content.find('['), content.rfind(']')
+    try:
+        generated_prompts = json.loads(content[start:end + 1]) if 0 <= start < end else None
+    except ValueError:
+        generated_prompts = None
+    if (not isinstance(generated_prompts, list) or len(generated_prompts) != expected_count
+            or not all(isinstance(p, str) and p.strip() for p in generated_prompts)):
+        print(f"--- 日志: ⚠️ 批量图片提示词格式不符合预期，将逐段生成: '{content[:80]}...' ---")
+        return None
+    print(f"--- 日志: 批量图片提示词生成成功，共 {expected_count} 个。---")
+    return [p.strip() for p in generated_prompts]
+
 # --- 函数：调用文生图模型 (已优化) ---
-def generate_image_from_prompt(prompt: str, image_model: str, status_callback=None) -> Union[str, None]:
+def generate_image_from_prompt(prompt: str, image_model: str, status_callback=None, use_async_task: bool = False) -> Union[str, None]:
     """
     根据英文提示词，调用指定的文生图模型生成图片。
     
@@ -140,6 +436,7 @@ def generate_image_from_prompt(prompt: str, image_model: str, status_callback=No
         prompt (str): 英文图片提示词。
         image_model (str): 文生图模型名称。
         status_callback (streamlit.status): 用于在Streamlit UI中更新状态。
+        use_async_task (bool): 是否以异步任务方式提交并等待轮询结果，而不是阻塞调用。
         
     Returns:
         Union[str, None]: 生成图片的URL，如果失败则返回None。
@@ -158,14 +455,24 @@ def generate_image_from_prompt(prompt: str, image_model: str, status_callback=No
     
     if status_callback:
         status_callback.update(label=f"🎨 正在调用文生图模型生成图片...", state="running")
+
+    if use_async_task:
+        image_url = submit_image_from_prompt(prompt, image_model).result()
+        if not image_url and status_callback:
+            status_callback.update(label="❌ 文生图任务失败或超时。", state="error")
+        return image_url
+
     try:
         # 调用 DashScope 的文生图服务
-        rsp = dashscope.ImageSynthesis.call(
-            model=image_model,
-            prompt=prompt,
-            n=1,
-            size='1280*720',
-        )
+        with stage_timer(STAGE_IMAGE_SYNTHESIS) as stage:
+            rsp = call_image_synthesis(
+                model=image_model,
+                prompt=prompt,
+                n=1,
+                size=IMAGE_SIZE,
+            )
+            if rsp.status_code != HTTPStatus.OK or not (rsp.output and rsp.output.results):
+                stage.fail()
         print(f"--- 日志: 文生图调用成功，开始处理结果 ---")
         print(f"--- 日志: 文生图调用状态码: {rsp.status_code}, 错误码: {rsp.code}, 消息: {rsp.message} ---")
         print(f"--- 日志: 文生图调用结果: {rsp.output} ---")
@@ -196,38 +503,245 @@ def generate_image_from_prompt(prompt: str, image_model: str, status_callback=No
         print(f"--- 日志: ❌ 调用文生图模型异常。{error_msg} ---")
         return ""
 
-# --- 主要处理函数：解析文章并生成图片 ---
-# --- 主要处理函数：解析文章并生成图片 (已修改) ---
-def process_article_and_generate_images(
-    article_content: str, 
-    enable_image_generation: bool = True, 
-    image_model: str = "wanx-v1",
-    status_callback=None
-) -> List[dict]:
+# --- 函数：以异步任务方式提交文生图请求 ---
+def submit_image_from_prompt(prompt: str, image_model: str) -> Future:
     """
-    解析文章内容，通过 <IMAGE> 标记进行内容分割，并为每个分割块调用文生图服务。
+    通过 ImageSynthesis.async_call 提交文生图任务，立即返回 Future，由共享的轮询线程在任务结束时填入结果。
     
     Args:
-        article_content (str): 待处理的文章内容。
-        enable_image_generation (bool): 是否启用文生图功能。
+        prompt (str): 英文图片提示词。
         image_model (str): 文生图模型名称。
-        status_callback (streamlit.status): 用于在Streamlit UI中更新状态。
         
     Returns:
-        List[dict]: 包含处理后的段落和图片信息的列表。
+        Future: 结果为生成图片的URL，失败或超时则为None。
     """
-    print(f"--- 日志: 开始按 <IMAGE> 标记处理文章以插入图片。---")
-    if status_callback:
-        status_callback.update(label="文章图片处理开始...", state="running")
+    if not prompt or not dashscope.api_key:
+        print(f"--- 日志: ❌ 提示词为空或 API Key 未设置，跳过文生图任务提交。---")
+        future = Future()
+        future.set_result(None)
+        return future
+    print(f"--- 日志: 提交文生图任务，模型 '{image_model}'，提示词: '{prompt[:50]}...' ---")
+    return observe_future(STAGE_IMAGE_SYNTHESIS, get_image_task_poller().submit(prompt, image_model, size=IMAGE_SIZE))
 
-    # 按 <IMAGE> 标记分割文章内容，并保留标记在每个分割块的末尾（除了最后一个）
-    # 使用 re.split 可以更灵活地处理标记
-    # re.split 会在分隔符两侧都进行分割，所以如果标记在开头或结尾，会产生空字符串
-    # 为了简化，我们按标记分割，然后手动处理插入图片的时机
+# --- 辅助函数：构造图片元素 ---
+def _make_image_element(paragraph_for_image_prompt: str, image_prompt: str = "", image_url=None, base64_image_data=None, image_path=None, thumbnail_path=None) -> dict:
+    if not isinstance(base64_image_data, str):
+        base64_image_data = None
+        if not image_path:
+            print("--- 日志: ⚠️ 警告: 图片Base64编码失败或返回非字符串类型，将存储为None。---")
+    return {
+        "type": "image",
+        "content": paragraph_for_image_prompt, # 记录用于生成图片的原始中文内容
+        "generated_prompt": image_prompt,
+        "generated_image_url_original": image_url,
+        "base64_image_data": base64_image_data,
+        "image_path": image_path, # external 模式下图片文件相对于 HTML/JSON 目录的路径
+        "thumbnail_path": thumbnail_path # 开启缩略图时缩略图文件的相对路径
+    }
+
+# --- 辅助函数：取得图片元素在 HTML 中的 src ---
+def image_element_src(image_element: dict) -> Union[str, None]:
+    """external 模式返回图片文件的相对路径，inline 模式返回 data URI；图片生成失败时返回 None。"""
+    return image_element.get("image_path") or image_element.get("base64_image_data")
+
+# --- 辅助函数：从图片缓存中构造图片元素 ---
+def _cached_image_element(
+    paragraph_for_image_prompt: str,
+    image_prompt: str,
+    image_model: str,
+    image_output_mode: str = "inline",
+    image_transcode: Optional[dict] = None
+) -> Union[dict, None]:
+    """
+    如果相同的提示词和模型之前已经生成过图片，直接用缓存的图片文件构造图片元素，未命中则返回None。
+    缓存文件在查询之后被并发淘汰、或读取/转码/链接失败时同样返回 None，由调用方重新生成图片。
+    """
+    cached = get_image_cache().get_path(image_prompt, image_model, IMAGE_SIZE)
+    if cached is None:
+        return None
+    file_path, content_type, source_url = cached
+    try:
+        image_data = _image_data_from_file(file_path, content_type, image_output_mode, image_transcode)
+    except OSError as e:
+        print(f"--- 日志: ⚠️ 读取缓存图片失败，将重新生成: {e} ---")
+        return None
+    print(f"--- 日志: 图片缓存命中，跳过文生图调用: '{image_prompt[:50]}...' ---")
+    return _make_image_element(paragraph_for_image_prompt, image_prompt, source_url, *image_data)
+
+# --- 辅助函数：为单个 <IMAGE> 标记生成图片元素 ---
+def _generate_image_element(
+    paragraph_for_image_prompt: str,
+    image_model: str,
+    status_callback=None,
+    use_image_cache: bool = True,
+    use_prompt_cache: bool = True,
+    image_prompt: Optional[str] = None,
+    use_async_task: bool = False,
+    image_output_mode: str = "inline",
+    image_transcode: Optional[dict] = None
+) -> dict:
+    """
+    为一个图片位置完成“提示词 -> 文生图 -> 下载编码”的完整链路，返回图片元素。
+    已经批量生成好提示词时通过 image_prompt 传入，跳过提示词生成。
+    任何一步失败都只会让该图片的数据为 None，不会抛出异常影响其他图片。
+    """
+    print(f"--- 日志: 检测到 <IMAGE> 标记，准备为段落 '{paragraph_for_image_prompt[:50]}...' 生成图片。---")
+    image_url = None
+    image_data = (None, None, None)
+    try:
+        # 调用“取词器”生成英文提示词
+        if not image_prompt:
+            image_prompt = generate_image_prompt_from_paragraph(paragraph_for_image_prompt, status_callback=status_callback, use_prompt_cache=use_prompt_cache)
+
+        # 相同提示词和模型之前生成过图片时直接复用
+        cached_element = _cached_image_element(paragraph_for_image_prompt, image_prompt, image_model, image_output_mode, image_transcode) if use_image_cache else None
+        if cached_element:
+            return cached_element
+
+        # 调用文生图模型生成图片
+        image_url = generate_image_from_prompt(image_prompt, image_model, status_callback=status_callback, use_async_task=use_async_task)
+
+        if image_url:
+            # 下载、缓存并编码（或保存为外部文件）图片
+            image_data = _download_image_data(image_url, image_prompt, image_model, use_image_cache, image_output_mode, image_transcode)
+    except Exception as e:
+        print(f"--- 日志: ❌ 为段落 '{paragraph_for_image_prompt[:30]}...' 生成图片时出现异常: {e} ---")
+
+    return _make_image_element(paragraph_for_image_prompt, image_prompt or "", image_url, *image_data)
+
+# --- 辅助函数：阻塞模式下并发生成所有图片 ---
+def _iter_image_elements_sync(
+    image_slots: List[Tuple[int, str]],
+    image_model: str,
+    max_image_workers: int,
+    use_image_cache: bool = True,
+    use_prompt_cache: bool = True,
+    known_prompts: Optional[Dict[int, str]] = None,
+    image_output_mode: str = "inline",
+    image_transcode: Optional[dict] = None
+) -> Iterator[Tuple[int, dict]]:
+    """
+    每个图片位置占用一个工作线程完成整条链路，按完成顺序产出 (元素下标, 图片元素)。
+    known_prompts 为已批量生成的 {元素下标: 提示词}，其余位置逐段生成提示词。
+    """
+    known_prompts = known_prompts or {}
+    with ThreadPoolExecutor(max_workers=max(1, min(max_image_workers, len(image_slots))), thread_name_prefix="image") as executor:
+        futures = {
+            submit_in_context(
+                executor, _generate_image_element, paragraph, image_model, None, use_image_cache, use_prompt_cache,
+                known_prompts.get(element_index), False, image_output_mode, image_transcode
+            ): element_index
+            for element_index, paragraph in image_slots
+        }
+        for future in as_completed(futures):
+            yield futures[future], future.result()
+
+# --- 辅助函数：异步任务模式下生成所有图片 ---
+def _iter_image_elements_async(
+    image_slots: List[Tuple[int, str]],
+    image_model: str,
+    max_image_workers: int,
+    use_image_cache: bool = True,
+    use_prompt_cache: bool = True,
+    known_prompts: Optional[Dict[int, str]] = None,
+    image_output_mode: str = "inline",
+    image_transcode: Optional[dict] = None
+) -> Iterator[Tuple[int, dict]]:
+    """
+    提示词生成完成后立即提交文生图任务，渲染期间不占用工作线程，任务结束后再下载编码。
+    known_prompts 为已批量生成的 {元素下标: 提示词}，这些位置直接提交文生图任务。
+    按完成顺序产出 (元素下标, 图片元素)。
+    """
+    paragraphs = dict(image_slots)
+    prompts = dict(known_prompts or {})
+    image_urls = {}
+    task_futures = {}
+
+    def _start_image_task(element_index: int) -> Union[dict, None]:
+        """命中图片缓存时返回图片元素，否则提交文生图任务并返回 None。"""
+        cached_element = None
+        if use_image_cache:
+            try:
+                cached_element = _cached_image_element(
+                    paragraphs[element_index], prompts[element_index], image_model, image_output_mode, image_transcode
+                )
+            except Exception as e:
+                # 与阻塞模式一致：缓存出错只影响这一张图片，按未命中处理
+                print(f"--- 日志: ⚠️ 查询图片缓存时出现异常，将重新生成: {e} ---")
+        if cached_element:
+            return cached_element
+        task_futures[submit_image_from_prompt(prompts[element_index], image_model)] = element_index
+        return None
+
+    def _safe_result(future, default):
+        try:
+            return future.result()
+        except Exception as e:
+            print(f"--- 日志: ❌ 图片生成链路出现异常: {e} ---")
+            return default
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_image_workers, len(image_slots))), thread_name_prefix="image") as executor:
+        # 第一阶段：并发生成提示词，每得到一个提示词就提交一个文生图任务
+        prompt_futures = {
+            submit_in_context(executor, generate_image_prompt_from_paragraph, paragraph, None, use_prompt_cache): element_index
+            for element_index, paragraph in image_slots if element_index not in prompts
+        }
+        for element_index in list(prompts):
+            cached_element = _start_image_task(element_index)
+            if cached_element:
+                yield element_index, cached_element
+        for future in as_completed(prompt_futures):
+            element_index = prompt_futures[future]
+            prompts[element_index] = _safe_result(future, "")
+            cached_element = _start_image_task(element_index)
+            if cached_element:
+                yield element_index, cached_element
+
+        # 第二阶段：等待任务完成，任务一结束就提交下载编码
+        download_futures = {}
+        for future in as_completed(task_futures):
+            element_index = task_futures[future]
+            image_urls[element_index] = _safe_result(future, None)
+            if image_urls[element_index]:
+                download_futures[submit_in_context(
+                    executor, _download_image_data, image_urls[element_index], prompts[element_index], image_model,
+                    use_image_cache, image_output_mode, image_transcode
+                )] = element_index
+            else:
+                yield element_index, _make_image_element(paragraphs[element_index], prompts[element_index])
+
+        # 第三阶段：下载编码完成后产出图片元素
+        for future in as_completed(download_futures):
+            element_index = download_futures[future]
+            yield element_index, _make_image_element(
+                paragraphs[element_index], prompts[element_index], image_urls[element_index], *_safe_result(future, (None, None, None))
+            )
+
+# --- 辅助函数：确定用于生成图片提示词的段落 ---
+def _paragraph_for_image_prompt(cleaned_part: str, previous_element: Optional[dict]) -> str:
+    # 如果当前块有内容，就用当前块；否则，如果前面有段落，用前一个段落；再否则，用默认提示词。
+    paragraph_for_image_prompt = cleaned_part if cleaned_part else (
+        previous_element['content'] if previous_element and previous_element['type'] == 'paragraph' else "相关场景"
+    )
+    
+    # 确保提示词不为空
+    if not paragraph_for_image_prompt.strip():
+        paragraph_for_image_prompt = "通用场景"
+    return paragraph_for_image_prompt
+
+# --- 辅助函数：按 <IMAGE> 标记拆分文章并预留图片位置 ---
+def _split_article_into_slots(article_content: str, enable_image_generation: bool) -> Tuple[List[dict], List[Tuple[int, str]]]:
+    """
+    按文档顺序放置段落，并为每个 <IMAGE> 标记在元素列表中预留一个 None 占位。
+    
+    Returns:
+        Tuple[List[dict], List[Tuple[int, str]]]: 元素列表，以及待生成图片的 (元素下标, 用于生成提示词的段落) 列表。
+    """
+    # 按 <IMAGE> 标记分割文章内容：除最后一块外，每个分割块后面都跟着一个 <IMAGE> 标记
     parts = article_content.split(AI_IMAGE_INTENT_MARKER)
     
     processed_elements = [] # 存储处理后的元素（段落或图片）
-    image_inserted_count = 0 # 统计插入的图片数量
+    image_slots = [] # 存储待生成图片的位置：(元素下标, 用于生成提示词的段落)
 
     for i, part_content in enumerate(parts):
         # 清理每个分割块的内容
@@ -240,49 +754,499 @@ def process_article_and_generate_images(
 
         # 如果这不是最后一个分割块，意味着后面有一个 <IMAGE> 标记，需要插入图片
         if i < len(parts) - 1 and enable_image_generation:
-            # 提取用于生成图片提示词的段落内容
-            # 如果当前块有内容，就用当前块；否则，如果前面有段落，用前一个段落；再否则，用默认提示词。
-            paragraph_for_image_prompt = cleaned_part if cleaned_part else (
-                processed_elements[-1]['content'] if processed_elements and processed_elements[-1]['type'] == 'paragraph' else "相关场景"
-            )
-            
-            # 确保提示词不为空
-            if not paragraph_for_image_prompt.strip():
-                paragraph_for_image_prompt = "通用场景"
+            paragraph_for_image_prompt = _paragraph_for_image_prompt(cleaned_part, processed_elements[-1] if processed_elements else None)
+            image_slots.append((len(processed_elements), paragraph_for_image_prompt))
+            processed_elements.append(None) # 占位，图片生成完成后填入
 
-            print(f"--- 日志: 检测到 <IMAGE> 标记，准备为段落 '{paragraph_for_image_prompt[:50]}...' 生成图片。---")
+    return processed_elements, image_slots
 
-            # 调用“取词器”生成英文提示词
-            image_prompt = generate_image_prompt_from_paragraph(paragraph_for_image_prompt, status_callback=status_callback)
-            
-            # 调用文生图模型生成图片
-            image_url = generate_image_from_prompt(image_prompt, image_model, status_callback=status_callback)
-            
-            base64_image_data = None
-            if image_url:
-                # 下载并编码图片
-                base64_image_data = download_and_encode_image_as_base64(image_url, status_callback=status_callback)
-            
-            if not isinstance(base64_image_data, str):
-                base64_image_data = None
-                if status_callback:
-                    status_callback.update(label="⚠️ 图片Base64编码失败，将跳过此图片。", state="running")
-                print("--- 日志: ⚠️ 警告: 图片Base64编码失败或返回非字符串类型，将存储为None。---")
-
-            # 将图片信息作为元素添加到列表中
-            processed_elements.append({
-                "type": "image",
-                "content": paragraph_for_image_prompt, # 记录用于生成图片的原始中文内容
-                "generated_prompt": image_prompt,
-                "generated_image_url_original": image_url,
-                "base64_image_data": base64_image_data
-            })
-            if status_callback:
-                status_callback.update(label=f"🖼️ 已为段落 '{paragraph_for_image_prompt[:30]}...' 插入图片。", state="running")
-            print(f"--- 日志: 已按 <IMAGE> 标记插入图片。---")
+# --- 辅助函数：报告单张图片的处理结果 ---
+def _report_image_element(image_element: dict, status_callback=None):
+    if image_element_src(image_element):
+        if status_callback:
+            status_callback.update(label=f"🖼️ 已为段落 '{image_element['content'][:30]}...' 插入图片。", state="running")
+        print(f"--- 日志: 已按 <IMAGE> 标记插入图片。---")
+    else:
+        if status_callback:
+            status_callback.update(label="⚠️ 图片生成或Base64编码失败，将跳过此图片。", state="running")
+
+# --- 主要处理函数：解析文章并生成图片 ---
+def process_article_and_generate_images(
+    article_content: str, 
+    enable_image_generation: bool = True, 
+    image_model: str = "wanx-v1",
+    status_callback=None,
+    max_image_workers: int = 3,
+    image_synthesis_mode: str = "sync",
+    use_image_cache: bool = True,
+    use_prompt_cache: bool = True,
+    batch_image_prompts: bool = True,
+    image_output_mode: str = "inline",
+    image_transcode: Optional[dict] = None
+) -> List[dict]:
+    """
+    解析文章内容，通过 <IMAGE> 标记进行内容分割，并为每个分割块调用文生图服务。
+    各个图片位置会并发生成（最多 max_image_workers 个同时进行），最终仍按文档顺序组装。
+    image_synthesis_mode 为 "async" 时，文生图以异步任务方式提交，渲染期间不占用工作线程。
+    batch_image_prompts 为 True 时，先用一次LLM请求生成全部提示词，解析失败的位置再逐段生成。
+    image_output_mode 为 "external" 时，图片保存为 generated_images/ 下的文件，元素中只记录相对路径（image_path）。
+    image_transcode 不为空（且已安装 Pillow）时，下载的原图在进程池中转码/缩放后再输出。
+    
+    Args:
+        article_content (str): 待处理的文章内容。
+        enable_image_generation (bool): 是否启用文生图功能。
+        image_model (str): 文生图模型名称。
+        status_callback (streamlit.status): 用于在Streamlit UI中更新状态。
+        max_image_workers (int): 同时生成的图片数量上限。
+        image_synthesis_mode (str): 文生图调用方式，"sync" 或 "async"。
+        use_image_cache (bool): 是否复用之前为相同提示词和模型生成过的图片。
+        use_prompt_cache (bool): 是否复用之前为相同段落生成过的图片提示词。
+        batch_image_prompts (bool): 是否一次请求生成整篇文章的图片提示词。
+        image_output_mode (str): 图片输出方式，"inline"（Base64 内嵌）或 "external"（引用图片文件）。
+        image_transcode (dict): 图片后处理参数，键见 image_transcode.DEFAULT_TRANSCODE_OPTIONS（format、quality、max_width、thumbnail_width）。
+        
+    Returns:
+        List[dict]: 包含处理后的段落和图片信息的列表。
+
+    Raises:
+        ValueError: image_output_mode 或 image_transcode 中的格式不是可选值之一时抛出。
+    """
+    print(f"--- 日志: 开始按 <IMAGE> 标记处理文章以插入图片。---")
+    if status_callback:
+        status_callback.update(label="文章图片处理开始...", state="running")
+    image_output_mode = resolve_image_output_mode(image_output_mode)
+    image_transcode = resolve_transcode_options(image_transcode)
+
+    processed_elements, image_slots = _split_article_into_slots(article_content, enable_image_generation)
+
+    # 并发生成所有图片，单张图片失败不影响其他图片
+    image_inserted_count = 0
+    if image_slots:
+        known_prompts = None
+        if batch_image_prompts and len(image_slots) > 1:
+            batched_prompts = generate_image_prompts_for_paragraphs([p for _, p in image_slots], status_callback=status_callback, use_prompt_cache=use_prompt_cache)
+            known_prompts = {element_index: prompt for (element_index, _), prompt in zip(image_slots, batched_prompts) if prompt}
+        iter_image_elements = _iter_image_elements_async if image_synthesis_mode == "async" else _iter_image_elements_sync
+        for element_index, image_element in iter_image_elements(
+            image_slots, image_model, max_image_workers, use_image_cache, use_prompt_cache, known_prompts, image_output_mode, image_transcode
+        ):
+            processed_elements[element_index] = image_element
+            _report_image_element(image_element, status_callback)
             image_inserted_count += 1
             
     if status_callback:
         status_callback.update(label=f"文章处理完成。共 {len(processed_elements)} 个元素 (插入图片: {image_inserted_count})。", state="complete")
     print(f"--- 日志: 文章图片处理完成。共 {len(processed_elements)} 个元素。插入图片总数: {image_inserted_count}。---")
     return processed_elements
+
+# --- 主要处理函数：边接收文章文本边生成图片 ---
+def process_streamed_article_and_generate_images(
+    text_chunks: Iterable[str],
+    enable_image_generation: bool = True,
+    image_model: str = "wanx-v1",
+    status_callback=None,
+    max_image_workers: int = 3,
+    image_synthesis_mode: str = "sync",
+    use_image_cache: bool = True,
+    use_prompt_cache: bool = True,
+    image_output_mode: str = "inline",
+    image_transcode: Optional[dict] = None
+) -> Tuple[str, List[dict]]:
+    """
+    逐个接收文章文本片段（例如 article_writer.stream_article_content 的输出），
+    每当一个段落及其后的 <IMAGE> 标记到齐，就立即提交该位置的图片生成，
+    因此单篇文章的总耗时接近 max(文本生成, 图片生成)，而不是两者之和。
+    段落是逐个到达的，这里不使用批量提示词生成。
+    
+    Args:
+        text_chunks (Iterable[str]): 按顺序到达的文章文本片段。
+        其余参数与 process_article_and_generate_images 相同。
+        
+    Returns:
+        Tuple[str, List[dict]]: (完整文章内容, 按文档顺序组装的元素列表)。文本流中途失败时返回 ("", [])。
+    """
+    print(f"--- 日志: 开始边接收文章边生成图片。---")
+    received_parts = []
+    pending_text = "" # 最近一个 <IMAGE> 标记之后、尚未配图的文本
+    image_futures = [] # 按标记出现顺序排列
+    use_async_task = image_synthesis_mode == "async"
+    image_output_mode = resolve_image_output_mode(image_output_mode)
+    image_transcode = resolve_transcode_options(image_transcode) if enable_image_generation else None
+
+    with ThreadPoolExecutor(max_workers=max(1, max_image_workers), thread_name_prefix="image") as executor:
+        def _submit_image(paragraph: str) -> Future:
+            return submit_in_context(
+                executor, _generate_image_element, paragraph, image_model, None, use_image_cache, use_prompt_cache, None, use_async_task,
+                image_output_mode, image_transcode
+            )
+
+        try:
+            for delta in text_chunks:
+                received_parts.append(delta)
+                if not enable_image_generation:
+                    continue
+                # 标记可能被拆在两个片段之间，因此在累积的文本中查找
+                pending_text += delta
+                while AI_IMAGE_INTENT_MARKER in pending_text:
+                    part_content, pending_text = pending_text.split(AI_IMAGE_INTENT_MARKER, 1)
+                    # 前一个元素总是上一个标记的图片占位，与 _split_article_into_slots 的取段规则一致
+                    paragraph_for_image_prompt = _paragraph_for_image_prompt(part_content.strip(), None)
+                    print(f"--- 日志: 流中出现 <IMAGE> 标记，提前为段落 '{paragraph_for_image_prompt[:30]}...' 生成图片。---")
+                    image_futures.append(_submit_image(paragraph_for_image_prompt))
+        except Exception as e:
+            for future in image_futures:
+                future.cancel()
+            error_msg = f"❌ 文章文本流中断: {e}"
+            if status_callback:
+                status_callback.update(label=error_msg, state="error")
+            print(f"--- 日志: {error_msg} ---")
+            return "", []
+
+        article_content = "".join(received_parts).strip()
+        processed_elements, image_slots = _split_article_into_slots(article_content, enable_image_generation)
+        # 正常情况下两者数量相同；万一不同，多出的位置在这里补提交
+        image_futures.extend(_submit_image(paragraph) for _, paragraph in image_slots[len(image_futures):])
+
+        for (element_index, _), future in zip(image_slots, image_futures):
+            image_element = future.result()
+            processed_elements[element_index] = image_element
+            _report_image_element(image_element, status_callback)
+
+    print(f"--- 日志: 文章图片处理完成 (流式)。共 {len(processed_elements)} 个元素。插入图片总数: {len(image_slots)}。---")
+    return article_content, processed_elements
+
+# ============================================================
+# asyncio 版本：与上面的同步函数一一对应，输出格式完全相同
+# ============================================================
+
+# --- 函数：download_and_encode_image_as_base64 的 asyncio 版本 ---
+async def download_and_encode_image_as_base64_async(image_url: str, http_session=None, status_callback=None) -> Union[str, None]:
+    """
+    下载图片并编码为带数据类型前缀的 Base64 字符串，失败时返回None。
+    """
+    if status_callback:
+        status_callback.update(label=f"🖼️ 正在下载并编码图片...", state="running")
+    try:
+        data_uri, _, _ = await _stream_image_as_data_uri_async(image_url, http_session=http_session)
+        return data_uri
+    except Exception as e:
+        error_msg = f"❌ 下载图片时出错: {e}"
+        if status_callback:
+            status_callback.update(label=error_msg, state="error")
+        print(f"--- 日志: ❌ 图片下载失败。{error_msg} ---")
+        return None
+
+# --- 辅助函数：_stream_image_as_data_uri 的 asyncio 版本 ---
+async def _stream_image_as_data_uri_async(
+    image_url: str,
+    http_session=None,
+    raw_write: Optional[Callable[[bytes], object]] = None
+) -> Tuple[str, str, int]:
+    if aiohttp is None:
+        return await asyncio.to_thread(_stream_image_as_data_uri, image_url, raw_write)
+
+    owns_session = http_session is None
+    session = aiohttp.ClientSession() if owns_session else http_session
+    download_stats = get_download_pool().stats
+    encoded_parts = []
+    start = time.monotonic()
+    try:
+        timeout = aiohttp.ClientTimeout(sock_connect=DOWNLOAD_CONNECT_TIMEOUT, sock_read=DOWNLOAD_READ_TIMEOUT)
+        with stage_timer(STAGE_DOWNLOAD) as stage:
+            async with session.get(image_url, timeout=timeout) as response:
+                response.raise_for_status()
+                encoder = DataUriStreamEncoder(encoded_parts.append, response.headers.get('Content-Type', 'image/png'))
+                async for chunk in response.content.iter_chunked(DOWNLOAD_CHUNK_SIZE):
+                    if raw_write is not None:
+                        raw_write(chunk)
+                    encoder.feed(chunk)
+                content_type, num_bytes = encoder.close()
+            stage.add_bytes(num_bytes)
+    except Exception:
+        download_stats.record_failure()
+        raise
+    finally:
+        if owns_session:
+            await session.close()
+    download_stats.record(num_bytes, time.monotonic() - start)
+    return "".join(encoded_parts), content_type, num_bytes
+
+# --- 辅助函数：_download_encode_and_cache 的 asyncio 版本 ---
+async def _download_encode_and_cache_async(
+    image_url: str,
+    image_prompt: str,
+    image_model: str,
+    use_image_cache: bool = True,
+    http_session=None
+) -> Union[str, None]:
+    if not use_image_cache:
+        return await download_and_encode_image_as_base64_async(image_url, http_session=http_session)
+
+    image_cache = get_image_cache()
+    tmp_path = image_cache.new_temp_path()
+    try:
+        with open(tmp_path, "wb") as raw_file:
+            data_uri, content_type, _ = await _stream_image_as_data_uri_async(image_url, http_session=http_session, raw_write=raw_file.write)
+        await asyncio.to_thread(image_cache.put_file, image_prompt, image_model, IMAGE_SIZE, tmp_path, content_type, image_url)
+        return data_uri
+    except Exception as e:
+        print(f"--- 日志: ❌ 图片下载或编码失败: {e} ---")
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return None
+
+# --- 辅助函数：_download_image_data 的 asyncio 版本 ---
+async def _download_image_data_async(
+    image_url: str,
+    image_prompt: str,
+    image_model: str,
+    use_image_cache: bool = True,
+    image_output_mode: str = "inline",
+    http_session=None,
+    image_transcode: Optional[dict] = None
+) -> Tuple[Union[str, None], Union[str, None], Union[str, None]]:
+    if image_transcode or (image_output_mode == "external" and aiohttp is None):
+        # 转码本身在进程池中执行，这里只需要一个线程等待下载和转码完成
+        return await asyncio.to_thread(
+            _download_image_data, image_url, image_prompt, image_model, use_image_cache, image_output_mode, image_transcode
+        )
+    if image_output_mode != "external":
+        return await _download_encode_and_cache_async(image_url, image_prompt, image_model, use_image_cache, http_session), None, None
+
+    owns_session = http_session is None
+    session = aiohttp.ClientSession() if owns_session else http_session
+    download_stats = get_download_pool().stats
+    asset_writer = ImageAssetWriter()
+    start = time.monotonic()
+    try:
+        timeout = aiohttp.ClientTimeout(sock_connect=DOWNLOAD_CONNECT_TIMEOUT, sock_read=DOWNLOAD_READ_TIMEOUT)
+        with stage_timer(STAGE_DOWNLOAD) as stage:
+            async with session.get(image_url, timeout=timeout) as response:
+                response.raise_for_status()
+                async for chunk in response.content.iter_chunked(DOWNLOAD_CHUNK_SIZE):
+                    asset_writer.write(chunk)
+                stage.add_bytes(asset_writer.bytes_written)
+        image_path = asset_writer.finish(response.headers.get('Content-Type', 'image/png'))
+    except Exception as e:
+        asset_writer.abort()
+        download_stats.record_failure()
+        print(f"--- 日志: ❌ 图片下载失败: {e} ---")
+        return None, None, None
+    finally:
+        if owns_session:
+            await session.close()
+    download_stats.record(asset_writer.bytes_written, time.monotonic() - start)
+    print(f"--- 日志: 图片已保存为外部文件 {image_path}（{asset_writer.bytes_written} 字节）。---")
+    if use_image_cache:
+        await asyncio.to_thread(_add_asset_to_image_cache, asset_writer, image_prompt, image_model, image_url)
+    return None, image_path, None
+
+# --- 函数：generate_image_prompt_from_paragraph 的 asyncio 版本 ---
+async def generate_image_prompt_from_paragraph_async(paragraph_content: str, status_callback=None, use_prompt_cache: bool = True) -> str:
+    """
+    与 generate_image_prompt_from_paragraph 相同，但以协程方式等待 LLM 响应。
+    """
+    if use_prompt_cache:
+        cached_prompt = get_prompt_cache().get(paragraph_content, IMAGE_PROMPT_TEMPLATE_VERSION)
+        if cached_prompt:
+            print(f"--- 日志: 图片提示词缓存命中: '{cached_prompt[:50]}...' ---")
+            return cached_prompt
+
+    print(f"--- 日志: 开始为段落生成图片提示词 (async): '{paragraph_content[:50]}...' ---")
+    if not dashscope.api_key:
+        error_msg = "❌ API Key 未设置，无法调用 LLM 生成提示词。"
+        if status_callback:
+            status_callback.update(label=error_msg, state="error")
+        print(f"--- 日志: {error_msg} ---")
+        return ""
+
+    try:
+        with stage_timer(STAGE_IMAGE_PROMPT) as stage:
+            response = await get_hedger(HEDGER_IMAGE_PROMPT).call_async(lambda: call_generation_async(
+                model="qwen-turbo",
+                messages=_build_image_prompt_messages(paragraph_content),
+                result_format='message',
+                temperature=0.9,
+                top_p=0.9
+            ))
+            generated_prompt = _handle_image_prompt_response(response, status_callback=status_callback)
+            if not generated_prompt:
+                stage.fail()
+        if use_prompt_cache:
+            await asyncio.to_thread(get_prompt_cache().put, paragraph_content, IMAGE_PROMPT_TEMPLATE_VERSION, generated_prompt)
+        return generated_prompt
+    except Exception as e:
+        error_msg = f"❌ 调用 LLM 生成图片提示词时出错: {e}"
+        if status_callback:
+            status_callback.update(label=error_msg, state="error")
+        print(f"--- 日志: ❌ 图片提示词生成异常。{error_msg} ---")
+        return ""
+
+# --- 函数：generate_image_prompts_for_paragraphs 的 asyncio 版本 ---
+async def generate_image_prompts_for_paragraphs_async(paragraphs: List[str], status_callback=None, use_prompt_cache: bool = True) -> List[Optional[str]]:
+    """
+    与 generate_image_prompts_for_paragraphs 相同，但以协程方式等待 LLM 响应。
+    """
+    prompts, pending = _lookup_cached_prompts(paragraphs, use_prompt_cache)
+    if not pending or not dashscope.api_key:
+        return prompts
+
+    print(f"--- 日志: 开始批量生成 {len(pending)} 个图片提示词 (async)。---")
+    try:
+        with stage_timer(STAGE_IMAGE_PROMPT) as stage:
+            response = await get_hedger(HEDGER_IMAGE_PROMPT_BATCH).call_async(lambda: call_generation_async(
+                model="qwen-turbo",
+                messages=_build_batched_image_prompt_messages(pending),
+                result_format='message',
+                temperature=0.9,
+                top_p=0.9
+            ))
+            generated_prompts = _handle_batched_image_prompt_response(response, len(pending))
+            if not generated_prompts:
+                stage.fail()
+    except Exception as e:
+        print(f"--- 日志: ❌ 批量生成图片提示词时出错，将逐段生成: {e} ---")
+        generated_prompts = None
+    return await asyncio.to_thread(_merge_batched_prompts, paragraphs, prompts, pending, generated_prompts, use_prompt_cache)
+
+# --- 函数：generate_image_from_prompt 的 asyncio 版本 ---
+@instrument_stage(STAGE_IMAGE_SYNTHESIS)
+async def generate_image_from_prompt_async(
+    prompt: str,
+    image_model: str,
+    status_callback=None,
+    poll_interval: float = 2.0,
+    task_timeout: float = 600.0
+) -> Union[str, None]:
+    """
+    以异步任务方式提交文生图请求，并在事件循环中轮询任务状态，渲染期间不占用任何线程。
+    
+    Returns:
+        Union[str, None]: 生成图片的URL，如果失败或超时则返回None。
+    """
+    print(f"--- 日志: 开始提交文生图任务 (async) '{image_model}'，提示词: '{prompt[:50]}...' ---")
+    if not prompt:
+        return None
+    if not dashscope.api_key:
+        error_msg = "❌ API Key 未设置，无法调用文生图模型。"
+        if status_callback:
+            status_callback.update(label=error_msg, state="error")
+        print(f"--- 日志: {error_msg} ---")
+        return None
+
+    try:
+        rsp = await submit_image_synthesis_async(model=image_model, prompt=prompt, n=1, size=IMAGE_SIZE)
+        if rsp.status_code != HTTPStatus.OK or not rsp.output or not rsp.output.task_id:
+            print(f"--- 日志: ❌ 提交文生图任务失败。状态码: {rsp.status_code}, 错误码: {rsp.code}, 消息: {rsp.message} ---")
+            return None
+        task_id = rsp.output.task_id
+
+        deadline = time.monotonic() + task_timeout
+        while time.monotonic() < deadline:
+            await asyncio.sleep(poll_interval)
+            rsp = await fetch_image_synthesis_task_async(task_id)
+            if rsp.status_code != HTTPStatus.OK or not rsp.output:
+                continue
+            if rsp.output.task_status == "SUCCEEDED":
+                if rsp.output.results:
+                    image_url = rsp.output.results[0].url
+                    print(f"--- 日志: 文生图成功，获取到图片URL: {image_url} ---")
+                    return image_url
+                print(f"--- 日志: ❌ 文生图任务 {task_id} 完成但未返回图片结果。---")
+                return None
+            if rsp.output.task_status in ("FAILED", "CANCELED", "UNKNOWN"):
+                print(f"--- 日志: ❌ 文生图任务 {task_id} 失败，状态: {rsp.output.task_status} ---")
+                return None
+        print(f"--- 日志: ❌ 文生图任务 {task_id} 等待超时。---")
+        return None
+    except Exception as e:
+        error_msg = f"❌ 调用文生图模型时出错: {e}"
+        if status_callback:
+            status_callback.update(label=error_msg, state="error")
+        print(f"--- 日志: ❌ 调用文生图模型异常。{error_msg} ---")
+        return None
+
+# --- 辅助函数：_generate_image_element 的 asyncio 版本 ---
+async def _generate_image_element_async(
+    paragraph_for_image_prompt: str,
+    image_model: str,
+    http_session=None,
+    use_image_cache: bool = True,
+    use_prompt_cache: bool = True,
+    image_prompt: Optional[str] = None,
+    image_output_mode: str = "inline",
+    image_transcode: Optional[dict] = None
+) -> dict:
+    image_url = None
+    image_data = (None, None, None)
+    try:
+        if not image_prompt:
+            image_prompt = await generate_image_prompt_from_paragraph_async(paragraph_for_image_prompt, use_prompt_cache=use_prompt_cache)
+        cached_element = await asyncio.to_thread(_cached_image_element, paragraph_for_image_prompt, image_prompt, image_model, image_output_mode, image_transcode
+        ) if use_image_cache else None
+        if cached_element:
+            return cached_element
+        image_url = await generate_image_from_prompt_async(image_prompt, image_model)
+        if image_url:
+            image_data = await _download_image_data_async(
+                image_url, image_prompt, image_model, use_image_cache=use_image_cache,
+                image_output_mode=image_output_mode, http_session=http_session, image_transcode=image_transcode
+            )
+    except Exception as e:
+        print(f"--- 日志: ❌ 为段落 '{paragraph_for_image_prompt[:30]}...' 生成图片时出现异常: {e} ---")
+    return _make_image_element(paragraph_for_image_prompt, image_prompt or "", image_url, *image_data)
+
+# --- 主要处理函数：process_article_and_generate_images 的 asyncio 版本 ---
+async def process_article_and_generate_images_async(
+    article_content: str,
+    enable_image_generation: bool = True,
+    image_model: str = "wanx-v1",
+    status_callback=None,
+    http_session=None,
+    use_image_cache: bool = True,
+    use_prompt_cache: bool = True,
+    batch_image_prompts: bool = True,
+    image_output_mode: str = "inline",
+    image_transcode: Optional[dict] = None
+) -> List[dict]:
+    """
+    所有图片位置以协程方式同时生成（并发度由 rate_limiter 的配额约束），最终按文档顺序组装。
+    
+    Args:
+        article_content (str): 待处理的文章内容。
+        enable_image_generation (bool): 是否启用文生图功能。
+        image_model (str): 文生图模型名称。
+        status_callback (streamlit.status): 用于在Streamlit UI中更新状态。
+        http_session (aiohttp.ClientSession): 可选的共享下载会话。
+        use_image_cache (bool): 是否复用之前为相同提示词和模型生成过的图片。
+        use_prompt_cache (bool): 是否复用之前为相同段落生成过的图片提示词。
+        batch_image_prompts (bool): 是否一次请求生成整篇文章的图片提示词。
+        image_output_mode (str): 图片输出方式，"inline"（Base64 内嵌）或 "external"（引用图片文件）。
+        image_transcode (dict): 图片后处理参数，与 process_article_and_generate_images 相同。
+        
+    Returns:
+        List[dict]: 包含处理后的段落和图片信息的列表。
+    """
+    print(f"--- 日志: 开始按 <IMAGE> 标记处理文章以插入图片 (async)。---")
+    image_output_mode = resolve_image_output_mode(image_output_mode)
+    image_transcode = resolve_transcode_options(image_transcode)
+    processed_elements, image_slots = _split_article_into_slots(article_content, enable_image_generation)
+
+    known_prompts = {}
+    if batch_image_prompts and len(image_slots) > 1:
+        batched_prompts = await generate_image_prompts_for_paragraphs_async([p for _, p in image_slots], use_prompt_cache=use_prompt_cache)
+        known_prompts = {element_index: prompt for (element_index, _), prompt in zip(image_slots, batched_prompts) if prompt}
+
+    async def _run_slot(element_index: int, paragraph: str):
+        return element_index, await _generate_image_element_async(paragraph, image_model, http_session=http_session,
+                                                              use_image_cache=use_image_cache, use_prompt_cache=use_prompt_cache,
+                                                              image_prompt=known_prompts.get(element_index),
+                                                              image_output_mode=image_output_mode, image_transcode=image_transcode)
+
+    for next_done in asyncio.as_completed([_run_slot(i, p) for i, p in image_slots]):
+        element_index, image_element = await next_done
+        processed_elements[element_index] = image_element
+        _report_image_element(image_element, status_callback)
+
+    print(f"--- 日志: 文章图片处理完成 (async)。共 {len(processed_elements)} 个元素。插入图片总数: {len(image_slots)}。---")
+    return processed_elements